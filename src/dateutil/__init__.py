@@ -6,8 +6,8 @@ try:
 except ImportError:
     __version__ = 'unknown'
 
-__all__ = ['easter', 'parser', 'relativedelta', 'rrule', 'tz',
-           'utils', 'zoneinfo']
+__all__ = ['businesscalendar', 'easter', 'parser', 'relativedelta', 'rrule',
+           'rrulerunner', 'rrulestore', 'tz', 'utils', 'zoneinfo']
 
 def __getattr__(name):
     import importlib
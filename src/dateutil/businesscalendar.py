@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+"""
+The businesscalendar module offers a calendar of business days, whose
+holidays may be given by the recurrence rules of the :mod:`dateutil.rrule`
+module.
+"""
+import array
+import calendar
+import datetime
+
+from six.moves import range
+
+from . import easter
+from .rrule import rrulebase
+
+__all__ = ["businesscalendar"]
+
+
+class businesscalendar(object):
+    """
+    Calendar of business days, i.e. the days of some weekdays which aren't
+    holidays, counting and adding them a year at a time.
+
+    The business days of each year are computed the first time the year is
+    used, as a table of the days and of the number of business days before
+    each of them. Adding business days then goes through the years they
+    span rather than through the days.
+
+    :param weekdays:
+        The weekdays (as :class:`~dateutil.rrule.weekday` instances or
+        integers) of the business days, Monday to Friday by default.
+
+    :param holidays:
+        Holidays, as naive :class:`~dateutil.rrule.rrule` or
+        :class:`~dateutil.rrule.rruleset` instances generating them, or as
+        dates or datetimes.
+
+    :param easter:
+        Offsets in days from Easter Sunday of yearly holidays. For instance,
+        ``(-2, 1)`` for Good Friday and Easter Monday.
+
+    :param eastermethod:
+        The method computing Easter Sunday, as in :func:`dateutil.easter`.
+    """
+    def __init__(self, weekdays=(0, 1, 2, 3, 4), holidays=(), easter=(),
+                 eastermethod=3):
+        self._weekdays = frozenset(getattr(wday, 'weekday', wday)
+                                   for wday in weekdays)
+        if not self._weekdays:
+            raise ValueError("A business calendar needs business weekdays")
+
+        self._rules = []
+        self._dates = {}
+        for holiday in holidays:
+            if isinstance(holiday, rrulebase):
+                self._rules.append(holiday)
+            else:
+                self._dates.setdefault(holiday.year, []).append(
+                    holiday.toordinal())
+
+        self._easter = tuple(easter)
+        self._eastermethod = eastermethod
+        self._years = {}
+
+    def _year(self, year):
+        """
+        Returns the business days of ``year``, as a tuple of the ordinal of
+        January 1st, of an array of the number of business days before each
+        day of the year and after the last one, and of an array of the days
+        of the year which are business days.
+        """
+        info = self._years.get(year)
+        if info is not None:
+            return info
+
+        first = datetime.date(year, 1, 1).toordinal()
+        ndays = 365 + calendar.isleap(year)
+        mask = bytearray(ndays)
+        wday = (first - 1) % 7
+        for i in range(ndays):
+            mask[i] = (wday + i) % 7 in self._weekdays
+
+        holidays = list(self._dates.get(year, ()))
+        if self._easter:
+            sunday = easter.easter(year, self._eastermethod).toordinal()
+            holidays.extend(sunday + offset for offset in self._easter)
+        for rule in self._rules:
+            for dt in rule.xafter(datetime.datetime(year, 1, 1), inc=True):
+                if dt.year != year:
+                    break
+                holidays.append(dt.toordinal())
+
+        for ordinal in holidays:
+            if 0 <= ordinal - first < ndays:
+                mask[ordinal - first] = 0
+
+        before = array.array('i', [0] * (ndays + 1))
+        days = array.array('i')
+        for i in range(ndays):
+            if mask[i]:
+                days.append(i)
+            before[i + 1] = len(days)
+
+        info = self._years[year] = (first, before, days)
+        return info
+
+    def is_business_day(self, dt):
+        """
+        Tells whether the day of a date or datetime is a business day.
+        """
+        first, before, days = self._year(dt.year)
+        i = dt.toordinal() - first
+        return before[i + 1] > before[i]
+
+    def _nth(self, year, n):
+        """
+        Returns the ordinal of the business day at the position ``n`` from
+        the first business day of ``year``, which may be negative or after
+        the end of the year.
+        """
+        while True:
+            first, before, days = self._year(year)
+            if not days:
+                raise ValueError("The business calendar has no business "
+                                 "day in %d" % year)
+            if n < 0:
+                year -= 1
+                n += len(self._year(year)[2])
+            elif n >= len(days):
+                n -= len(days)
+                year += 1
+            else:
+                return first + days[n]
+
+    def _shift(self, dt, ordinal):
+        """
+        Returns ``dt`` moved to the day ``ordinal``, keeping its type and
+        time of the day.
+        """
+        return dt + datetime.timedelta(days=ordinal - dt.toordinal())
+
+    def add_business_days(self, dt, n):
+        """
+        Returns the ``n``-th business day after a date or datetime, or
+        before it if ``n`` is negative. Datetimes keep their time of the
+        day.
+
+        :param dt:
+            The date or datetime from which the business days are counted.
+            It needn't be a business day itself.
+
+        :param n:
+            The number of business days added. If it is 0, ``dt`` is rolled
+            forward to a business day.
+        """
+        if n == 0:
+            return self.roll_forward(dt)
+
+        first, before, days = self._year(dt.year)
+        i = dt.toordinal() - first
+        if n > 0:
+            return self._shift(dt, self._nth(dt.year, before[i + 1] + n - 1))
+        return self._shift(dt, self._nth(dt.year, before[i] + n))
+
+    def business_days_between(self, start, end):
+        """
+        Returns the number of business days from ``start`` included to
+        ``end`` excluded, or minus the number of business days from ``end``
+        to ``start`` if ``end`` is before ``start``.
+        """
+        if end < start:
+            return -self.business_days_between(end, start)
+
+        first, before, days = self._year(start.year)
+        count = -before[start.toordinal() - first]
+        for year in range(start.year, end.year):
+            count += len(self._year(year)[2])
+        first, before, days = self._year(end.year)
+        return count + before[end.toordinal() - first]
+
+    def roll_forward(self, dt):
+        """
+        Returns a date or datetime if it is on a business day, and otherwise
+        the next business day.
+        """
+        first, before, days = self._year(dt.year)
+        i = dt.toordinal() - first
+        return self._shift(dt, self._nth(dt.year, before[i]))
+
+    def roll_backward(self, dt):
+        """
+        Returns a date or datetime if it is on a business day, and otherwise
+        the previous business day.
+        """
+        first, before, days = self._year(dt.year)
+        i = dt.toordinal() - first
+        return self._shift(dt, self._nth(dt.year, before[i + 1] - 1))
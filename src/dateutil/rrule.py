@@ -5,17 +5,21 @@ the recurrence rules documented in the
 `iCalendar RFC <https://tools.ietf.org/html/rfc5545>`_,
 including support for caching of results.
 """
+import array
+import bisect
 import calendar
 import datetime
 import heapq
 import itertools
+import operator
 import re
 import sys
+from collections import OrderedDict, namedtuple
 from functools import wraps
 # For warning about deprecation of until and count
 from warnings import warn
 
-from six import advance_iterator, integer_types
+from six import PY2, advance_iterator, integer_types
 
 from six.moves import _thread, range
 
@@ -27,6 +31,8 @@ except ImportError:
     from fractions import gcd
 
 __all__ = ["rrule", "rruleset", "rrulestr",
+           "rrulecursor", "expand_many", "expand_split", "rrulequeue",
+           "rruleintervals", "union", "intersection",
            "YEARLY", "MONTHLY", "WEEKLY", "DAILY",
            "HOURLY", "MINUTELY", "SECONDLY",
            "MO", "TU", "WE", "TH", "FR", "SA", "SU"]
@@ -58,9 +64,24 @@ FREQNAMES = ['YEARLY', 'MONTHLY', 'WEEKLY', 'DAILY', 'HOURLY', 'MINUTELY', 'SECO
  MINUTELY,
  SECONDLY) = list(range(7))
 
+# Wall time margin kept when seeking, larger than any UTC offset change.
+_SEEK_MARGIN = datetime.timedelta(days=2)
+
+# Approximate length of a period of each frequency, used to size the windows
+# searched by rrulebase.before().
+_FREQ_SPAN = (datetime.timedelta(days=366), datetime.timedelta(days=31),
+              datetime.timedelta(days=7), datetime.timedelta(days=1),
+              datetime.timedelta(hours=1), datetime.timedelta(minutes=1),
+              datetime.timedelta(seconds=1))
+
 # Imported on demand.
 easter = None
 parser = None
+numpy = None
+futures = None
+
+# Ordinal of the NumPy datetime64 epoch
+_EPOCH_ORDINAL = datetime.date(1970, 1, 1).toordinal()
 
 
 class weekday(weekdaybase):
@@ -91,7 +112,169 @@ def _invalidates_cache(f):
     return inner_func
 
 
+_CacheInfo = namedtuple("_CacheInfo", ["hits", "misses", "maxsize",
+                                       "currsize"])
+
+
+class _LRUCache(object):
+    """
+    Thread-safe, bounded cache of immutable values, evicting the least
+    recently used ones.
+    """
+    def __init__(self, maxsize):
+        self._maxsize = maxsize
+        self._cache = OrderedDict()
+        self._lock = _thread.allocate_lock()
+        self._hits = 0
+        self._misses = 0
+
+    def get(self, key, build):
+        """
+        Returns the value cached for ``key``, calling ``build()`` to compute
+        it if it isn't cached.
+        """
+        with self._lock:
+            value = self._cache.pop(key, None)
+            if value is not None:
+                self._cache[key] = value
+                self._hits += 1
+                return value
+            self._misses += 1
+
+        value = build()
+        with self._lock:
+            self._cache[key] = value
+            while len(self._cache) > self._maxsize:
+                self._cache.popitem(last=False)
+        return value
+
+    def cache_info(self):
+        """
+        Returns the number of hits and misses, the maximum size and the
+        current size of the cache.
+        """
+        with self._lock:
+            return _CacheInfo(self._hits, self._misses, self._maxsize,
+                              len(self._cache))
+
+    def cache_clear(self):
+        with self._lock:
+            self._cache.clear()
+            self._hits = self._misses = 0
+
+    def set_cache_size(self, size):
+        with self._lock:
+            self._maxsize = size
+            while len(self._cache) > size:
+                self._cache.popitem(last=False)
+
+
+# Masks of the weeks, n-th weekdays and easter days of the years, shared by
+# the rules with the same parameters. See rrule.mask_cache_info().
+_MASK_CACHE = _LRUCache(1024)
+
+# Immutable sequence of bytes, whose items are integers as in a bytearray
+_frozenbytes = tuple if PY2 else bytes
+
+
+def _cyclekey(year):
+    """
+    Returns what the day masks of ``year`` depend on, Easter aside: the
+    weekday of its first day and which of the years around it are leap
+    years. It is the same every 400 years in the Gregorian calendar.
+    """
+    return (datetime.date(year, 1, 1).weekday(), calendar.isleap(year - 1),
+            calendar.isleap(year), calendar.isleap(year + 1))
+
+
+def _timestamp(dt):
+    """
+    Returns the microseconds of the naive wall time (or of the UTC time if
+    aware) ``dt`` since the epoch.
+    """
+    if dt.tzinfo is not None:
+        offset = dt.utcoffset()
+        if offset is not None:
+            dt = dt.replace(tzinfo=None) - offset
+    dt = dt.replace(tzinfo=None)
+    return (((dt.toordinal() - _EPOCH_ORDINAL) * 86400 +
+             dt.hour * 3600 + dt.minute * 60 + dt.second) * 1000000 +
+            dt.microsecond)
+
+
+def _utc_timestamps(walls, tzinfo):
+    """
+    Generator converting the naive wall times ``walls`` in ``tzinfo`` (in
+    microseconds since the epoch) to UTC times, looking the UTC offsets up
+    once per day unless they change during the day.
+    """
+    epoch = datetime.datetime(1970, 1, 1, tzinfo=tzinfo)
+
+    def utcoffset(wall):
+        offset = (epoch + datetime.timedelta(microseconds=wall)).utcoffset()
+        if offset is None:
+            return 0
+        return ((offset.days * 86400 + offset.seconds) * 1000000 +
+                offset.microseconds)
+
+    day = offset = None
+    for wall in walls:
+        if wall // 86400000000 != day:
+            day = wall // 86400000000
+            offset = utcoffset(day * 86400000000)
+            try:
+                if offset != utcoffset((day + 1) * 86400000000):
+                    offset = None
+            except OverflowError:
+                offset = None
+        yield wall - (utcoffset(wall) if offset is None else offset)
+
+
+def _numpy_offsets(walls, tzinfo):
+    """
+    Returns the UTC offsets in ``tzinfo`` of the naive wall times ``walls``
+    (in seconds since the NumPy epoch), as an array of seconds.
+    """
+    epoch = datetime.datetime(1970, 1, 1)
+
+    def utcoffset(seconds):
+        dt = epoch + datetime.timedelta(seconds=int(seconds))
+        offset = dt.replace(tzinfo=tzinfo).utcoffset()
+        return offset.days * 86400 + offset.seconds
+
+    # The offsets are looked up at the midnights starting and ending the
+    # days, and for each time on the days they change.
+    days, index = numpy.unique(walls // 86400, return_inverse=True)
+    midnights = numpy.union1d(days, days + 1)
+    midnight = numpy.array([utcoffset(day * 86400) for day in midnights],
+                           dtype='int64')
+    first = midnight[numpy.searchsorted(midnights, days)]
+    last = midnight[numpy.searchsorted(midnights, days + 1)]
+    offsets = first[index]
+    for i in numpy.nonzero((first != last)[index])[0]:
+        offsets[i] = utcoffset(walls[i])
+    return offsets
+
+
+def _numpy_result(values, offsets=None):
+    """
+    Returns the result of :meth:`rrulebase.to_numpy` from an array of
+    microseconds since the NumPy epoch and an array of offsets in seconds.
+    """
+    values = values.astype('datetime64[us]')
+    if offsets is None:
+        return values
+    return values, offsets.astype('timedelta64[s]')
+
+
 class rrulebase(object):
+    # Initial size of the windows searched by before(), if _seek is supported
+    _seekspan = None
+    # Bounded cache of the recurrences, see rrule
+    _window = None
+    # Last possible recurrence, see rrule
+    _until = None
+
     def __init__(self, cache=False):
         if cache:
             self._cache = []
@@ -102,8 +285,29 @@ class rrulebase(object):
             self._cache_complete = False
             self._len = None
 
+    def __getstate__(self):
+        # Locks and generators can't be pickled, the caches are emptied.
+        state = self.__dict__.copy()
+        state.pop("_cache_lock", None)
+        state.pop("_cache_gen", None)
+        if self._cache is not None:
+            state["_cache"] = []
+        if self._window is not None:
+            state["_window"] = self._window.maxsize
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if self._cache is not None:
+            self._cache_lock = _thread.allocate_lock()
+            self._invalidate_cache()
+        if self._window is not None:
+            self._window = _windowcache(self, self._window)
+
     def __iter__(self):
-        if self._cache_complete:
+        if self._window is not None:
+            return self._window.iter()
+        elif self._cache_complete:
             return iter(self._cache)
         elif self._cache is None:
             return self._iter()
@@ -112,7 +316,7 @@ class rrulebase(object):
 
     def _invalidate_cache(self):
         if self._cache is not None:
-            self._cache = []
+            self._cache = self._newcache()
             self._cache_complete = False
             self._cache_gen = self._iter()
 
@@ -121,8 +325,13 @@ class rrulebase(object):
 
         self._len = None
 
-    def _iter_cached(self):
-        i = 0
+    def _newcache(self):
+        """
+        Returns an empty sequence to cache the recurrences in.
+        """
+        return []
+
+    def _iter_cached(self, i=0):
         gen = self._cache_gen
         cache = self._cache
         acquire = self._cache_lock.acquire
@@ -149,13 +358,26 @@ class rrulebase(object):
     def __getitem__(self, item):
         if self._cache_complete:
             return self._cache[item]
-        elif isinstance(item, slice):
-            if item.step and item.step < 0:
+
+        if isinstance(item, (slice,) + integer_types):
+            index = self._getindex()
+            if index is not None:
+                return index[item]
+
+        if (self._window is not None and
+                isinstance(item, integer_types) and item >= 0):
+            return self._window.getitem(item)
+
+        if isinstance(item, slice):
+            if ((item.step and item.step < 0) or
+                    (item.start and item.start < 0) or
+                    (item.stop and item.stop < 0)):
                 return list(iter(self))[item]
             else:
                 return list(itertools.islice(self,
                                              item.start or 0,
-                                             item.stop or sys.maxsize,
+                                             sys.maxsize if item.stop is None
+                                             else item.stop,
                                              item.step or 1))
         elif item >= 0:
             gen = iter(self)
@@ -169,33 +391,119 @@ class rrulebase(object):
             return list(iter(self))[item]
 
     def __contains__(self, item):
-        if self._cache_complete:
-            return item in self._cache
-        else:
-            for i in self:
-                if i == item:
-                    return True
-                elif i > item:
+        gen = self
+        if self._cache is not None:
+            cache = self._cache
+            try:
+                i = self._cacheindex(item, True)
+            except TypeError:
+                # Not comparable with the recurrences
+                if self._cache_complete:
+                    return item in cache
+            else:
+                if i < len(cache):
+                    return cache[i] == item
+                elif self._cache_complete:
                     return False
+                gen = self._iter_cached(i)
+
+        for i in gen:
+            if i == item:
+                return True
+            elif i > item:
+                return False
         return False
 
-    # __len__() introduces a large performance penalty.
+    # __len__() introduces a large performance penalty, unless the number of
+    # recurrences can be computed without generating them (see rrule).
     def count(self):
         """ Returns the number of recurrences in this set. It will have go
-            through the whole recurrence, if this hasn't been done before. """
+            through the whole recurrence, if this hasn't been done before and
+            the number can't be computed otherwise. """
         if self._len is None:
-            for x in self:
-                pass
+            length = self._getcount()
+            if length is None:
+                for x in self:
+                    pass
+            else:
+                self._len = length
         return self._len
 
+    def _getcount(self):
+        """
+        Returns the number of recurrences computed without generating all of
+        them, or ``None`` if they must be iterated.
+        """
+        return None
+
+    def _getindex(self):
+        """
+        Returns an object computing the recurrences from their position
+        without iterating, or ``None`` if they must be iterated.
+        """
+        return None
+
+    def _seek(self, dt):
+        """
+        Returns an iterator over the recurrences that skips some (but not
+        necessarily all) of the recurrences before ``dt``, or ``None`` if the
+        recurrence can only be generated from its start.
+        """
+        return None
+
     def before(self, dt, inc=False):
         """ Returns the last recurrence before the given datetime instance. The
             inc keyword defines what happens if dt is an occurrence. With
             inc=True, if dt itself is an occurrence, it will be returned. """
-        if self._cache_complete:
-            gen = self._cache
-        else:
-            gen = self
+        if self._cache is not None:
+            # The first cached recurrence which isn't before dt
+            cache = self._cache
+            i = self._cacheindex(dt, not inc)
+            if i < len(cache) or self._cache_complete:
+                return cache[i - 1] if i else None
+
+            last = self._before(self._iter_cached(i), dt, inc)
+            if last is None and i:
+                last = cache[i - 1]
+            return last
+
+        k = self._window and self._window.key(dt)
+        if k is not None:
+            # Look for the recurrence from cache segments which get twice
+            # as far from dt each time, until the first one is reached.
+            step = 1
+            while True:
+                last = self._before(self._window.iter(k), dt, inc)
+                if last is not None or k == 0:
+                    return last
+                k = max(k - step, 0)
+                step *= 2
+
+        span = self._seekspan
+        if span is not None and self._until is not None and dt > self._until:
+            # The windows after UNTIL have no recurrence.
+            dt, inc = self._until, True
+
+        # Look for the recurrence in windows ending at dt which double in size
+        # until one contains a recurrence, or until the start is reached.
+        while span is not None:
+            try:
+                gen = self._seek(dt - span)
+            except OverflowError:
+                gen = None
+
+            if gen is None:
+                break
+
+            last = self._before(gen, dt, inc)
+            if last is not None:
+                return last
+
+            span *= 2
+
+        return self._before(self, dt, inc)
+
+    def _before(self, gen, dt, inc):
         last = None
         if inc:
             for i in gen:
@@ -209,14 +517,73 @@ class rrulebase(object):
                 last = i
         return last
 
+    def cursor(self, after=None):
+        """
+        Returns a :class:`rrulecursor` over the recurrences, which may be
+        pickled to resume the iteration later.
+
+        :param after:
+            If given, the cursor starts with the first recurrence after this
+            datetime.
+        """
+        return rrulecursor(self, after)
+
+    def _resume(self, last, index=None, inc=False):
+        """
+        Returns an iterator over the recurrences after ``last`` (or at
+        ``last`` if ``inc`` is ``True``), or over all of them if it is
+        ``None``. ``index`` is the number of recurrences before them, if it
+        is known.
+        """
+        if last is None:
+            return iter(self)
+        return self.xafter(last, inc=inc)
+
+    def iter_before(self, dt, inc=False):
+        """
+        Generator which yields the recurrences before the given datetime
+        instance in reverse order, from the latest one to the first one.
+
+        :param dt:
+            The datetime before which recurrences are generated.
+
+        :param inc:
+            If `dt` is an instance of the rule and `inc` is `True`, it is
+            included in the output.
+
+        :yields: Yields a sequence of `datetime` objects.
+        """
+        return self._iter_before(dt, inc)
+
+    def _iter_before(self, dt, inc):
+        """
+        Implements :meth:`iter_before` by generating the recurrences from the
+        start, unless they are all cached.
+        """
+        if self._cache_complete:
+            cache = self._cache
+            i = self._cacheindex(dt, not inc)
+            return (cache[j] for j in range(i - 1, -1, -1))
+
+        if inc:
+            recurrences = itertools.takewhile(lambda x: x <= dt, self)
+        else:
+            recurrences = itertools.takewhile(lambda x: x < dt, self)
+        return reversed(list(recurrences))
+
     def after(self, dt, inc=False):
         """ Returns the first recurrence after the given datetime instance. The
             inc keyword defines what happens if dt is an occurrence. With
             inc=True, if dt itself is an occurrence, it will be returned.  """
-        if self._cache_complete:
-            gen = self._cache
+        if self._cache is not None:
+            i = self._cacheindex(dt, inc)
+            if i < len(self._cache):
+                return self._cache[i]
+            elif self._cache_complete:
+                return None
+            gen = self._iter_cached(i)
         else:
-            gen = self
+            gen = self._windowiter(dt) or self._seek(dt) or self
         if inc:
             for i in gen:
                 if i >= dt:
@@ -227,6 +594,30 @@ class rrulebase(object):
                     return i
         return None
 
+    def _windowiter(self, dt):
+        """
+        Returns an iterator over the recurrences from the cache segment of
+        ``dt``, or ``None`` if there is no bounded cache or ``dt`` can't be
+        looked up in it.
+        """
+        k = self._window and self._window.key(dt)
+        if k is None:
+            return None
+        return self._window.iter(k)
+
+    def _cacheindex(self, dt, inc):
+        """
+        Returns the position in the (sorted) cache of the first recurrence
+        after ``dt``, or at ``dt`` if ``inc`` is ``True``.
+        """
+        cache = self._cache
+        if isinstance(cache, _datetimearray):
+            return cache.bisect(dt, right=not inc)
+        elif inc:
+            return bisect.bisect_left(cache, dt)
+        else:
+            return bisect.bisect_right(cache, dt)
+
     def xafter(self, dt, count=None, inc=False):
         """
         Generator which yields up to `count` recurrences after the given
@@ -247,9 +638,12 @@ class rrulebase(object):
         """
 
         if self._cache_complete:
-            gen = self._cache
+            gen = itertools.islice(self._cache, self._cacheindex(dt, inc),
+                                   None)
+        elif self._cache is not None:
+            gen = self._iter_cached(self._cacheindex(dt, inc))
         else:
-            gen = self
+            gen = self._windowiter(dt) or self._seek(dt) or self
 
         # Select the comparison function
         if inc:
@@ -273,10 +667,15 @@ class rrulebase(object):
         The inc keyword defines what happens if after and/or before are
         themselves occurrences. With inc=True, they will be included in the
         list, if they are found in the recurrence set. """
-        if self._cache_complete:
-            gen = self._cache
+        if self._cache is not None:
+            cache = self._cache
+            i = self._cacheindex(after, inc)
+            j = self._cacheindex(before, not inc)
+            if j < len(cache) or self._cache_complete:
+                return cache[i:j]
+            gen = self._iter_cached(i)
         else:
-            gen = self
+            gen = self._windowiter(after) or self._seek(after) or self
         started = False
         l = []
         if inc:
@@ -301,6 +700,111 @@ class rrulebase(object):
                     l.append(i)
         return l
 
+    def to_numpy(self, after=None, before=None, inc=False):
+        """
+        Returns the recurrences as a NumPy array, without creating a
+        :class:`datetime.datetime` for each of them where possible. NumPy
+        must be installed.
+
+        :param after:
+            If given, only the recurrences after this datetime are returned.
+
+        :param before:
+            If given, only the recurrences before this datetime are returned.
+
+        :param inc:
+            If `True`, `after` and `before` are included in the output if they
+            are recurrences, as with :meth:`between`.
+
+        :return:
+            For naive recurrences, a ``datetime64[us]`` array of their values.
+            For aware recurrences, a tuple of a ``datetime64[us]`` array of
+            their UTC values and a ``timedelta64[s]`` array of their UTC
+            offsets.
+        """
+        global numpy
+        if not numpy:
+            import numpy
+
+        return self._to_numpy(after, before, inc)
+
+    def _to_numpy(self, after, before, inc, aware=None):
+        """
+        Implements :meth:`to_numpy` by generating the recurrences. ``aware``
+        tells whether they are aware, if it is known without generating them.
+        """
+        gen = self if after is None else self.xafter(after, inc=inc)
+        dts = []
+        for dt in gen:
+            if before is not None and (dt > before or
+                                       (not inc and dt == before)):
+                break
+            dts.append(dt)
+
+        if aware is None:
+            aware = bool(dts) and dts[0].tzinfo is not None
+
+        values = numpy.array([_timestamp(dt) for dt in dts],
+                             dtype='int64')
+        if not aware:
+            return _numpy_result(values)
+
+        offsets = [dt.utcoffset() for dt in dts]
+        offsets = numpy.array([offset.days * 86400 + offset.seconds
+                               for offset in offsets], dtype='int64')
+        return _numpy_result(values, offsets)
+
+    def iter_timestamps(self):
+        """
+        Generator which yields the recurrences as integers, without creating
+        a :class:`datetime.datetime` for each of them where possible.
+
+        :yields:
+            The microseconds since the epoch of the UTC times of aware
+            recurrences, or of the wall times of naive recurrences.
+        """
+        return self._iter_timestamps()
+
+    def between_timestamps(self, after, before, inc=False):
+        """
+        Returns the recurrences between two datetimes as integers, like
+        :meth:`iter_timestamps`. The timestamps are compared with those of
+        `after` and `before`.
+
+        :param after:
+            The datetime after which recurrences are returned.
+
+        :param before:
+            The datetime before which recurrences are returned.
+
+        :param inc:
+            If `True`, `after` and `before` are included in the output if they
+            are recurrences, as with :meth:`between`.
+
+        :return:
+            A list of integers.
+        """
+        first, last = _timestamp(after), _timestamp(before)
+        result = []
+        for value in self._iter_timestamps(after):
+            if value > last or (not inc and value == last):
+                break
+            elif value > first or (inc and value == first):
+                result.append(value)
+        return result
+
+    def _iter_timestamps(self, after=None):
+        """
+        Implements :meth:`iter_timestamps`, possibly skipping some of the
+        recurrences before ``after``.
+        """
+        if after is None:
+            gen = self
+        else:
+            gen = self._windowiter(after) or self._seek(after) or self
+        for dt in gen:
+            yield _timestamp(dt)
+
 
 class rrule(rrulebase):
     """
@@ -424,14 +928,27 @@ class rrule(rrulebase):
         If given, it must be a boolean value specifying to enable or disable
         caching of results. If you will use the same rrule instance multiple
         times, enabling caching will improve the performance considerably.
+        The recurrences are cached as 8-byte integers, and the datetime
+        instances are created again each time they are returned.
+    :param cachesize:
+        If given with ``cache``, it must be a positive integer. The
+        recurrences are then cached in segments of consecutive periods, and
+        the least recently used segments are dropped once more than this
+        number of recurrences is kept. This bounds the memory used by
+        infinite rules, while queries on the same windows of time stay fast.
      """
     def __init__(self, freq, dtstart=None,
                  interval=1, wkst=None, count=None, until=None, bysetpos=None,
                  bymonth=None, bymonthday=None, byyearday=None, byeaster=None,
                  byweekno=None, byweekday=None,
                  byhour=None, byminute=None, bysecond=None,
-                 cache=False):
-        super(rrule, self).__init__(cache)
+                 cache=False, cachesize=None):
+        if cachesize is not None and cachesize <= 0:
+            raise ValueError("cachesize must be a positive integer")
+        window = bool(cache) and cachesize is not None
+        super(rrule, self).__init__(cache and not window)
+        if window:
+            self._window = _windowcache(self, cachesize)
         global easter
         if not dtstart:
             if until and until.tzinfo:
@@ -447,6 +964,10 @@ class rrule(rrulebase):
         self._freq = freq
         self._interval = interval
         self._count = count
+        self._seekspan = _FREQ_SPAN[freq] * interval
+        self._index = None
+        self._empty = None
+        self._cycle = None
 
         # Cache the original byxxx rules, if they are provided, as the _byxxx
         # attributes do not necessarily map to the inputs, and this can be
@@ -768,141 +1289,918 @@ class rrule(rrulebase):
                       "freq": self._freq,
                       "until": self._until,
                       "wkst": self._wkst,
-                      "cache": False if self._cache is None else True }
+                      "cache": (self._window is not None or
+                                self._cache is not None),
+                      "cachesize": (self._window.maxsize if self._window else
+                                    None)}
         new_kwargs.update(self._original_rule)
         new_kwargs.update(kwargs)
         return rrule(**new_kwargs)
 
-    def _iter(self):
-        year, month, day, hour, minute, second, weekday, yearday, _ = \
-            self._dtstart.timetuple()
+    @staticmethod
+    def mask_cache_info():
+        """
+        Returns the statistics of the cache of the year masks shared by all
+        the rules, as a named tuple of the number of ``hits`` and
+        ``misses``, the ``maxsize`` and the current size (``currsize``) of
+        the cache.
+        """
+        return _MASK_CACHE.cache_info()
 
-        # Some local variables to speed things up a bit
-        freq = self._freq
-        interval = self._interval
-        wkst = self._wkst
-        until = self._until
-        bymonth = self._bymonth
-        byweekno = self._byweekno
-        byyearday = self._byyearday
-        byweekday = self._byweekday
-        byeaster = self._byeaster
-        bymonthday = self._bymonthday
-        bynmonthday = self._bynmonthday
-        bysetpos = self._bysetpos
-        byhour = self._byhour
-        byminute = self._byminute
-        bysecond = self._bysecond
+    @staticmethod
+    def mask_cache_clear():
+        """
+        Empties the cache of the year masks and resets its statistics.
+        """
+        _MASK_CACHE.cache_clear()
 
-        ii = _iterinfo(self)
-        ii.rebuild(year, month)
+    @staticmethod
+    def set_mask_cache_size(size):
+        """
+        Sets the number of year masks kept in the cache, 1024 by default.
+        """
+        _MASK_CACHE.set_cache_size(size)
 
-        getdayset = {YEARLY: ii.ydayset,
-                     MONTHLY: ii.mdayset,
-                     WEEKLY: ii.wdayset,
-                     DAILY: ii.ddayset,
-                     HOURLY: ii.ddayset,
-                     MINUTELY: ii.ddayset,
-                     SECONDLY: ii.ddayset}[freq]
+    def is_empty(self):
+        """
+        Returns whether the rule is known to have no occurrences at all,
+        because of a ``count`` of 0, an ``until`` before ``dtstart`` or
+        BYXXX rules which no day satisfies, like
+        ``rrule(YEARLY, bymonth=2, bymonthday=30)``. Iterating over such
+        rules stops right away instead of searching up to
+        :data:`datetime.MAXYEAR`.
+
+        A rule whose matching days are never selected by its interval or
+        BYSETPOS, like every 4 years from 1901 on the 29th of February, is
+        not detected.
+        """
+        if self._empty is None:
+            self._empty = (self._count == 0 or
+                           (self._until is not None and
+                            self._until < self._dtstart) or
+                           not self._satisfiable())
+        return self._empty
+
+    def _satisfiable(self):
+        if (self._byeaster or
+                not (self._bymonthday or self._bynmonthday or
+                     self._byyearday or self._byweekno or self._bynweekday)):
+            # Every year has days in each month and of each weekday, and the
+            # Easter dates are not periodic enough to check them all.
+            return True
+
+        return bool(self._cycleyears())
+
+    def _cycleyears(self):
+        """
+        Returns the sorted positions in the 400-year Gregorian cycle
+        (``year % 400``) of the years with days passing the BYXXX rules,
+        which must not include BYEASTER.
+        """
+        if self._cycle is None:
+            ii = _iterinfo(self)
+            matches = {}
+            cycle = []
+            for year in range(2000, 2400):
+                key = _cyclekey(year)
+                if key not in matches:
+                    ii.rebuild(year, 1)
+                    matches[key] = bool(ii.days)
+                if matches[key]:
+                    cycle.append(year % 400)
+            self._cycle = tuple(sorted(cycle))
+
+        return self._cycle
+
+    def _cycleperiod(self, year):
+        """
+        Returns the index of the first period starting in a year after
+        ``year`` which has days passing the BYXXX rules, skipping the other
+        years with :meth:`_cycleyears`, or ``None`` if there is none up to
+        :data:`datetime.MAXYEAR`. The rule must not have BYEASTER.
+        """
+        cycle = self._cycleyears()
+        if not cycle:
+            return None
 
-        if freq < HOURLY:
-            timeset = self._timeset
-        else:
-            gettimeset = {HOURLY: ii.htimeset,
-                          MINUTELY: ii.mtimeset,
-                          SECONDLY: ii.stimeset}[freq]
-            if ((freq >= HOURLY and
-                 self._byhour and hour not in self._byhour) or
-                (freq >= MINUTELY and
-                 self._byminute and minute not in self._byminute) or
-                (freq >= SECONDLY and
-                 self._bysecond and second not in self._bysecond)):
-                timeset = ()
+        year += 1
+        while True:
+            offset = year % 400
+            i = bisect.bisect_left(cycle, offset)
+            if i < len(cycle):
+                year += cycle[i] - offset
             else:
-                timeset = gettimeset(hour, minute, second)
+                year += 400 - offset + cycle[0]
+            if year > datetime.MAXYEAR:
+                return None
+
+            # The first period starting after the end of the previous year
+            units = self._periodunits(datetime.datetime(year - 1, 12, 31))
+            k = units // self._interval + 1
+            try:
+                start = self._periodstart(k)
+            except (OverflowError, ValueError):
+                return None
+
+            if start.year == year:
+                return k
+
+            # The interval skips the year, try the one of the next period
+            year = start.year
+
+    def _getindex(self):
+        if self._index is None:
+            pattern = self._regularpattern()
+            try:
+                self._index = pattern is not None and _indexinfo(self, pattern)
+            except (OverflowError, ValueError):
+                # The second period is out of range
+                self._index = False
+
+        return self._index or None
+
+    def _newcache(self):
+        # The recurrences all have the same tzinfo, store them compactly.
+        return _datetimearray()
+
+    def __len__(self):
+        return self.count()
+
+    def __bool__(self):
+        # Rules are true whatever their length, which may not be cheap
+        return True
+
+    __nonzero__ = __bool__
+
+    def _getcount(self):
+        index = self._getindex()
+        if index is not None:
+            return len(index)
+
+        # The occurrences of the partial periods at both ends are generated,
+        # those of the whole periods in between are counted.
+        freq = self._freq
+        dtstart = self._dtstart
+        try:
+            if freq <= DAILY:
+                start = self._periodstart(1)
+            else:
+                start = datetime.datetime.combine(
+                    dtstart.date() + datetime.timedelta(days=1),
+                    datetime.time())
+        except (OverflowError, ValueError):
+            return None
 
         total = 0
-        count = self._count
-        while True:
-            # Get dayset with the right frequency
-            dayset, start, end = getdayset(year, month, day)
-
-            # Do the "hard" work ;-)
-            filtered = False
-            for i in dayset[start:end]:
-                if ((bymonth and ii.mmask[i] not in bymonth) or
-                    (byweekno and not ii.wnomask[i]) or
-                    (byweekday and ii.wdaymask[i] not in byweekday) or
-                    (ii.nwdaymask and not ii.nwdaymask[i]) or
-                    (byeaster and not ii.eastermask[i]) or
-                    ((bymonthday or bynmonthday) and
-                     ii.mdaymask[i] not in bymonthday and
-                     ii.nmdaymask[i] not in bynmonthday) or
-                    (byyearday and
-                     ((i < ii.yearlen and i+1 not in byyearday and
-                       -ii.yearlen+i not in byyearday) or
-                      (i >= ii.yearlen and i+1-ii.yearlen not in byyearday and
-                       -ii.nextyearlen+i-ii.yearlen not in byyearday)))):
-                    dayset[i] = None
-                    filtered = True
+        for res in self._iter():
+            if res.replace(tzinfo=None) >= start:
+                break
+            total += 1
+        else:
+            # The rule ended in the first period
+            return total
 
-            # Output results
-            if bysetpos and timeset:
-                poslist = []
-                for pos in bysetpos:
-                    if pos < 0:
-                        daypos, timepos = divmod(pos, len(timeset))
-                    else:
-                        daypos, timepos = divmod(pos-1, len(timeset))
-                    try:
-                        i = [x for x in dayset[start:end]
-                             if x is not None][daypos]
-                        time = timeset[timepos]
-                    except IndexError:
-                        pass
-                    else:
-                        date = datetime.date.fromordinal(ii.yearordinal+i)
-                        res = datetime.datetime.combine(date, time)
-                        if res not in poslist:
-                            poslist.append(res)
-                poslist.sort()
-                for res in poslist:
-                    if until and res > until:
-                        self._len = total
-                        return
-                    elif res >= self._dtstart:
-                        if count is not None:
-                            count -= 1
-                            if count < 0:
-                                self._len = total
-                                return
-                        total += 1
-                        yield res
+        # Where the whole periods end
+        end = None
+        if self._until:
+            end = max(self._wallclock(self._until) - _SEEK_MARGIN, start)
+            if freq <= DAILY:
+                k = self._periodunits(end) // self._interval
+                end = max(self._periodstart(k), start)
             else:
-                for i in dayset[start:end]:
-                    if i is not None:
-                        date = datetime.date.fromordinal(ii.yearordinal + i)
-                        for time in timeset:
-                            res = datetime.datetime.combine(date, time)
-                            if until and res > until:
-                                self._len = total
-                                return
-                            elif res >= self._dtstart:
-                                if count is not None:
-                                    count -= 1
-                                    if count < 0:
-                                        self._len = total
-                                        return
+                end = datetime.datetime.combine(end.date(), datetime.time())
 
-                                total += 1
-                                yield res
+        count = self._count
+        total += _countinfo(self).count(
+            start, end, None if count is None else count - total)
 
-            # Handle frequency and interval
-            fixday = False
-            if freq == YEARLY:
-                year += interval
-                if year > datetime.MAXYEAR:
+        if end is not None and (count is None or total < count):
+            # The periods are aligned with the interval, so end is the start
+            # of a period.
+            units = self._periodunits(end)
+            k = -(-units // self._interval)
+            for res in self._iter(self._periodstate(k)):
+                total += 1
+
+        return total if count is None else min(total, count)
+
+    def _to_numpy(self, after, before, inc, aware=None):
+        tzinfo = self._tzinfo
+        if self._bysetpos:
+            # The positions are taken among the occurrences of each period
+            return super(rrule, self)._to_numpy(after, before, inc,
+                                                tzinfo is not None)
+
+        for bound in (after, before):
+            if (bound is not None and
+                    (bound.tzinfo is None) != (tzinfo is None)):
+                raise TypeError("can't compare offset-naive and "
+                                "offset-aware datetimes")
+
+        freq = self._freq
+        interval = self._interval
+        count = self._count
+        until = self._until
+        dtstart = self._dtstart.replace(tzinfo=None)
+        origin = self._periodstart(0)
+        originday = origin.toordinal()
+
+        # The years to generate, including the weekly periods starting in the
+        # previous year and the differences between wall and UTC times
+        first, last = origin.year, datetime.MAXYEAR
+        if after is not None and count is None:
+            first = max(first, after.year - 1)
+        for bound in (until, before):
+            if bound is not None:
+                last = min(last, bound.year + 1)
+        if self.is_empty():
+            last = first - 1
+
+        # Offsets of the occurrences in their day or, for frequencies higher
+        # than daily, in their period.
+        if freq < HOURLY:
+            times = [time.hour * 3600 + time.minute * 60 + time.second
+                     for time in self._timeset]
+        else:
+            hours = self._byhour or range(24)
+            minutes = seconds = (0,)
+            if freq >= MINUTELY:
+                minutes = self._byminute or range(60)
+            if freq == SECONDLY:
+                seconds = self._bysecond or range(60)
+            # Starts of the periods in the day whose times are valid
+            starts = numpy.array(sorted(hour * 3600 + minute * 60 + second
+                                        for hour in hours
+                                        for minute in minutes
+                                        for second in seconds),
+                                 dtype='int64')
+            step = _FREQ_SPAN[freq].seconds * interval
+            originsecond = _timestamp(origin) // 1000000
+            if 86400 % step == 0:
+                # The periods start at the same times every day
+                starts = starts[(starts - originsecond) % step == 0]
+
+            if freq == HOURLY:
+                times = [minute * 60 + second
+                         for minute in self._byminute
+                         for second in self._bysecond]
+            elif freq == MINUTELY:
+                times = list(self._bysecond)
+            else:
+                times = [0]
+        times = numpy.array(sorted(times), dtype='int64')
+
+        ii = _iterinfo(self)
+        startsecond = _timestamp(dtstart) // 1000000
+        chunks = []
+        total = 0
+        for year in range(first, last + 1):
+            if freq == YEARLY and (year - dtstart.year) % interval:
+                continue
+
+            ii.rebuild(year, 1)
+            length = ii.yearlen + 7 if freq == WEEKLY else ii.yearlen
+            valid = ii.arraymask(length)
+
+            # Keep the days of the periods selected by the interval
+            ordinals = ii.yearordinal + numpy.arange(length)
+            if freq == MONTHLY:
+                months = numpy.asarray(ii.mmask[:length])
+                valid &= ((year * 12 + months - dtstart.year * 12 -
+                           dtstart.month) % interval == 0)
+            elif freq == WEEKLY:
+                # Days of the next year in a week starting this year are
+                # included, those of a week starting last year are not.
+                weekdays = numpy.asarray(ii.wdaymask[:length])
+                weekstarts = (ordinals - ii.yearordinal -
+                              (weekdays - self._wkst) % 7)
+                valid &= (weekstarts >= 0) & (weekstarts < ii.yearlen)
+                valid &= (ordinals - originday) // 7 % interval == 0
+            elif freq == DAILY:
+                valid &= (ordinals - originday) % interval == 0
+
+            if freq < HOURLY:
+                days = (ordinals[valid] - _EPOCH_ORDINAL) * 86400
+                values = (days[:, None] + times).ravel()
+            else:
+                if 86400 % step == 0:
+                    days = (ordinals[valid] - _EPOCH_ORDINAL) * 86400
+                    periods = (days[:, None] + starts).ravel()
+                else:
+                    # Every period of the year, then the valid ones
+                    yearsecond = (ii.yearordinal - _EPOCH_ORDINAL) * 86400
+                    k = max(-(-(yearsecond - originsecond) // step), 0)
+                    kend = -(-(yearsecond + ii.yearlen * 86400 -
+                               originsecond) // step)
+                    periods = (originsecond +
+                               numpy.arange(k, kend, dtype='int64') * step)
+                    valid = valid[(periods - yearsecond) // 86400]
+                    valid &= numpy.isin(periods % 86400, starts)
+                    periods = periods[valid]
+                values = (periods[:, None] + times).ravel()
+
+            values = values[values >= startsecond]
+            chunks.append(values)
+            total += len(values)
+            if count is not None and total >= count:
+                break
+
+        values = numpy.concatenate(chunks or [numpy.empty(0, dtype='int64')])
+        if count is not None:
+            values = values[:count]
+
+        offsets = None
+        if tzinfo is not None:
+            # Compare the UTC times
+            offsets = _numpy_offsets(values, tzinfo)
+            values = values - offsets
+        values = values * 1000000
+
+        valid = numpy.ones(len(values), dtype=bool)
+        if until is not None:
+            valid &= values <= _timestamp(until)
+        if after is not None:
+            after = _timestamp(after)
+            valid &= (values >= after) if inc else (values > after)
+        if before is not None:
+            before = _timestamp(before)
+            valid &= (values <= before) if inc else (values < before)
+
+        return _numpy_result(values[valid],
+                             None if offsets is None else offsets[valid])
+
+    def _iter_timestamps(self, after=None):
+        tzinfo = self._tzinfo
+        start = None
+        if after is not None:
+            if (after.tzinfo is None) != (tzinfo is None):
+                raise TypeError("can't compare offset-naive and "
+                                "offset-aware datetimes")
+            if self._count is None:
+                start = self._seekstate(after)
+
+        walls = self._iter(start, timestamps=True)
+        if tzinfo is None:
+            return walls
+        return _utc_timestamps(walls, tzinfo)
+
+    def _regularpattern(self):
+        """
+        If every period but the first one yields the same occurrences, this
+        returns them as offsets from the period start: ``(month, day, hour,
+        minute, second)`` tuples for yearly rules, ``(day, hour, minute,
+        second)`` tuples for monthly rules and timedeltas otherwise. Returns
+        ``None`` for irregular rules.
+        """
+        freq = self._freq
+        if (self._byweekno or self._byyearday or self._byeaster or
+                self._bynweekday or self._bynmonthday):
+            return None
+
+        # Days of the period, valid in every period
+        if freq == YEARLY:
+            if (self._byweekday or not self._bymonthday or
+                    self._bymonthday[-1] > 28):
+                return None
+            days = [(month, day)
+                    for month in (self._bymonth or range(1, 13))
+                    for day in self._bymonthday]
+        elif freq == MONTHLY:
+            if (self._bymonth or self._byweekday or not self._bymonthday or
+                    self._bymonthday[-1] > 28):
+                return None
+            days = [(day,) for day in self._bymonthday]
+        elif freq == WEEKLY:
+            if self._bymonth or self._bymonthday or not self._byweekday:
+                return None
+            days = sorted((wday - self._wkst) % 7 for wday in self._byweekday)
+            days = [datetime.timedelta(days=day) for day in days]
+        else:
+            if self._bymonth or self._bymonthday or self._byweekday:
+                return None
+            days = [datetime.timedelta(0)]
+
+        # Times of the day, or of the hour and minute for higher frequencies
+        if freq < HOURLY:
+            times = [(time.hour, time.minute, time.second)
+                     for time in self._timeset]
+        elif freq == HOURLY and not self._byhour:
+            times = sorted((0, minute, second)
+                           for minute in self._byminute
+                           for second in self._bysecond)
+        elif freq == MINUTELY and not (self._byhour or self._byminute):
+            times = sorted((0, 0, second) for second in self._bysecond)
+        elif not (self._byhour or self._byminute or self._bysecond):
+            times = [(0, 0, 0)]
+        else:
+            return None
+
+        if freq < WEEKLY:
+            pattern = [day + time for day in days for time in times]
+        else:
+            pattern = [day + datetime.timedelta(hours=time[0],
+                                                minutes=time[1],
+                                                seconds=time[2])
+                       for day in days for time in times]
+
+        if self._bysetpos:
+            # Same selection as in _iter, which splits each position into a
+            # day and a time position.
+            poslist = set()
+            for pos in self._bysetpos:
+                if -len(pattern) <= pos <= len(pattern):
+                    poslist.add(pattern[pos - 1 if pos > 0 else pos])
+            pattern = sorted(poslist)
+
+        return pattern or None
+
+    def __contains__(self, item):
+        if (self._cache_complete or
+                not isinstance(item, datetime.datetime) or
+                (item.tzinfo is None) != (self._tzinfo is None)):
+            return super(rrule, self).__contains__(item)
+
+        for wall in self._wallcandidates(item):
+            if self._isoccurrence(wall):
+                if wall.replace(tzinfo=self._tzinfo) != item:
+                    continue
+
+                if self._count is not None:
+                    # Confirm that the occurrence is within COUNT
+                    return super(rrule, self).__contains__(item)
+
+                return True
+
+        return False
+
+    def _wallcandidates(self, item):
+        """
+        Returns the naive wall times of the occurrences which may be equal
+        to the datetime ``item``.
+        """
+        tzinfo = self._tzinfo
+        if tzinfo is None or item.tzinfo is tzinfo:
+            # Compared by wall time
+            return [item.replace(tzinfo=None)]
+
+        # Around UTC offset changes, the wall time corresponding to item may
+        # not be the one of an occurrence equal to it (e.g. occurrences on
+        # nonexistent times), so the neighbouring offsets are tried as well.
+        utc = (item - item.utcoffset()).replace(tzinfo=None)
+        candidates = []
+        for days in (0, -1, 1):
+            try:
+                offset = (item + datetime.timedelta(days=days)).astimezone(
+                    tzinfo).utcoffset()
+            except OverflowError:
+                continue
+
+            wall = utc + offset
+            if wall not in candidates:
+                candidates.append(wall)
+
+        return candidates
+
+    def _isoccurrence(self, dt):
+        """
+        Returns whether the naive wall time ``dt`` is an occurrence of the
+        rule, ignoring COUNT.
+        """
+        dtstart = self._dtstart.replace(tzinfo=None)
+        until = self._until
+        if (dt.microsecond or dt < dtstart or
+                (until and dt.replace(tzinfo=self._tzinfo) > until)):
+            return False
+
+        for value, byxxx in ((dt.hour, self._byhour),
+                             (dt.minute, self._byminute),
+                             (dt.second, self._bysecond)):
+            if byxxx and value not in byxxx:
+                return False
+
+        k, unit = divmod(self._periodunits(dt), self._interval)
+        if unit:
+            # Skipped by the interval
+            return False
+
+        # The day must pass the BYXXX rules as seen by the period it belongs
+        # to, which for weekly rules can start in the previous year.
+        freq = self._freq
+        if freq == WEEKLY:
+            year = max(self._periodstart(k), dtstart).year
+        else:
+            year = dt.year
+
+        ii = _iterinfo(self)
+        ii.rebuild(year, dt.month)
+        if ii.isfiltered(dt.toordinal() - ii.yearordinal):
+            return False
+
+        if self._bysetpos:
+            # The position in the period can only be known by generating it
+            gen = self._iter(self._periodstate(k)) if k else self._iter()
+            for res in gen:
+                res = res.replace(tzinfo=None)
+                if res >= dt:
+                    return res == dt
+
+            return False
+
+        return True
+
+    def _iter_before(self, dt, inc):
+        if (self._cache_complete or self.is_empty() or
+                self._wallclock(dt) is None):
+            return super(rrule, self)._iter_before(dt, inc)
+
+        if self._until is not None and dt > self._until:
+            dt, inc = self._until, True
+
+        rule = self
+        if self._count is not None:
+            # Generate the periods without counting the occurrences, from the
+            # last one at the latest.
+            rule = self.replace(count=None, cache=False)
+            if rule.replace(until=dt).count() > self._count:
+                dt, inc = self[self._count - 1], True
+
+        return rule._reverse(dt, inc)
+
+    def _reverse(self, dt, inc):
+        """
+        Generator of the occurrences before ``dt`` in reverse order, which
+        goes through windows of periods twice as long each time, from the
+        period of ``dt`` to the first period. The rule must not have a COUNT.
+        """
+        k = max(self._periodunits(self._wallclock(dt)) // self._interval, 0)
+        end = None
+        step = 1
+        while True:
+            first = max(k - step + 1, 0)
+            if first:
+                gen = self._iter(self._periodstate(first))
+            else:
+                gen = self._iter()
+            if end is not None:
+                # Until the wall time of the previous window
+                window = itertools.takewhile(
+                    lambda x: x.replace(tzinfo=None) < end, gen)
+            elif inc:
+                window = itertools.takewhile(lambda x: x <= dt, gen)
+            else:
+                window = itertools.takewhile(lambda x: x < dt, gen)
+
+            for x in reversed(list(window)):
+                yield x
+
+            if not first:
+                return
+            end = self._periodstart(first)
+            k = first - 1
+            step *= 2
+
+    def _resume(self, last, index=None, inc=False):
+        if (last is None or self.is_empty() or
+                self._wallclock(last) is None):
+            return super(rrule, self)._resume(last, index, inc)
+
+        rule = self
+        remaining = None
+        if self._count is not None:
+            # Generate the periods without counting the occurrences, and
+            # stop after the remaining ones.
+            rule = self.replace(count=None, cache=False)
+            if index is None:
+                until = last
+                if inc:
+                    until -= datetime.timedelta(microseconds=1)
+                index = rule.replace(until=until).count()
+            remaining = max(self._count - index, 0)
+
+        gen = rule._iter(rule._seekstate(last))
+        if inc:
+            gen = itertools.dropwhile(lambda x: x < last, gen)
+        else:
+            gen = itertools.dropwhile(lambda x: x <= last, gen)
+        if remaining is not None:
+            gen = itertools.islice(gen, remaining)
+        return gen
+
+    def _seek(self, dt):
+        if self._cache is not None or self._count is not None:
+            # Cached rules are served from the cache, and the position of
+            # the skipped occurrences is needed to honour COUNT.
+            return None
+
+        start = self._seekstate(dt)
+        if start is None:
+            return None
+
+        return self._iter(start)
+
+    def _seekstate(self, dt):
+        """
+        Returns the position at which :meth:`_iter` has to start to generate
+        every occurrence which may compare greater than ``dt``, or ``None``
+        if the iteration must start at ``dtstart``.
+
+        The position is the start of the period (as defined by ``freq`` and
+        ``interval``) containing the wall time of ``dt`` minus a safety
+        margin, which accounts for the UTC offset changes of aware rules.
+        """
+        dt = self._wallclock(dt)
+        if (dt is None or
+                dt - self._dtstart.replace(tzinfo=None) <= _SEEK_MARGIN):
+            return None
+
+        k = self._periodunits(dt - _SEEK_MARGIN) // self._interval
+        if k <= 0:
+            return None
+
+        return self._periodstate(k)
+
+    def _wallclock(self, dt):
+        """
+        Returns ``dt`` as a naive wall time in the time zone of the rule, or
+        ``None`` if it can't be compared with the occurrences.
+        """
+        if not isinstance(dt, datetime.datetime):
+            return None
+
+        tzinfo = self._tzinfo
+        if (dt.tzinfo is None) != (tzinfo is None):
+            # Let the comparisons fail as they would without seeking
+            return None
+
+        if tzinfo is not None:
+            dt = dt.astimezone(tzinfo)
+
+        return dt.replace(tzinfo=None)
+
+    def _periodunits(self, dt):
+        """
+        Returns the number of whole frequency units (years, months, weeks,
+        ...) between the start of the first period and the naive wall time
+        ``dt``. The period with index ``k`` covers the units ``k * interval``
+        to ``(k + 1) * interval - 1``, but only yields occurrences in the
+        first one.
+        """
+        dtstart = self._dtstart
+        freq = self._freq
+
+        if freq == YEARLY:
+            return dt.year - dtstart.year
+        elif freq == MONTHLY:
+            return (dt.year - dtstart.year) * 12 + dt.month - dtstart.month
+        elif freq <= DAILY:
+            days = (dt.date() - self._periodstart(0).date()).days
+            return days // 7 if freq == WEEKLY else days
+        else:
+            delta = dt - self._periodstart(0)
+            return ((delta.days * 86400 + delta.seconds) //
+                    _FREQ_SPAN[freq].seconds)
+
+    def _periodstart(self, k):
+        """
+        Returns the naive wall time at which the period with index ``k``
+        starts. Only the first period of a weekly rule is shorter, as it
+        starts at ``dtstart`` instead of at the week start.
+        """
+        dtstart = self._dtstart
+        freq = self._freq
+        interval = self._interval
+
+        if freq == YEARLY:
+            return datetime.datetime(dtstart.year + k * interval, 1, 1)
+        elif freq == MONTHLY:
+            year, month = divmod(dtstart.year * 12 + dtstart.month - 1 +
+                                 k * interval, 12)
+            return datetime.datetime(year, month + 1, 1)
+
+        start = dtstart.replace(tzinfo=None)
+        if freq == WEEKLY:
+            start -= datetime.timedelta(
+                days=(start.weekday() - self._wkst) % 7)
+            return (start.replace(hour=0, minute=0, second=0) +
+                    datetime.timedelta(days=k * interval * 7))
+        elif freq == DAILY:
+            return (start.replace(hour=0, minute=0, second=0) +
+                    datetime.timedelta(days=k * interval))
+        elif freq == HOURLY:
+            start = start.replace(minute=0, second=0)
+        elif freq == MINUTELY:
+            start = start.replace(second=0)
+
+        return start + _FREQ_SPAN[freq] * (k * interval)
+
+    def _periodstate(self, k):
+        """
+        Returns the position at which :meth:`_iter` starts to generate the
+        period with index ``k``, which must be positive.
+        """
+        dtstart = self._dtstart
+        start = self._periodstart(k)
+
+        if self._freq < WEEKLY:
+            return (start.year, start.month, dtstart.day,
+                    dtstart.hour, dtstart.minute, dtstart.second,
+                    dtstart.weekday())
+        elif self._freq <= DAILY:
+            return (start.year, start.month, start.day,
+                    dtstart.hour, dtstart.minute, dtstart.second,
+                    start.weekday())
+
+        # The position keeps the components of dtstart below the frequency
+        start += dtstart.replace(tzinfo=None) - self._periodstart(0)
+        return (start.year, start.month, start.day,
+                start.hour, start.minute, start.second,
+                start.weekday())
+
+    def _iter(self, start=None, timestamps=False):
+        if start is None:
+            year, month, day, hour, minute, second, weekday, yearday, _ = \
+                self._dtstart.timetuple()
+        else:
+            year, month, day, hour, minute, second, weekday = start
+
+        # The length is only known if we went through the whole recurrence
+        complete = start is None
+
+        if self.is_empty():
+            if complete:
+                self._len = 0
+            return
+
+        # Some local variables to speed things up a bit
+        freq = self._freq
+        interval = self._interval
+        wkst = self._wkst
+        until = self._until
+        bysetpos = self._bysetpos
+        byhour = self._byhour
+        byminute = self._byminute
+        bysecond = self._bysecond
+
+        ii = _iterinfo(self)
+        ii.rebuild(year, month)
+
+        getdayset = {YEARLY: ii.ydayset,
+                     MONTHLY: ii.mdayset,
+                     WEEKLY: ii.wdayset,
+                     DAILY: ii.ddayset,
+                     HOURLY: ii.ddayset,
+                     MINUTELY: ii.ddayset,
+                     SECONDLY: ii.ddayset}[freq]
+
+        dtstart = self._dtstart
+        exact = True
+        if timestamps:
+            # Generate the wall times in microseconds since the epoch
+            # instead of datetimes.
+            fromordinal = (lambda ordinal:
+                           (ordinal - _EPOCH_ORDINAL) * 86400000000)
+            combine = operator.add
+            dtstart = _timestamp(dtstart.replace(tzinfo=None))
+            if until is not None:
+                # The wall times are compared with until in the time zone of
+                # the rule. Otherwise, the occurrences are only compared as
+                # datetimes once their wall time gets close to until.
+                exact = until.tzinfo is self._tzinfo
+                if not exact:
+                    until = until.astimezone(self._tzinfo) - _SEEK_MARGIN
+                until = _timestamp(until.replace(tzinfo=None))
+                epoch = datetime.datetime(1970, 1, 1, tzinfo=self._tzinfo)
+                pastuntil = (lambda res: epoch +
+                             datetime.timedelta(microseconds=res) >
+                             self._until)
+        else:
+            fromordinal = datetime.date.fromordinal
+            combine = datetime.datetime.combine
+
+        if freq < HOURLY:
+            timeset = self._timeset
+            if timestamps:
+                timeset = [(time.hour * 3600 + time.minute * 60 +
+                            time.second) * 1000000 for time in timeset]
+        else:
+            if timestamps:
+                gettimeset = {HOURLY: ii.htimes,
+                              MINUTELY: ii.mtimes,
+                              SECONDLY: ii.stimes}[freq]
+            else:
+                gettimeset = {HOURLY: ii.htimeset,
+                              MINUTELY: ii.mtimeset,
+                              SECONDLY: ii.stimeset}[freq]
+            if ((freq >= HOURLY and
+                 self._byhour and hour not in self._byhour) or
+                (freq >= MINUTELY and
+                 self._byminute and minute not in self._byminute) or
+                (freq >= SECONDLY and
+                 self._bysecond and second not in self._bysecond)):
+                timeset = ()
+            else:
+                timeset = gettimeset(hour, minute, second)
+
+        # Years without any matching day are skipped as a whole
+        skipyears = freq <= DAILY and not self._byeaster
+
+        # The periods starting after the wall date of until (with a margin for
+        # the offset changes) have no occurrence.
+        lastordinal = None
+        if until is not None:
+            wall = self._wallclock(self._until)
+            if wall is not None:
+                lastordinal = (wall + _SEEK_MARGIN).toordinal()
+
+        total = 0
+        count = self._count
+        while True:
+            if skipyears and not ii.days:
+                k = self._cycleperiod(year)
+                if k is None:
+                    if complete:
+                        self._len = total
+                    return
+                year, month, day, hour, minute, second, weekday = \
+                    self._periodstate(k)
+                ii.rebuild(year, month)
+
+            # Get the days of the period with the right frequency, which
+            # pass the BYXXX rules
+            start, end = getdayset(year, month, day)
+            if (lastordinal is not None and
+                    ii.yearordinal + start > lastordinal):
+                if complete:
                     self._len = total
+                return
+
+            days = ii.days
+            dayset = days[bisect.bisect_left(days, start):
+                          bisect.bisect_left(days, end)]
+            filtered = len(dayset) < end - start
+
+            # Output results
+            if bysetpos and timeset:
+                poslist = []
+                for pos in bysetpos:
+                    if pos < 0:
+                        daypos, timepos = divmod(pos, len(timeset))
+                    else:
+                        daypos, timepos = divmod(pos-1, len(timeset))
+                    try:
+                        i = dayset[daypos]
+                        time = timeset[timepos]
+                    except IndexError:
+                        pass
+                    else:
+                        date = fromordinal(ii.yearordinal+i)
+                        res = combine(date, time)
+                        if res not in poslist:
+                            poslist.append(res)
+                poslist.sort()
+                for res in poslist:
+                    if (until is not None and res > until and
+                            (exact or pastuntil(res))):
+                        if complete:
+                            self._len = total
+                        return
+                    elif res >= dtstart:
+                        if count is not None:
+                            count -= 1
+                            if count < 0:
+                                if complete:
+                                    self._len = total
+                                return
+                        total += 1
+                        yield res
+            else:
+                for i in dayset:
+                    date = fromordinal(ii.yearordinal + i)
+                    for time in timeset:
+                        res = combine(date, time)
+                        if (until is not None and res > until and
+                                (exact or pastuntil(res))):
+                            if complete:
+                                self._len = total
+                            return
+                        elif res >= dtstart:
+                            if count is not None:
+                                count -= 1
+                                if count < 0:
+                                    if complete:
+                                        self._len = total
+                                    return
+
+                            total += 1
+                            yield res
+
+            # Handle frequency and interval
+            fixday = False
+            if freq == YEARLY:
+                year += interval
+                if year > datetime.MAXYEAR:
+                    if complete:
+                        self._len = total
                     return
                 ii.rebuild(year, month)
             elif freq == MONTHLY:
@@ -915,7 +2213,8 @@ class rrule(rrulebase):
                         month = 12
                         year -= 1
                     if year > datetime.MAXYEAR:
-                        self._len = total
+                        if complete:
+                            self._len = total
                         return
                 ii.rebuild(year, month)
             elif freq == WEEKLY:
@@ -1024,7 +2323,8 @@ class rrule(rrulebase):
                             month = 1
                             year += 1
                             if year > datetime.MAXYEAR:
-                                self._len = total
+                                if complete:
+                                    self._len = total
                                 return
                         daysinmonth = calendar.monthrange(year, month)[1]
                     ii.rebuild(year, month)
@@ -1113,7 +2413,8 @@ class _iterinfo(object):
     __slots__ = ["rrule", "lastyear", "lastmonth",
                  "yearlen", "nextyearlen", "yearordinal", "yearweekday",
                  "mmask", "mrange", "mdaymask", "nmdaymask",
-                 "wdaymask", "wnomask", "nwdaymask", "eastermask"]
+                 "wdaymask", "wnomask", "nwdaymask", "eastermask",
+                 "daymask", "days"]
 
     def __init__(self, rrule):
         for attr in self.__slots__:
@@ -1144,142 +2445,231 @@ class _iterinfo(object):
                 self.wdaymask = WDAYMASK[wday:]
                 self.mrange = M366RANGE
 
+            # The masks are shared by the years in the same position of the
+            # Gregorian cycle, only the Easter ones depend on the year.
+            cycle = _cyclekey(year)
+
             if not rr._byweekno:
                 self.wnomask = None
             else:
-                self.wnomask = [0]*(self.yearlen+7)
-                # no1wkst = firstwkst = self.wdaymask.index(rr._wkst)
-                no1wkst = firstwkst = (7-self.yearweekday+rr._wkst) % 7
-                if no1wkst >= 4:
-                    no1wkst = 0
-                    # Number of days in the year, plus the days we got
-                    # from last year.
-                    wyearlen = self.yearlen+(self.yearweekday-rr._wkst) % 7
-                else:
-                    # Number of days in the year, minus the days we
-                    # left in last year.
-                    wyearlen = self.yearlen-no1wkst
-                div, mod = divmod(wyearlen, 7)
-                numweeks = div+mod//4
-                for n in rr._byweekno:
-                    if n < 0:
-                        n += numweeks+1
-                    if not (0 < n <= numweeks):
-                        continue
-                    if n > 1:
-                        i = no1wkst+(n-1)*7
-                        if no1wkst != firstwkst:
-                            i -= 7-firstwkst
-                    else:
-                        i = no1wkst
-                    for j in range(7):
-                        self.wnomask[i] = 1
-                        i += 1
-                        if self.wdaymask[i] == rr._wkst:
-                            break
-                if 1 in rr._byweekno:
-                    # Check week number 1 of next year as well
-                    # TODO: Check -numweeks for next year.
-                    i = no1wkst+numweeks*7
-                    if no1wkst != firstwkst:
-                        i -= 7-firstwkst
-                    if i < self.yearlen:
-                        # If week starts in next year, we
-                        # don't care about it.
-                        for j in range(7):
-                            self.wnomask[i] = 1
-                            i += 1
-                            if self.wdaymask[i] == rr._wkst:
-                                break
-                if no1wkst:
-                    # Check last week number of last year as
-                    # well. If no1wkst is 0, either the year
-                    # started on week start, or week number 1
-                    # got days from last year, so there are no
-                    # days from last year's last week number in
-                    # this year.
-                    if -1 not in rr._byweekno:
-                        lyearweekday = datetime.date(year-1, 1, 1).weekday()
-                        lno1wkst = (7-lyearweekday+rr._wkst) % 7
-                        lyearlen = 365+calendar.isleap(year-1)
-                        if lno1wkst >= 4:
-                            lno1wkst = 0
-                            lnumweeks = 52+(lyearlen +
-                                            (lyearweekday-rr._wkst) % 7) % 7//4
-                        else:
-                            lnumweeks = 52+(self.yearlen-no1wkst) % 7//4
-                    else:
-                        lnumweeks = -1
-                    if lnumweeks in rr._byweekno:
-                        for i in range(no1wkst):
-                            self.wnomask[i] = 1
-
-        if (rr._bynweekday and (month != self.lastmonth or
-                                year != self.lastyear)):
-            ranges = []
-            if rr._freq == YEARLY:
-                if rr._bymonth:
-                    for month in rr._bymonth:
-                        ranges.append(self.mrange[month-1:month+1])
-                else:
-                    ranges = [(0, self.yearlen)]
-            elif rr._freq == MONTHLY:
-                ranges = [self.mrange[month-1:month+1]]
-            if ranges:
-                # Weekly frequency won't get here, so we may not
-                # care about cross-year weekly periods.
-                self.nwdaymask = [0]*self.yearlen
-                for first, last in ranges:
-                    last -= 1
-                    for wday, n in rr._bynweekday:
-                        if n < 0:
-                            i = last+(n+1)*7
-                            i -= (self.wdaymask[i]-wday) % 7
-                        else:
-                            i = first+(n-1)*7
-                            i += (7-self.wdaymask[i]+wday) % 7
-                        if first <= i <= last:
-                            self.nwdaymask[i] = 1
-
-        if rr._byeaster:
-            self.eastermask = [0]*(self.yearlen+7)
-            eyday = easter.easter(year).toordinal()-self.yearordinal
-            for offset in rr._byeaster:
-                self.eastermask[eyday+offset] = 1
+                self.wnomask = _MASK_CACHE.get(
+                    ("wnomask", cycle, rr._wkst, rr._byweekno),
+                    lambda: self.buildwnomask(year))
+
+            if not rr._bynweekday:
+                self.nwdaymask = None
+            else:
+                # Weekly frequency won't get here, so we may not care about
+                # cross-year weekly periods.
+                self.nwdaymask = _MASK_CACHE.get(
+                    ("nwdaymask", cycle, rr._freq, rr._bymonth,
+                     rr._bynweekday),
+                    self.buildnwdaymask)
+
+            if not rr._byeaster:
+                self.eastermask = None
+            else:
+                self.eastermask = _MASK_CACHE.get(
+                    ("eastermask", year, rr._byeaster),
+                    lambda: self.buildeastermask(year))
+
+            if rr._bynweekday:
+                nwdaykey = (rr._freq, rr._bynweekday)
+            else:
+                nwdaykey = None
+            self.daymask, self.days = _MASK_CACHE.get(
+                ("daymask", year if rr._byeaster else cycle,
+                 rr._bymonth, rr._byweekno, rr._wkst,
+                 rr._byweekday, nwdaykey, rr._byeaster, rr._bymonthday,
+                 rr._bynmonthday, rr._byyearday),
+                self.builddaymask)
 
         self.lastyear = year
         self.lastmonth = month
 
+    def buildwnomask(self, year):
+        rr = self.rrule
+        wnomask = [0]*(self.yearlen+7)
+        # no1wkst = firstwkst = self.wdaymask.index(rr._wkst)
+        no1wkst = firstwkst = (7-self.yearweekday+rr._wkst) % 7
+        if no1wkst >= 4:
+            no1wkst = 0
+            # Number of days in the year, plus the days we got
+            # from last year.
+            wyearlen = self.yearlen+(self.yearweekday-rr._wkst) % 7
+        else:
+            # Number of days in the year, minus the days we
+            # left in last year.
+            wyearlen = self.yearlen-no1wkst
+        div, mod = divmod(wyearlen, 7)
+        numweeks = div+mod//4
+        for n in rr._byweekno:
+            if n < 0:
+                n += numweeks+1
+            if not (0 < n <= numweeks):
+                continue
+            if n > 1:
+                i = no1wkst+(n-1)*7
+                if no1wkst != firstwkst:
+                    i -= 7-firstwkst
+            else:
+                i = no1wkst
+            for j in range(7):
+                wnomask[i] = 1
+                i += 1
+                if self.wdaymask[i] == rr._wkst:
+                    break
+        if 1 in rr._byweekno:
+            # Check week number 1 of next year as well
+            # TODO: Check -numweeks for next year.
+            i = no1wkst+numweeks*7
+            if no1wkst != firstwkst:
+                i -= 7-firstwkst
+            if i < self.yearlen:
+                # If week starts in next year, we
+                # don't care about it.
+                for j in range(7):
+                    wnomask[i] = 1
+                    i += 1
+                    if self.wdaymask[i] == rr._wkst:
+                        break
+        if no1wkst:
+            # Check last week number of last year as
+            # well. If no1wkst is 0, either the year
+            # started on week start, or week number 1
+            # got days from last year, so there are no
+            # days from last year's last week number in
+            # this year.
+            if -1 not in rr._byweekno:
+                lyearweekday = datetime.date(year-1, 1, 1).weekday()
+                lno1wkst = (7-lyearweekday+rr._wkst) % 7
+                lyearlen = 365+calendar.isleap(year-1)
+                if lno1wkst >= 4:
+                    lno1wkst = 0
+                    lnumweeks = 52+(lyearlen +
+                                    (lyearweekday-rr._wkst) % 7) % 7//4
+                else:
+                    lnumweeks = 52+(self.yearlen-no1wkst) % 7//4
+            else:
+                lnumweeks = -1
+            if lnumweeks in rr._byweekno:
+                for i in range(no1wkst):
+                    wnomask[i] = 1
+        return tuple(wnomask)
+
+    def buildnwdaymask(self):
+        rr = self.rrule
+        if rr._bymonth:
+            months = rr._bymonth
+        elif rr._freq == MONTHLY:
+            months = range(1, 13)
+        else:
+            months = ()
+        ranges = [self.mrange[month-1:month+1] for month in months]
+        if not ranges:
+            ranges = [(0, self.yearlen)]
+        nwdaymask = [0]*self.yearlen
+        for first, last in ranges:
+            last -= 1
+            for wday, n in rr._bynweekday:
+                if n < 0:
+                    i = last+(n+1)*7
+                    i -= (self.wdaymask[i]-wday) % 7
+                else:
+                    i = first+(n-1)*7
+                    i += (7-self.wdaymask[i]+wday) % 7
+                if first <= i <= last:
+                    nwdaymask[i] = 1
+        return tuple(nwdaymask)
+
+    def buildeastermask(self, year):
+        eastermask = [0]*(self.yearlen+7)
+        eyday = easter.easter(year).toordinal()-self.yearordinal
+        for offset in self.rrule._byeaster:
+            eastermask[eyday+offset] = 1
+        return tuple(eastermask)
+
+    def builddaymask(self):
+        """
+        Evaluates the BYXXX rules once for every day of the year, returning
+        immutable bytes with 1 for the days which pass them, and the sorted
+        indices of those days.
+        """
+        rr = self.rrule
+        bymonth = rr._bymonth
+        byweekno = rr._byweekno
+        byweekday = rr._byweekday
+        byeaster = rr._byeaster
+        bymonthday = rr._bymonthday
+        bynmonthday = rr._bynmonthday
+        byyearday = rr._byyearday
+        yearlen = self.yearlen
+        nextyearlen = self.nextyearlen
+        mmask = self.mmask
+        wnomask = self.wnomask
+        wdaymask = self.wdaymask
+        nwdaymask = self.nwdaymask
+        eastermask = self.eastermask
+        mdaymask = self.mdaymask
+        nmdaymask = self.nmdaymask
+
+        daymask = bytearray(yearlen + 7)
+        for i in range(yearlen + 7):
+            if ((bymonth and mmask[i] not in bymonth) or
+                (byweekno and not wnomask[i]) or
+                (byweekday and wdaymask[i] not in byweekday) or
+                (nwdaymask and (i >= len(nwdaymask) or not nwdaymask[i])) or
+                (byeaster and not eastermask[i]) or
+                ((bymonthday or bynmonthday) and
+                 mdaymask[i] not in bymonthday and
+                 nmdaymask[i] not in bynmonthday) or
+                (byyearday and
+                 ((i < yearlen and i+1 not in byyearday and
+                   -yearlen+i not in byyearday) or
+                  (i >= yearlen and i+1-yearlen not in byyearday and
+                   -nextyearlen+i-yearlen not in byyearday)))):
+                continue
+            daymask[i] = 1
+        days = tuple(i for i in range(yearlen + 7) if daymask[i])
+        return _frozenbytes(daymask), days
+
+    def isfiltered(self, i):
+        """
+        Returns whether the BYXXX rules exclude the day with index ``i`` of
+        the year.
+        """
+        return not self.daymask[i]
+
+    def arraymask(self, length):
+        """
+        Returns a NumPy array telling which of the first ``length`` days of
+        the year pass the BYXXX rules, the opposite of :meth:`isfiltered`.
+        """
+        return numpy.frombuffer(bytearray(self.daymask), dtype=bool,
+                                count=length)
+
     def ydayset(self, year, month, day):
-        return list(range(self.yearlen)), 0, self.yearlen
+        return 0, self.yearlen
 
     def mdayset(self, year, month, day):
-        dset = [None]*self.yearlen
-        start, end = self.mrange[month-1:month+1]
-        for i in range(start, end):
-            dset[i] = i
-        return dset, start, end
+        return self.mrange[month-1:month+1]
 
     def wdayset(self, year, month, day):
         # We need to handle cross-year weeks here.
-        dset = [None]*(self.yearlen+7)
         i = datetime.date(year, month, day).toordinal()-self.yearordinal
         start = i
         for j in range(7):
-            dset[i] = i
             i += 1
             # if (not (0 <= i < self.yearlen) or
             #    self.wdaymask[i] == self.rrule._wkst):
             # This will cross the year boundary, if necessary.
             if self.wdaymask[i] == self.rrule._wkst:
                 break
-        return dset, start, i
+        return start, i
 
     def ddayset(self, year, month, day):
-        dset = [None] * self.yearlen
         i = datetime.date(year, month, day).toordinal() - self.yearordinal
-        dset[i] = i
-        return dset, i, i + 1
+        return i, i + 1
 
     def htimeset(self, hour, minute, second):
         tset = []
@@ -1299,9 +2689,539 @@ class _iterinfo(object):
         tset.sort()
         return tset
 
-    def stimeset(self, hour, minute, second):
-        return (datetime.time(hour, minute, second,
-                tzinfo=self.rrule._tzinfo),)
+    def stimeset(self, hour, minute, second):
+        return (datetime.time(hour, minute, second,
+                tzinfo=self.rrule._tzinfo),)
+
+    # Same as the above, as microseconds since midnight
+    def htimes(self, hour, minute, second):
+        rr = self.rrule
+        return sorted(((hour * 60 + minute) * 60 + second) * 1000000
+                      for minute in rr._byminute
+                      for second in rr._bysecond)
+
+    def mtimes(self, hour, minute, second):
+        return sorted(((hour * 60 + minute) * 60 + second) * 1000000
+                      for second in self.rrule._bysecond)
+
+    def stimes(self, hour, minute, second):
+        return (((hour * 60 + minute) * 60 + second) * 1000000,)
+
+
+class _indexinfo(object):
+    """
+    Computes the occurrences of a regular rule (see
+    :meth:`rrule._regularpattern`) from their position.
+    """
+    __slots__ = ["rrule", "first", "pattern", "len"]
+
+    def __init__(self, rrule, pattern):
+        self.rrule = rrule
+        self.pattern = pattern
+        self.len = None
+
+        # The first period may be partial, so it is generated
+        nextstart = rrule._periodstart(1)
+        self.first = list(itertools.takewhile(
+            lambda x: x.replace(tzinfo=None) < nextstart, rrule._iter()))
+
+    def occurrence(self, n):
+        """
+        Returns the occurrence at the (non-negative) position ``n``, or
+        ``None`` if the rule has less than ``n + 1`` occurrences.
+        """
+        if n < len(self.first):
+            return self.first[n]
+
+        rr = self.rrule
+        if rr._count is not None and n >= rr._count:
+            return None
+
+        k, j = divmod(n - len(self.first), len(self.pattern))
+        try:
+            start = rr._periodstart(k + 1)
+            if rr._freq == YEARLY:
+                res = datetime.datetime(start.year, *self.pattern[j])
+            elif rr._freq == MONTHLY:
+                res = datetime.datetime(start.year, start.month,
+                                        *self.pattern[j])
+            else:
+                res = start + self.pattern[j]
+        except (OverflowError, ValueError):
+            # Out of the supported range of years
+            return None
+
+        res = res.replace(tzinfo=rr._tzinfo)
+        if rr._until and res > rr._until:
+            return None
+
+        return res
+
+    def __len__(self):
+        if self.len is None:
+            occurrence = self.occurrence
+            count = self.rrule._count
+            if count is not None and (count <= 0 or
+                                      occurrence(count - 1) is not None):
+                self.len = max(count, 0)
+            else:
+                # Exponential search for the first missing occurrence,
+                # followed by a binary search.
+                lo, step = len(self.first) - 1, 1
+                while occurrence(lo + step) is not None:
+                    lo += step
+                    step *= 2
+                hi = lo + step
+                while hi - lo > 1:
+                    mid = (lo + hi) // 2
+                    if occurrence(mid) is None:
+                        hi = mid
+                    else:
+                        lo = mid
+                self.len = hi
+
+        return self.len
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            start, stop, step = item.start, item.stop, item.step
+            if ((step or 1) > 0 and (start or 0) >= 0 and
+                    stop is not None and stop >= 0):
+                # No need for the length
+                indices = range(start or 0, stop, step or 1)
+            else:
+                indices = range(*item.indices(len(self)))
+
+            result = []
+            for n in indices:
+                res = self.occurrence(n)
+                if res is None:
+                    break
+                result.append(res)
+            return result
+
+        if item < 0:
+            item += len(self)
+            if item < 0:
+                raise IndexError
+
+        res = self.occurrence(item)
+        if res is None:
+            raise IndexError
+        return res
+
+
+class _datetimearray(object):
+    """
+    Sequence of datetimes sharing the same ``tzinfo``, compactly stored as
+    the microseconds of their wall times since the epoch in an ``array('q')``.
+    The datetimes are only created when they are accessed.
+    """
+    __slots__ = ["values", "epoch"]
+
+    def __init__(self, dts=()):
+        self.values = array.array('q')
+        self.epoch = None
+        for dt in dts:
+            self.append(dt)
+
+    @property
+    def tzinfo(self):
+        return self.epoch and self.epoch.tzinfo
+
+    def append(self, dt):
+        if self.epoch is None:
+            self.epoch = datetime.datetime(1970, 1, 1, tzinfo=dt.tzinfo)
+        self.values.append(self.key(dt))
+
+    def key(self, dt):
+        """
+        Returns the stored value of ``dt``.
+        """
+        return (((dt.toordinal() - _EPOCH_ORDINAL) * 86400 +
+                 dt.hour * 3600 + dt.minute * 60 + dt.second) * 1000000 +
+                dt.microsecond)
+
+    def bisect(self, dt, right=False):
+        """
+        Returns the position of ``dt`` in the sequence, as
+        :func:`bisect.bisect_left` (or :func:`bisect.bisect_right` if
+        ``right`` is ``True``) would, comparing the stored values if possible.
+        """
+        search = bisect.bisect_right if right else bisect.bisect_left
+        if (isinstance(dt, datetime.datetime) and
+                dt.tzinfo is self.tzinfo):
+            # Datetimes in the same time zone compare as their wall times.
+            return search(self.values, self.key(dt))
+        return search(self, dt)
+
+    def __len__(self):
+        return len(self.values)
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return [self.epoch + datetime.timedelta(microseconds=value)
+                    for value in self.values[item]]
+        return self.epoch + datetime.timedelta(microseconds=self.values[item])
+
+    def __iter__(self):
+        epoch = self.epoch
+        timedelta = datetime.timedelta
+        for value in self.values:
+            yield epoch + timedelta(microseconds=value)
+
+    def __eq__(self, other):
+        if isinstance(other, _datetimearray):
+            return (self.values == other.values and
+                    (not self.values or self.tzinfo is other.tzinfo))
+        if isinstance(other, (list, tuple)):
+            return list(self) == list(other)
+        return NotImplemented
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        if result is NotImplemented:
+            return result
+        return not result
+
+    __hash__ = None
+
+    def __repr__(self):
+        return "%s(%r)" % (self.__class__.__name__, list(self))
+
+
+class _windowcache(object):
+    """
+    Bounded cache of the recurrences of an rrule, split in segments of
+    ``periods`` consecutive periods. Each segment is a list of the position
+    of its first recurrence (``None`` until it is known), its recurrences (in
+    a :class:`_datetimearray`) and the key of the next segment with
+    recurrences (``None`` after the last one). The least recently used
+    segments are dropped once more than ``maxsize`` recurrences are kept.
+    """
+    periods = 64
+
+    def __init__(self, rrule, maxsize):
+        self.rrule = rrule
+        self.maxsize = maxsize
+        self.segments = OrderedDict()
+        self.size = 0
+        self.lock = _thread.allocate_lock()
+
+    def key(self, dt):
+        """
+        Returns the key of the segment including ``dt``, or ``None`` if
+        ``dt`` doesn't compare with the recurrences as a wall time.
+        """
+        rr = self.rrule
+        if (not isinstance(dt, datetime.datetime) or
+                dt.tzinfo is not rr._tzinfo):
+            # Only the datetimes in the time zone of the recurrences compare
+            # in the same order as their wall times.
+            return None
+
+        units = rr._periodunits(dt.replace(tzinfo=None))
+        return max(units // rr._interval // self.periods, 0)
+
+    def segment(self, k):
+        with self.lock:
+            segment = self.segments.pop(k, None)
+            if segment is not None:
+                self.segments[k] = segment
+                return segment
+
+        segment = self.build(k)
+        with self.lock:
+            if k not in self.segments:
+                self.segments[k] = segment
+                self.size += len(segment[1])
+                while (len(self.segments) > 1 and
+                       (self.size > self.maxsize or
+                        len(self.segments) > self.maxsize)):
+                    self.size -= len(self.segments.popitem(last=False)[1][1])
+        return segment
+
+    def build(self, k):
+        rr = self.rrule
+        count = rr._count
+        try:
+            end = rr._periodstart((k + 1) * self.periods)
+        except (OverflowError, ValueError):
+            end = None
+
+        if k == 0:
+            index = 0
+            gen = rr._iter()
+        else:
+            try:
+                start = rr._periodstart(k * self.periods)
+                gen = rr._iter(rr._periodstate(k * self.periods))
+            except (OverflowError, ValueError):
+                return [None, (), None]
+
+            index = None
+            if count is not None:
+                # Number of recurrences before the segment
+                until = start.replace(tzinfo=rr._tzinfo)
+                index = rr.replace(count=None, cache=False,
+                                   until=until - datetime.timedelta(seconds=1)
+                                   ).count()
+                if index >= count:
+                    return [index, (), None]
+
+        recurrences = []
+        nextk = None
+        for dt in gen:
+            wall = dt.replace(tzinfo=None)
+            if end is not None and wall >= end:
+                nextk = self.key(dt)
+                break
+            recurrences.append(dt)
+
+        if count is not None and index + len(recurrences) >= count:
+            del recurrences[count - index:]
+            nextk = None
+
+        return [index, _datetimearray(recurrences), nextk]
+
+    def iter(self, k=0):
+        index = 0 if k == 0 else None
+        while k is not None:
+            segment = self.segment(k)
+            if index is not None:
+                segment[0] = index
+                index += len(segment[1])
+            for dt in segment[1]:
+                yield dt
+            k = segment[2]
+
+        if index is not None:
+            self.rrule._len = index
+
+    def getitem(self, item):
+        # Start from the last known position before the item
+        index = k = 0
+        with self.lock:
+            for key, segment in self.segments.items():
+                if segment[0] is not None and index < segment[0] <= item:
+                    index, k = segment[0], key
+
+        while k is not None:
+            segment = self.segment(k)
+            segment[0] = index
+            if item < index + len(segment[1]):
+                return segment[1][item - index]
+            index += len(segment[1])
+            k = segment[2]
+
+        raise IndexError
+
+
+class _countinfo(object):
+    """
+    Counts the occurrences of a rule in whole periods (see
+    :meth:`rrule._periodstart`) without generating them, from the number of
+    days of each period left by the BYXXX rules.
+    """
+    __slots__ = ["rrule", "ii", "origin", "setsizes", "daytimes",
+                 "daycounts"]
+
+    def __init__(self, rrule):
+        self.rrule = rrule
+        self.ii = _iterinfo(rrule)
+        self.origin = rrule._periodstart(0)
+        self.setsizes = {}
+        self.daytimes = None
+        self.daycounts = None
+
+    def count(self, start, end, limit=None):
+        """
+        Returns the number of occurrences of the periods starting between
+        the naive wall times ``start`` (included) and ``end`` (excluded, or
+        the end of the supported range if ``None``), which must be the
+        starts of periods after the first one, or midnights for frequencies
+        higher than daily. The counting may stop once ``limit`` is reached.
+        """
+        if self.rrule._freq <= DAILY:
+            return self.periodcount(start, end, limit)
+        else:
+            return self.daycount(start.toordinal(),
+                                 end.toordinal() if end else None, limit)
+
+    def days(self, first, last, step=1):
+        """
+        Returns the number of days of the year, with indices from ``first``
+        to ``last`` (excluded) by ``step``, which pass the BYXXX rules.
+        """
+        return sum(self.ii.daymask[first:last:step])
+
+    def setsize(self, n):
+        """
+        Returns the number of occurrences of a period with ``n`` candidate
+        occurrences, as selected by BYSETPOS.
+        """
+        bysetpos = self.rrule._bysetpos
+        if not bysetpos:
+            return n
+
+        size = self.setsizes.get(n)
+        if size is None:
+            size = len(set(pos - 1 if pos > 0 else n + pos
+                           for pos in bysetpos if -n <= pos <= n))
+            self.setsizes[n] = size
+        return size
+
+    def periodcount(self, start, end, limit):
+        rr = self.rrule
+        freq = rr._freq
+        interval = rr._interval
+        ntimes = len(rr._timeset)
+        ii = self.ii
+        maxordinal = datetime.date.max.toordinal()
+
+        total = 0
+        k = rr._periodunits(start) // interval
+        kend = None if end is None else rr._periodunits(end) // interval
+        year, month = start.year, start.month
+        ordinal = start.toordinal()
+        while (kend is None or k < kend) and year <= datetime.MAXYEAR:
+            ii.rebuild(year, month)
+            if not ii.days and not rr._byeaster:
+                # Skip the years without any matching day
+                k = rr._cycleperiod(year)
+                if k is None or (kend is not None and k >= kend):
+                    break
+                start = rr._periodstart(k)
+                year, month = start.year, start.month
+                ordinal = start.toordinal()
+                continue
+
+            n = 1
+            if freq == YEARLY:
+                total += self.setsize(self.days(0, ii.yearlen) * ntimes)
+                year += interval
+            elif freq == MONTHLY:
+                first, last = ii.mrange[month-1:month+1]
+                total += self.setsize(self.days(first, last) * ntimes)
+                year, month = divmod(year * 12 + month - 1 + interval, 12)
+                month += 1
+            else:
+                first = ordinal - ii.yearordinal
+                if freq == WEEKLY:
+                    last = min(first + 7, maxordinal + 1 - ii.yearordinal)
+                    total += self.setsize(self.days(first, last) * ntimes)
+                else:
+                    # Every period of the year at once
+                    n = (ii.yearlen - 1 - first) // interval + 1
+                    if kend is not None:
+                        n = min(n, kend - k)
+                    total += (self.days(first, first + n * interval,
+                                        interval) * self.setsize(ntimes))
+
+                ordinal += n * interval * (7 if freq == WEEKLY else 1)
+                if ordinal > maxordinal:
+                    break
+                elif ordinal - ii.yearordinal >= ii.yearlen:
+                    year = datetime.date.fromordinal(ordinal).year
+            k += n
+
+            if limit is not None and total >= limit:
+                break
+
+        return total
+
+    def daycount(self, first, last, limit):
+        """
+        Same as :meth:`count` for frequencies higher than daily, between the
+        day ordinals ``first`` and ``last``.
+        """
+        rr = self.rrule
+        freq = rr._freq
+        if freq == HOURLY:
+            ntimes = len(rr._byminute) * len(rr._bysecond)
+        elif freq == MINUTELY:
+            ntimes = len(rr._bysecond)
+        else:
+            ntimes = 1
+        pertime = self.setsize(ntimes)
+        regular = 86400 % (_FREQ_SPAN[freq].seconds * rr._interval) == 0
+        ii = self.ii
+        if last is None:
+            last = datetime.date.max.toordinal() + 1
+
+        total = 0
+        while first < last:
+            ii.rebuild(datetime.date.fromordinal(first).year, 1)
+            i = first - ii.yearordinal
+            n = min(ii.yearlen, last - ii.yearordinal)
+            if regular:
+                # Every day has the same periods
+                total += self.days(i, n) * self.periods(first) * pertime
+            else:
+                days = ii.days
+                for j in days[bisect.bisect_left(days, i):
+                              bisect.bisect_left(days, n)]:
+                    total += self.periods(ii.yearordinal + j) * pertime
+            first = ii.yearordinal + n
+
+            if limit is not None and total >= limit:
+                break
+
+        return total
+
+    def periods(self, ordinal):
+        """
+        Returns the number of periods of the day ``ordinal`` whose times
+        pass the BYXXX rules, for frequencies higher than daily.
+        """
+        rr = self.rrule
+        freq = rr._freq
+        step = _FREQ_SPAN[freq].seconds * rr._interval
+        origin = self.origin
+        offset = ((origin.hour * 3600 + origin.minute * 60 + origin.second -
+                   (ordinal - origin.toordinal()) * 86400) % step)
+
+        daycounts = self.daycounts
+        if daycounts is None:
+            # The periods start on whole hours or minutes
+            hours = rr._byhour or range(24)
+            minutes = seconds = (0,)
+            if freq >= MINUTELY:
+                minutes = rr._byminute or range(60)
+            if freq == SECONDLY:
+                seconds = rr._bysecond or range(60)
+            self.daytimes = (hours, minutes, seconds)
+
+            daycounts = {}
+            if step <= 1350:
+                # Many periods per day: count the valid times of the day by
+                # their remainder modulo the step, which is the offset of the
+                # first period of the days they are in.
+                counts = {0: 1}
+                for unit, values in ((3600, hours), (60, minutes),
+                                     (1, seconds)):
+                    sums = {}
+                    for time, count in counts.items():
+                        for value in values:
+                            key = (time + value * unit) % step
+                            sums[key] = sums.get(key, 0) + count
+                    counts = sums
+                for time in range(step):
+                    daycounts[time] = counts.get(time, 0)
+            self.daycounts = daycounts
+
+        count = daycounts.get(offset)
+        if count is None:
+            hours, minutes, seconds = self.daytimes
+            count = 0
+            for time in range(offset, 86400, step):
+                hour, time = divmod(time, 3600)
+                minute, second = divmod(time, 60)
+                if hour in hours and minute in minutes and second in seconds:
+                    count += 1
+            daycounts[offset] = count
+
+        return count
 
 
 class rruleset(rrulebase):
@@ -1346,6 +3266,14 @@ class rruleset(rrulebase):
         def __ne__(self, other):
             return self.dt != other.dt
 
+    class _reversegenitem(_genitem):
+        # Generators of decreasing values, the greatest one comes first.
+        def __lt__(self, other):
+            return self.dt > other.dt
+
+        def __gt__(self, other):
+            return self.dt < other.dt
+
     def __init__(self, cache=False):
         super(rruleset, self).__init__(cache)
         self._rrule = []
@@ -1380,39 +3308,897 @@ class rruleset(rrulebase):
             even if some inclusive rrule or rdate matches them. """
         self._exdate.append(exdate)
 
-    def _iter(self):
+    def __contains__(self, item):
+        if self._cache_complete:
+            return super(rruleset, self).__contains__(item)
+
+        if (not self._hasdate(self._rdate, item) and
+                not any(item in rr for rr in self._rrule)):
+            return False
+
+        return not (self._hasdate(self._exdate, item) or
+                    any(item in rr for rr in self._exrule))
+
+    @staticmethod
+    def _hasdate(dts, item):
+        """
+        Tells whether ``item`` is in the list of dates ``dts``, which is
+        sorted to search it.
+        """
+        try:
+            dts.sort()
+            i = bisect.bisect_left(dts, item)
+        except TypeError:
+            return item in dts
+        return i < len(dts) and dts[i] == item
+
+    def _to_numpy(self, after, before, inc, aware=None):
+        dates = self._rdate + self._exdate
+        rules = self._rrule + self._exrule
+        if aware is None and (dates or rules):
+            aware = (dates[0].tzinfo if dates else
+                     rules[0]._dtstart.tzinfo) is not None
+
+        def expand(rules, dates):
+            # Concatenates the arrays of the rules and dates, with the
+            # offsets of aware values.
+            parts = [rr._to_numpy(after, before, inc, aware) for rr in rules]
+            dates = [dt for dt in dates
+                     if (after is None or dt > after or
+                         (inc and dt == after)) and
+                     (before is None or dt < before or
+                      (inc and dt == before))]
+            values = numpy.array([_timestamp(dt) for dt in dates],
+                                 dtype='int64')
+            if aware:
+                offsets = [dt.utcoffset() for dt in dates]
+                offsets = [offset.days * 86400 + offset.seconds
+                           for offset in offsets]
+                parts.append(_numpy_result(
+                    values, numpy.array(offsets, dtype='int64')))
+                return (numpy.concatenate([part[0] for part in parts]),
+                        numpy.concatenate([part[1] for part in parts]))
+            else:
+                parts.append(_numpy_result(values))
+                return numpy.concatenate(parts), None
+
+        values, offsets = expand(self._rrule, self._rdate)
+        excluded = expand(self._exrule, self._exdate)[0]
+        values, index = numpy.unique(values, return_index=True)
+        valid = ~numpy.isin(values, excluded)
+        if not aware:
+            return values[valid]
+        return values[valid], offsets[index[valid]]
+
+    def _iter_timestamps(self, after=None):
+        return self._iter(timestamps=True, after=after)
+
+    def _iter(self, timestamps=False, after=None):
+        if timestamps:
+            # Merge the timestamps of the dates and rules instead, from the
+            # periods of after on for the rules.
+            first = None if after is None else _timestamp(after)
+
+            def dates(dts):
+                values = sorted(_timestamp(dt) for dt in dts)
+                if first is not None:
+                    del values[:bisect.bisect_left(values, first)]
+                return iter(values)
+
+            def rules(rrs):
+                return [rr._iter_timestamps(after) for rr in rrs]
+        else:
+            def dates(dts):
+                dts.sort()
+                return iter(dts)
+
+            def rules(rrs):
+                return [iter(rr) for rr in rrs]
+
+        total = 0
+        for dt in self._merge(self._genitem,
+                              [dates(self._rdate)] + rules(self._rrule),
+                              [dates(self._exdate)] + rules(self._exrule)):
+            total += 1
+            yield dt
+        if after is None:
+            self._len = total
+
+    def _iter_before(self, dt, inc):
+        if self._cache_complete:
+            return super(rruleset, self)._iter_before(dt, inc)
+
+        search = bisect.bisect_right if inc else bisect.bisect_left
+
+        def dates(dts):
+            # The sorted dates from the last one to keep
+            dts.sort()
+            return reversed(dts[:search(dts, dt)])
+
+        def rules(rrs):
+            return [rr.iter_before(dt, inc) for rr in rrs]
+
+        return self._merge(self._reversegenitem,
+                           [dates(self._rdate)] + rules(self._rrule),
+                           [dates(self._exdate)] + rules(self._exrule))
+
+    def _resume(self, last, index=None, inc=False):
+        if last is None or self._cache_complete:
+            return super(rruleset, self)._resume(last, index, inc)
+
+        search = bisect.bisect_left if inc else bisect.bisect_right
+
+        def dates(dts):
+            # The sorted dates from the first one to keep
+            dts.sort()
+            return iter(dts[search(dts, last):])
+
+        def rules(rrs):
+            return [rr._resume(last, inc=inc) for rr in rrs]
+
+        return self._merge(self._genitem,
+                           [dates(self._rdate)] + rules(self._rrule),
+                           [dates(self._exdate)] + rules(self._exrule))
+
+    def _seek(self, dt):
+        if self._cache is not None:
+            return None
+        # The rules are resumed at dt, and the exclusion rules only expanded
+        # from there as far as the merge goes.
+        return self._resume(dt, inc=True)
+
+    def before(self, dt, inc=False):
+        if self._cache is not None:
+            return super(rruleset, self).before(dt, inc)
+        return next(self._iter_before(dt, inc), None)
+
+    def _merge(self, genitem, rgens, exgens):
+        """
+        Generator merging the values of the generators ``rgens`` in the order
+        of ``genitem``, without duplicates and without the values of the
+        generators ``exgens``.
+        """
         rlist = []
-        self._rdate.sort()
-        self._genitem(rlist, iter(self._rdate))
-        for gen in [iter(x) for x in self._rrule]:
-            self._genitem(rlist, gen)
+        for gen in rgens:
+            genitem(rlist, gen)
         exlist = []
-        self._exdate.sort()
-        self._genitem(exlist, iter(self._exdate))
-        for gen in [iter(x) for x in self._exrule]:
-            self._genitem(exlist, gen)
+        for gen in exgens:
+            genitem(exlist, gen)
         lastdt = None
-        total = 0
         heapq.heapify(rlist)
         heapq.heapify(exlist)
         while rlist:
             ritem = rlist[0]
-            if not lastdt or lastdt != ritem.dt:
+            if lastdt is None or lastdt != ritem.dt:
                 while exlist and exlist[0] < ritem:
                     exitem = exlist[0]
                     advance_iterator(exitem)
                     if exlist and exlist[0] is exitem:
                         heapq.heapreplace(exlist, exitem)
                 if not exlist or ritem != exlist[0]:
-                    total += 1
                     yield ritem.dt
                 lastdt = ritem.dt
             advance_iterator(ritem)
             if rlist and rlist[0] is ritem:
                 heapq.heapreplace(rlist, ritem)
+
+
+class rrulecursor(object):
+    """
+    Iterator over the recurrences of an :class:`rrule` or an
+    :class:`rruleset`, as returned by their ``cursor()`` method. It keeps
+    track of the last recurrence it returned, and can be pickled and
+    resumed from it later without generating the earlier recurrences
+    again.
+
+    :param rule:
+        The rule or set of rules generating the recurrences.
+
+    :param after:
+        If given, the cursor starts with the first recurrence after this
+        datetime.
+    """
+    def __init__(self, rule, after=None):
+        self.rule = rule
+        self.last = after
+        # Number of recurrences up to the last one, if known
+        self.index = 0 if after is None else None
+        self._gen = None
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._gen is None:
+            self._gen = self.rule._resume(self.last, self.index)
+        dt = advance_iterator(self._gen)
+        self.last = dt
+        if self.index is not None:
+            self.index += 1
+        return dt
+
+    next = __next__
+
+    def __getstate__(self):
+        return {"rule": self.rule, "last": self.last, "index": self.index}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._gen = None
+
+
+class rrulequeue(object):
+    """
+    Priority queue of rules (:class:`rrule` or :class:`rruleset` instances)
+    ordered by their next recurrence. Each rule is iterated with a
+    :class:`rrulecursor` which is only advanced when the rule fires, so
+    finding the rules due at a given time takes a time logarithmic in the
+    number of rules, instead of calling ``after()`` on each of them.
+
+    The recurrences of all the rules must be comparable, i.e. either all
+    naive or all aware. Rules are compared by identity.
+
+    :param rules:
+        The rules initially in the queue.
+
+    :param after:
+        If given, only the recurrences of the rules after this datetime are
+        queued.
+    """
+    def __init__(self, rules=(), after=None):
+        self.rebuild(rules, after)
+
+    def rebuild(self, rules, after=None):
+        """
+        Replaces the rules in the queue, in a time linear in their number.
+
+        :param rules:
+            The new rules in the queue.
+
+        :param after:
+            If given, only the recurrences of the rules after this datetime
+            are queued.
+        """
+        self._heap = []
+        self._entries = {}
+        self._counter = itertools.count()
+        for rule in rules:
+            entry = self._newentry(rule, after)
+            if entry is not None:
+                self._heap.append(entry)
+        heapq.heapify(self._heap)
+
+    def _newentry(self, rule, after):
+        """
+        Returns the heap entry of the next recurrence of ``rule``, or
+        ``None`` if it has none.
+        """
+        self.discard(rule)
+        cursor = rule.cursor(after)
+        dt = next(cursor, None)
+        if dt is None:
+            return None
+        # The counter breaks the ties between the rules, which can't be
+        # compared. Removed entries are left in the heap without a cursor.
+        entry = [dt, next(self._counter), rule, cursor]
+        self._entries[rule] = entry
+        return entry
+
+    def add(self, rule, after=None):
+        """
+        Adds a rule to the queue, or restarts it if it is already queued. A
+        rule without recurrences is not queued.
+
+        :param rule:
+            The rule to add.
+
+        :param after:
+            If given, only the recurrences of the rule after this datetime
+            are queued.
+        """
+        entry = self._newentry(rule, after)
+        if entry is not None:
+            heapq.heappush(self._heap, entry)
+
+    def remove(self, rule):
+        """
+        Removes a rule from the queue. Raises :exc:`KeyError` if it is not
+        queued.
+        """
+        entry = self._entries.pop(rule)
+        entry[3] = None
+
+    def discard(self, rule):
+        """
+        Removes a rule from the queue if it is queued.
+        """
+        if rule in self._entries:
+            self.remove(rule)
+
+    def peek(self):
+        """
+        Returns the next recurrence of the queued rules as a
+        ``(datetime, rule)`` tuple, or ``None`` if the queue is empty.
+        """
+        heap = self._heap
+        while heap and heap[0][3] is None:
+            heapq.heappop(heap)
+        if not heap:
+            return None
+        return heap[0][0], heap[0][2]
+
+    def pop_due(self, now, inc=True):
+        """
+        Returns the recurrences of the queued rules up to a datetime, and
+        queues the following recurrences of these rules. Every recurrence
+        missed since the last call is returned, so a rule can fire several
+        times.
+
+        :param now:
+            The datetime up to which the recurrences are returned.
+
+        :param inc:
+            If `True`, the recurrences at `now` are returned as well.
+
+        :return:
+            A list of ``(datetime, rule)`` tuples, in the order of the
+            recurrences.
+        """
+        heap = self._heap
+        due = []
+        while heap:
+            entry = heap[0]
+            dt, _, rule, cursor = entry
+            if cursor is None:
+                heapq.heappop(heap)
+                continue
+            if dt > now or (not inc and dt == now):
+                break
+
+            due.append((dt, rule))
+            entry[0] = next(cursor, None)
+            if entry[0] is None:
+                del self._entries[rule]
+                heapq.heappop(heap)
+            else:
+                entry[1] = next(self._counter)
+                heapq.heapreplace(heap, entry)
+        return due
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, rule):
+        return rule in self._entries
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        # The counter only has to be above those in the heap.
+        state["_counter"] = max([e[1] for e in self._heap] or [-1]) + 1
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._counter = itertools.count(self._counter)
+
+
+class rruleintervals(object):
+    """
+    Index of the intervals starting at the recurrences of rules
+    (:class:`rrule` or :class:`rruleset` instances), e.g. the meetings
+    booking a resource, with a fixed or per-recurrence duration.
+
+    The intervals are not stored. Since they last at most the longest
+    duration, those overlapping a window start in the window or less than
+    that duration before it. Each query only expands the rules there, and
+    merges their intervals in order of their start.
+
+    The intervals are half-open, i.e. an interval ending at the start of a
+    window doesn't overlap it.
+
+    :param rules:
+        Iterable of ``(rule, duration)`` or ``(rule, duration, maxduration)``
+        tuples, added as with :meth:`add`. For instance, the calendars of
+        several resources are added to find the times when they are all
+        free.
+    """
+    def __init__(self, rules=()):
+        self._rules = []
+        for item in rules:
+            self.add(*item)
+
+    def add(self, rule, duration, maxduration=None):
+        """
+        Adds the intervals starting at the recurrences of a rule.
+
+        :param rule:
+            The rule of the interval starts.
+
+        :param duration:
+            The :class:`datetime.timedelta` duration of the intervals, or a
+            function returning it from the start of an interval.
+
+        :param maxduration:
+            The longest duration returned by ``duration``, if it is a
+            function.
+        """
+        if callable(duration):
+            if maxduration is None:
+                raise ValueError("maxduration is required when duration is "
+                                 "a function")
+        else:
+            maxduration = duration
+
+        if maxduration < datetime.timedelta(0):
+            raise ValueError("Durations must be positive")
+
+        self._rules.append((rule, duration, maxduration))
+
+    def remove(self, rule):
+        """
+        Removes the intervals of a rule. Raises :exc:`ValueError` if it
+        wasn't added.
+        """
+        for i, item in enumerate(self._rules):
+            if item[0] is rule:
+                del self._rules[i]
+                return
+        raise ValueError("rule not in intervals")
+
+    def __len__(self):
+        return len(self._rules)
+
+    def __contains__(self, rule):
+        return any(item[0] is rule for item in self._rules)
+
+    def _iter(self, start, end):
+        """
+        Generator yielding the intervals overlapping ``[start, end)`` as
+        ``(start, end, rule)`` tuples, in order of their start.
+        """
+        gens = [self._intervals(i, rule, duration, start - maxduration, end)
+                for i, (rule, duration, maxduration) in enumerate(self._rules)]
+        for istart, iend, i, rule in heapq.merge(*gens):
+            if iend > start:
+                yield istart, iend, rule
+
+    @staticmethod
+    def _intervals(i, rule, duration, after, before):
+        # The index breaks the ties between the rules, which can't be
+        # compared.
+        for dt in rule.xafter(after, inc=True):
+            if dt >= before:
+                break
+            if callable(duration):
+                yield dt, dt + duration(dt), i, rule
+            else:
+                yield dt, dt + duration, i, rule
+
+    def overlapping(self, start, end):
+        """
+        Returns the intervals overlapping a window.
+
+        :param start:
+            The start of the window.
+
+        :param end:
+            The end of the window.
+
+        :return:
+            A list of ``(start, end, rule)`` tuples, in order of their start.
+        """
+        return list(self._iter(start, end))
+
+    def is_free(self, start, end):
+        """
+        Tells whether no interval overlaps a window.
+
+        :param start:
+            The start of the window.
+
+        :param end:
+            The end of the window.
+        """
+        return next(self._iter(start, end), None) is None
+
+    def busy(self, start, end):
+        """
+        Generator yielding the union of the intervals overlapping a window,
+        i.e. the times during which at least one interval lasts.
+
+        :param start:
+            The start of the window.
+
+        :param end:
+            The end of the window.
+
+        :yields:
+            ``(start, end)`` tuples of the disjoint busy intervals, in order.
+            They aren't clipped to the window.
+        """
+        return _coalesce((istart, iend) for istart, iend, _ in
+                         self._iter(start, end))
+
+    def free(self, start, end, minlength=None):
+        """
+        Generator yielding the times of a window during which no interval
+        lasts.
+
+        :param start:
+            The start of the window.
+
+        :param end:
+            The end of the window.
+
+        :param minlength:
+            If given, the :class:`datetime.timedelta` shortest length of the
+            free times yielded.
+
+        :yields:
+            ``(start, end)`` tuples of the free times within the window, in
+            order.
+        """
+        last = start
+        for bstart, bend in self.busy(start, end):
+            if bstart > last and (minlength is None or
+                                  bstart - last >= minlength):
+                yield last, bstart
+            if bend > last:
+                last = bend
+        if end > last and (minlength is None or end - last >= minlength):
+            yield last, end
+
+
+def _coalesce(intervals):
+    """
+    Generator merging the overlapping or adjacent ``(start, end)`` tuples of
+    ``intervals``, which are sorted by their start.
+    """
+    current = None
+    for istart, iend in intervals:
+        if current is None:
+            current = [istart, iend]
+        elif istart <= current[1]:
+            if iend > current[1]:
+                current[1] = iend
+        else:
+            yield tuple(current)
+            current = [istart, iend]
+    if current is not None:
+        yield tuple(current)
+
+
+def union(*rules):
+    """
+    Returns the union of rules, i.e. the recurrences of any of them.
+
+    :param rules:
+        :class:`rrule` or :class:`rruleset` instances.
+
+    :return:
+        An :class:`rruleset` of the rules.
+    """
+    rrset = rruleset()
+    for rule in rules:
+        rrset.rrule(rule)
+    return rrset
+
+
+def intersection(*rules, **kwargs):
+    """
+    Returns the intersection of rules, i.e. the recurrences common to all of
+    them.
+
+    If the rules are :class:`rrule` instances without COUNT nor BYSETPOS,
+    whose intervals can be combined (their frequencies are the same, or all
+    but one have an interval of 1), the intersection is computed as a new
+    :class:`rrule` combining their BYXXX rules, or as an empty
+    :class:`rruleset` if they have no common recurrence. Otherwise, it
+    generates the recurrences of all the rules from the start of the
+    searched windows, and keeps the common ones.
+
+    In that last case, the rules may have no common recurrence although it
+    can't be proven. The search for the next common recurrence is then
+    given up after ``horizon``, so that it doesn't go on to the year 9999.
+
+    :param rules:
+        :class:`rrule` or :class:`rruleset` instances.
+
+    :param horizon:
+        A :class:`datetime.timedelta`, 100 years by default. A common
+        recurrence is only found if it is less than ``horizon`` after the
+        previous one, or after the first recurrence of the rules from
+        which the search starts (before them when searching backwards).
+        ``None`` searches without bound.
+
+    :return:
+        A :class:`rrule`, :class:`rruleset` or another :class:`rrulebase`
+        instance generating the common recurrences.
+    """
+    horizon = kwargs.pop('horizon', _INTERSECTION_HORIZON)
+    if kwargs:
+        raise TypeError("intersection() got an unexpected keyword argument "
+                        "%r" % next(iter(kwargs)))
+    if not rules:
+        raise ValueError("intersection() needs at least one rule")
+
+    result = rules[0]
+    for rule in rules[1:]:
+        if not isinstance(result, rrule):
+            result = None
+            break
+        result = _intersect(result, rule)
+        if result is None:
+            break
+        elif not isinstance(result, rrule):
+            # No common recurrence
+            return result
+    else:
+        return result
+
+    # The rules can't all be combined, but two of them may still have no
+    # common recurrence.
+    for i, a in enumerate(rules):
+        if not isinstance(a, rrule):
+            continue
+        for b in rules[i + 1:]:
+            if isinstance(_intersect(a, b), rruleset):
+                return rruleset()
+
+    return _rruleintersection(rules, horizon)
+
+
+# Default bound of the search for the next common recurrence of rules
+_INTERSECTION_HORIZON = datetime.timedelta(days=36525)
+
+# Number of seconds of the periods of the frequencies from DAILY
+_FREQ_SECONDS = {DAILY: 86400, HOURLY: 3600, MINUTELY: 60, SECONDLY: 1}
+
+
+def _periodnumber(freq, wkst, dt):
+    """
+    Returns the number of the period of frequency ``freq`` containing the
+    naive datetime ``dt``, counted from a fixed origin.
+    """
+    if freq == YEARLY:
+        return dt.year
+    elif freq == MONTHLY:
+        return dt.year * 12 + dt.month - 1
+    elif freq == WEEKLY:
+        # Ordinal 1 is a Monday
+        return (dt.toordinal() - 1 - wkst) // 7
+    seconds = dt.toordinal() * 86400 + dt.hour * 3600 + dt.minute * 60
+    return (seconds + dt.second) // _FREQ_SECONDS[freq]
+
+
+def _periodstart(freq, wkst, n):
+    """
+    Returns the naive datetime at which the period number ``n`` of
+    frequency ``freq`` starts.
+    """
+    if freq == YEARLY:
+        return datetime.datetime(n, 1, 1)
+    elif freq == MONTHLY:
+        return datetime.datetime(n // 12, n % 12 + 1, 1)
+    elif freq == WEEKLY:
+        return datetime.datetime.fromordinal(n * 7 + 1 + wkst)
+    days, seconds = divmod(n * _FREQ_SECONDS[freq], 86400)
+    return (datetime.datetime.fromordinal(days) +
+            datetime.timedelta(seconds=seconds))
+
+
+def _intersectfilter(a, b):
+    """
+    Returns the intersection of the values of two BYXXX rules, where
+    ``None`` or an empty tuple accepts any value.
+    """
+    if not a:
+        return b
+    if not b:
+        return a
+    return tuple(sorted(set(a) & set(b)))
+
+
+def _intersectsigned(a, b):
+    """
+    Returns the intersection of the values of two BYXXX rules which accept
+    both positive and negative values, or raises :exc:`ValueError` if it
+    can't be expressed as a single rule.
+    """
+    if a and b and ((min(a) > 0) != (min(b) > 0) or
+                    (min(a) > 0) != (max(a) > 0) or
+                    (min(b) > 0) != (max(b) > 0)):
+        # A day may match a positive and a negative value of different
+        # rules, which a single rule can't require together.
+        raise ValueError
+    return _intersectfilter(a, b)
+
+
+def _intersect(a, b):
+    """
+    Returns an rrule or an empty rruleset computing the intersection of the
+    rrule ``a`` and ``b``, or ``None`` if it can't be computed analytically.
+    """
+    if not isinstance(b, rrule):
+        return None
+
+    for rule in (a, b):
+        if rule._count is not None or rule._bysetpos or rule._bynweekday:
+            return None
+
+    if a._tzinfo is not b._tzinfo and a._tzinfo != b._tzinfo:
+        return None
+
+    # The week starts must agree if they define the periods or the weeks
+    # numbers of both rules.
+    wksts = set()
+    for rule in (a, b):
+        if rule._byweekno or (rule._freq == WEEKLY and rule._interval > 1):
+            wksts.add(rule._wkst)
+    if len(wksts) > 1:
+        return None
+    wkst = wksts.pop() if wksts else a._wkst
+
+    # The periods of a rule with an interval of 1 are all used, so only the
+    # other rule constrains them.
+    start = max(a._dtstart, b._dtstart).replace(tzinfo=None)
+    ruled = [rule for rule in (a, b) if rule._interval > 1]
+    if not ruled:
+        freq = max(a._freq, b._freq)
+        interval = 1
+        dtstart = start
+    else:
+        freq = ruled[0]._freq
+        if any(rule._freq != freq for rule in ruled):
+            return None
+
+        # Solve n = phase (mod interval) for the periods of each rule.
+        phase, interval = 0, 1
+        for rule in ruled:
+            p = _periodnumber(freq, wkst, rule._dtstart.replace(tzinfo=None))
+            p %= rule._interval
+            g = gcd(interval, rule._interval)
+            if (p - phase) % g:
+                return rruleset()
+            # Step by the current interval until the new phase is reached.
+            step = interval // g
+            m = rule._interval // g
+            k = ((p - phase) // g * _modinverse(step, m)) % m if m > 1 else 0
+            phase += k * interval
+            interval = interval * m
+            phase %= interval
+
+        n = _periodnumber(freq, wkst, start)
+        if n % interval == phase:
+            dtstart = start
+        else:
+            dtstart = _periodstart(freq, wkst, n + (phase - n) % interval)
+
+    kwargs = {}
+    for name, a_value, b_value in [
+            ('bymonth', a._bymonth, b._bymonth),
+            ('byweekno', a._byweekno, b._byweekno),
+            ('byweekday', a._byweekday, b._byweekday),
+            ('byeaster', a._byeaster, b._byeaster),
+            ('bymonthday', a._bymonthday + a._bynmonthday,
+             b._bymonthday + b._bynmonthday),
+            ('byyearday', a._byyearday, b._byyearday),
+            ('byhour', a._byhour, b._byhour),
+            ('byminute', a._byminute, b._byminute),
+            ('bysecond', a._bysecond, b._bysecond)]:
+        if name in ('bymonthday', 'byyearday', 'byweekno'):
+            try:
+                value = _intersectsigned(a_value, b_value)
+            except ValueError:
+                return None
+        else:
+            value = _intersectfilter(a_value, b_value)
+
+        if not value and (a_value or b_value):
+            # No value is accepted by both rules
+            return rruleset()
+        kwargs[name] = value or None
+
+    untils = [rule._until for rule in (a, b) if rule._until is not None]
+    try:
+        return rrule(freq, dtstart=dtstart.replace(tzinfo=a._tzinfo),
+                     interval=interval, wkst=wkst,
+                     until=min(untils) if untils else None, **kwargs)
+    except ValueError:
+        # The BYHOUR, BYMINUTE or BYSECOND values are never reached with
+        # the interval
+        return rruleset()
+
+
+def _modinverse(a, m):
+    """
+    Returns the inverse of ``a`` modulo ``m``, which are coprime.
+    """
+    x, y, r, s = 1, 0, a % m, m
+    while r:
+        q = s // r
+        s, r = r, s - q * r
+        y, x = x, y - q * x
+    return y % m
+
+
+class _rruleintersection(rrulebase):
+    """
+    Recurrences common to several rules, generated by advancing each rule
+    to the latest recurrence of the others, until no common recurrence is
+    found within ``horizon``.
+    """
+    def __init__(self, rules, horizon):
+        super(_rruleintersection, self).__init__()
+        self._rules = list(rules)
+        self._horizon = horizon
+
+    def __contains__(self, item):
+        return all(item in rule for rule in self._rules)
+
+    def _iter(self):
+        total = 0
+        for dt in self._common([iter(rule) for rule in self._rules]):
+            total += 1
+            yield dt
         self._len = total
 
+    def _seek(self, dt):
+        return self._common([rule._resume(dt, inc=True)
+                             for rule in self._rules])
+
+    def _resume(self, last, index=None, inc=False):
+        if last is None:
+            return self._iter()
+        return self._common([rule._resume(last, inc=inc)
+                             for rule in self._rules])
+
+    def _iter_before(self, dt, inc):
+        return self._common([rule.iter_before(dt, inc)
+                             for rule in self._rules], reverse=True)
+
+    def before(self, dt, inc=False):
+        return next(self._iter_before(dt, inc), None)
+
+    def between(self, after, before, inc=False, count=1):
+        # The rules are only generated up to the end of the window, even if
+        # they have no common recurrence there.
+        if inc:
+            stop = lambda dt: dt > before
+        else:
+            stop = lambda dt: dt >= before
+        return list(self._common([rule._resume(after, inc=inc)
+                                  for rule in self._rules], stop=stop))
 
+    def _common(self, gens, reverse=False, stop=None):
+        """
+        Generator yielding the values common to the sorted generators
+        ``gens``, in descending order if ``reverse`` is ``True``, until
+        ``stop`` is true for a value of any of them, or until a value of
+        one of them is further than the horizon from the last common value
+        (or from the first values).
+        """
+        ahead = min if reverse else max
+        horizon = self._horizon
+        try:
+            values = [advance_iterator(gen) for gen in gens]
+            last = max(values) if reverse else min(values)
+            while True:
+                latest = ahead(values)
+                if stop is not None and stop(latest):
+                    return
+                if horizon is not None and abs(latest - last) > horizon:
+                    return
+                for i, gen in enumerate(gens):
+                    while values[i] != latest and ahead(values[i],
+                                                        latest) == latest:
+                        values[i] = advance_iterator(gen)
+                if all(value == latest for value in values):
+                    yield latest
+                    last = latest
+                    values = [advance_iterator(gen) for gen in gens]
+        except StopIteration:
+            return
 
 
 class _rrulestr(object):
@@ -1734,4 +4520,194 @@ class _rrulestr(object):
 
 rrulestr = _rrulestr()
 
+
+def expand_many(rules, after, before, inc=False, workers=None, chunksize=64):
+    """
+    Expands many rules or sets of rules between two datetimes, possibly in
+    several processes.
+
+    :param rules:
+        An iterable of :class:`rrule` or :class:`rruleset` instances.
+
+    :param after:
+        The datetime after which the recurrences are returned.
+
+    :param before:
+        The datetime before which the recurrences are returned.
+
+    :param inc:
+        If `True`, `after` and `before` are included in the output if they
+        are recurrences, as with :meth:`rrulebase.between`.
+
+    :param workers:
+        The number of processes expanding the rules. If it is ``None`` or
+        ``1``, or if processes can't be started, the rules are expanded in
+        the calling process.
+
+    :param chunksize:
+        The number of rules sent to a process at once.
+
+    :return:
+        An iterator over the lists of recurrences of each rule, in the order
+        of ``rules``. The lists are yielded as soon as they are expanded.
+    """
+    if not _futures(workers):
+        return (rule.between(after, before, inc) for rule in rules)
+
+    chunks = _chunks((_compact(rule) for rule in rules), chunksize)
+    results = _parallel(_expand_chunk,
+                        ((chunk, after, before, inc) for chunk in chunks),
+                        workers)
+    return itertools.chain.from_iterable(results)
+
+
+def expand_split(rule, after, before, inc=False, workers=None, windows=None):
+    """
+    Expands a rule or set of rules between two datetimes, splitting the
+    range into windows expanded in several processes. Each window is
+    expanded from the period containing its start, so BYSETPOS is applied
+    to whole periods even when they overlap two windows.
+
+    :param rule:
+        An :class:`rrule` or :class:`rruleset` instance.
+
+    :param after:
+        The datetime after which the recurrences are returned.
+
+    :param before:
+        The datetime before which the recurrences are returned.
+
+    :param inc:
+        If `True`, `after` and `before` are included in the output if they
+        are recurrences, as with :meth:`rrulebase.between`.
+
+    :param workers:
+        The number of processes expanding the windows. If it is ``None`` or
+        ``1``, or if processes can't be started, the windows are expanded in
+        the calling process.
+
+    :param windows:
+        The number of windows of equal length the range is split into. It
+        defaults to four per process.
+
+    :return:
+        An iterator over the recurrences, as :meth:`rrulebase.between` would
+        return them.
+    """
+    if not _futures(workers):
+        return iter(rule.between(after, before, inc))
+
+    remaining = None
+    if isinstance(rule, rrule):
+        if rule._count is not None and not rule.is_empty():
+            # Each window is expanded without COUNT, and the recurrences
+            # after the first COUNT ones are dropped from the output.
+            until = after
+            if inc:
+                until -= datetime.timedelta(microseconds=1)
+            skipped = rule.replace(count=None, until=until, cache=False)
+            remaining = max(rule._count - skipped.count(), 0)
+        rule = _compact(rule.replace(count=None, cache=False))
+
+    if windows is None:
+        windows = 4 * workers
+    span = (before - after) // windows
+    bounds = [after + i * span for i in range(windows)] + [before]
+    args = ((rule, start, end, inc or i > 0, inc and i == windows - 1)
+            for i, (start, end) in enumerate(zip(bounds, bounds[1:])))
+
+    results = _parallel(_expand_window, args, workers)
+    results = itertools.chain.from_iterable(results)
+    if remaining is not None:
+        results = itertools.islice(results, remaining)
+    return results
+
+
+def _futures(workers):
+    """
+    Tells whether ``workers`` processes can be run with
+    :mod:`concurrent.futures`, importing it if needed.
+    """
+    global futures
+    if workers is None or workers <= 1:
+        return False
+    if not futures:
+        try:
+            from concurrent import futures
+        except ImportError:
+            return False
+    return True
+
+
+def _parallel(func, args, workers):
+    """
+    Generator yielding ``func(*a)`` for each ``a`` in ``args``, in order,
+    computed in ``workers`` processes.
+    """
+    try:
+        executor = futures.ProcessPoolExecutor(workers)
+    except (ImportError, NotImplementedError, OSError):
+        # No working multiprocessing on this platform
+        for a in args:
+            yield func(*a)
+        return
+
+    with executor:
+        # Only a few calls are pending at a time, so that the arguments and
+        # results of a long input aren't all kept in memory.
+        pending = []
+        for a in args:
+            pending.append(executor.submit(func, *a))
+            if len(pending) > 2 * workers:
+                yield pending.pop(0).result()
+
+        for future in pending:
+            yield future.result()
+
+
+def _chunks(iterable, size):
+    it = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(it, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _compact(rule):
+    """
+    Returns the RFC string of ``rule`` if :func:`rrulestr` parses it back to
+    the same rule, which is shorter to send to another process, and ``rule``
+    otherwise.
+    """
+    if type(rule) is not rrule:
+        return rule
+
+    # The string has no time zone nor microseconds.
+    for dt in (rule._dtstart, rule._until):
+        if dt is not None and (dt.tzinfo is not None or dt.microsecond):
+            return rule
+
+    return str(rule)
+
+
+def _expand_chunk(rules, after, before, inc):
+    results = []
+    for rule in rules:
+        if not isinstance(rule, rrulebase):
+            rule = rrulestr(rule)
+        results.append(rule.between(after, before, inc))
+    return results
+
+
+def _expand_window(rule, start, end, startinc, endinc):
+    if not isinstance(rule, rrulebase):
+        rule = rrulestr(rule)
+    result = rule.between(start, end, inc=True)
+    if result and not startinc and result[0] == start:
+        del result[0]
+    if result and not endinc and result[-1] == end:
+        del result[-1]
+    return result
+
 # vim:ts=4:sw=4:et
@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+"""
+The rrulerunner module calls functions at the recurrences of rules from the
+:mod:`dateutil.rrule` module in an :mod:`asyncio` event loop.
+"""
+import datetime
+
+try:
+    import asyncio
+except ImportError:
+    asyncio = None
+
+from .rrule import rrulequeue
+
+__all__ = ["rrulerunner"]
+
+
+class rrulerunner(object):
+    """
+    Calls functions at the recurrences of rules
+    (:class:`~dateutil.rrule.rrule` or :class:`~dateutil.rrule.rruleset`
+    instances) in an :mod:`asyncio` event loop. The rules are kept in an
+    :class:`~dateutil.rrule.rrulequeue`, and a single timer of the loop is
+    set for the next recurrence of all of them.
+
+    The timer is set for at most ``maxdelay`` seconds, after which the time
+    is checked again, so that the functions are called at the right time
+    even if the system clock is changed. The recurrences missed when the
+    clock is moved forward are coalesced unless ``coalesce`` is ``False``.
+
+    :param tzinfo:
+        The time zone of the current time compared with the recurrences. It
+        must be ``None`` (the default) for naive recurrences, which are
+        compared with the local time.
+
+    :param loop:
+        The event loop running the functions. It defaults to the running
+        event loop when the first rule is scheduled, which must then be
+        scheduled from the loop.
+
+    :param coalesce:
+        If `True` (the default), a function is only called once, for the
+        last recurrence, when several recurrences of its rule are due at
+        once. Otherwise, it is called for each of them.
+
+    :param maxdelay:
+        The longest time in seconds the timer is set for.
+    """
+    def __init__(self, tzinfo=None, loop=None, coalesce=True, maxdelay=60):
+        if asyncio is None:
+            raise ImportError("rrulerunner needs asyncio")
+
+        self._tzinfo = tzinfo
+        self._loop = loop
+        self._coalesce = coalesce
+        self._maxdelay = maxdelay
+        self._queue = rrulequeue()
+        self._callbacks = {}
+        self._handle = None
+
+    def schedule(self, rule, func, after=None):
+        """
+        Calls a function at each recurrence of a rule. If the rule is
+        already scheduled, its function is replaced.
+
+        :param rule:
+            The rule scheduling the function.
+
+        :param func:
+            The function to call, with the recurrence as its argument. If it
+            returns a coroutine, the coroutine is run as a task of the loop.
+
+        :param after:
+            The datetime after which the recurrences are scheduled. It
+            defaults to the current time.
+        """
+        if self._loop is None:
+            # get_event_loop() is deprecated when no loop is running
+            self._loop = getattr(asyncio, 'get_running_loop',
+                                 asyncio.get_event_loop)()
+
+        if after is None:
+            after = self._now()
+        self._callbacks[rule] = func
+        self._queue.add(rule, after)
+        self._settimer()
+
+    def cancel(self, rule):
+        """
+        Stops calling the function of a rule. Raises :exc:`KeyError` if the
+        rule is not scheduled.
+        """
+        del self._callbacks[rule]
+        self._queue.discard(rule)
+        self._settimer()
+
+    def close(self):
+        """
+        Cancels all the rules and the timer.
+        """
+        self._callbacks.clear()
+        self._queue.rebuild(())
+        self._settimer()
+
+    def __len__(self):
+        return len(self._queue)
+
+    def __contains__(self, rule):
+        return rule in self._queue
+
+    def _now(self):
+        return datetime.datetime.now(self._tzinfo)
+
+    def _settimer(self):
+        """
+        Replaces the timer with one for the next recurrence.
+        """
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+
+        nxt = self._queue.peek()
+        if nxt is None:
+            return
+
+        delay = (nxt[0] - self._now()).total_seconds()
+        delay = min(max(delay, 0), self._maxdelay)
+        self._handle = self._loop.call_later(delay, self._fire)
+
+    def _fire(self):
+        self._handle = None
+        due = self._queue.pop_due(self._now())
+        if self._coalesce:
+            # The last recurrence of each rule, in order
+            last = {}
+            for dt, rule in due:
+                last[rule] = dt
+            due = [(dt, rule) for dt, rule in due if last[rule] == dt]
+
+        for dt, rule in due:
+            if rule not in self._callbacks:
+                # Cancelled by the function of another rule
+                continue
+            try:
+                result = self._callbacks[rule](dt)
+                if asyncio.iscoroutine(result):
+                    self._loop.create_task(result)
+            except Exception as e:
+                self._loop.call_exception_handler({
+                    'message': 'Exception in rrulerunner function',
+                    'exception': e,
+                })
+
+        for dt, rule in due:
+            if rule not in self._queue:
+                # No recurrence left, unless it was scheduled again
+                self._callbacks.pop(rule, None)
+
+        self._settimer()
@@ -0,0 +1,256 @@
+# -*- coding: utf-8 -*-
+"""
+The rrulestore module keeps the recurrences of the rules of the
+:mod:`dateutil.rrule` module in an SQLite database.
+"""
+import datetime
+import itertools
+
+try:
+    import sqlite3
+except ImportError:
+    sqlite3 = None
+
+from . import tz
+from .rrule import rrule, rruleset, _timestamp, _EPOCH_ORDINAL
+
+__all__ = ["rrulestore"]
+
+# The local time zones, whose repr is the same on machines in other zones
+_TZLOCAL_CLASSES = (tz.tzlocal,)
+if tz.tzwinlocal is not None:
+    _TZLOCAL_CLASSES += (tz.tzwinlocal,)
+
+
+class rrulestore(object):
+    """
+    Store of the recurrences of rules (:class:`~dateutil.rrule.rrule` or
+    :class:`~dateutil.rrule.rruleset` instances) in an SQLite database,
+    indexed by their time and by the identifier of their rule, so that the
+    same recurrences aren't generated again by later queries or processes.
+
+    The recurrences of each rule are stored from its start up to a horizon,
+    which queries extend as needed by generating only the recurrences after
+    the previous horizon. They are stored again from the start when a rule
+    with the same identifier but another definition (its RFC string, for
+    an :class:`~dateutil.rrule.rrule`) is added.
+
+    The recurrences are stored as the microseconds since the epoch of their
+    wall time if they are naive, or of their UTC time if they are aware, as
+    in :meth:`~dateutil.rrule.rrulebase.iter_timestamps`. The rules queried
+    together must all be naive or all be aware.
+
+    The rules and dates in the local time zone (:class:`~dateutil.tz.tzlocal`)
+    can't be stored, as the database may be shared with machines in other
+    time zones.
+
+    :param database:
+        The path of the database file, ``":memory:"`` (the default) for a
+        database which isn't saved, or an :class:`sqlite3.Connection`.
+    """
+    def __init__(self, database=':memory:'):
+        if sqlite3 is None:
+            raise ImportError("rrulestore needs sqlite3")
+
+        if isinstance(database, sqlite3.Connection):
+            self._db = database
+        else:
+            self._db = sqlite3.connect(database)
+        self._rules = {}
+        with self._db:
+            self._db.execute("CREATE TABLE IF NOT EXISTS rrule_rules ("
+                             "id TEXT PRIMARY KEY, key TEXT NOT NULL, "
+                             "horizon INTEGER)")
+            self._db.execute("CREATE TABLE IF NOT EXISTS rrule_occurrences ("
+                             "rule TEXT NOT NULL, time INTEGER NOT NULL, "
+                             "PRIMARY KEY (rule, time))")
+            self._db.execute("CREATE INDEX IF NOT EXISTS "
+                             "rrule_occurrences_time "
+                             "ON rrule_occurrences (time)")
+
+    def add(self, ruleid, rule):
+        """
+        Adds a rule to the store, or replaces the rule with the same
+        identifier. The recurrences stored for that identifier by a previous
+        store are kept if the rule is the same.
+
+        :param ruleid:
+            The string identifying the rule in the store.
+
+        :param rule:
+            The rule.
+        """
+        key = _rulekey(rule)
+        with self._db:
+            row = self._db.execute("SELECT key FROM rrule_rules WHERE id = ?",
+                                   (ruleid,)).fetchone()
+            if row is None or row[0] != key:
+                self._db.execute("DELETE FROM rrule_occurrences "
+                                 "WHERE rule = ?", (ruleid,))
+                self._db.execute("INSERT OR REPLACE INTO rrule_rules "
+                                 "(id, key, horizon) VALUES (?, ?, NULL)",
+                                 (ruleid, key))
+        self._rules[ruleid] = rule
+
+    def remove(self, ruleid):
+        """
+        Removes a rule and its recurrences from the store.
+        """
+        del self._rules[ruleid]
+        with self._db:
+            self._db.execute("DELETE FROM rrule_occurrences WHERE rule = ?",
+                             (ruleid,))
+            self._db.execute("DELETE FROM rrule_rules WHERE id = ?",
+                             (ruleid,))
+
+    def __len__(self):
+        return len(self._rules)
+
+    def __contains__(self, ruleid):
+        return ruleid in self._rules
+
+    def refresh(self, horizon, ruleids=None):
+        """
+        Stores the recurrences of rules up to a horizon.
+
+        :param horizon:
+            The datetime up to which the recurrences are stored, included.
+
+        :param ruleids:
+            The identifiers of the rules. All of them by default.
+        """
+        if ruleids is None:
+            ruleids = list(self._rules)
+        end = _timestamp(horizon)
+        with self._db:
+            for ruleid in ruleids:
+                rule = self._rules[ruleid]
+                start, = self._db.execute("SELECT horizon FROM rrule_rules "
+                                          "WHERE id = ?", (ruleid,)).fetchone()
+                if start is not None and start >= end:
+                    continue
+
+                if start is None:
+                    values = itertools.takewhile(lambda x: x <= end,
+                                                 rule.iter_timestamps())
+                else:
+                    after = self._datetime(start, horizon.tzinfo)
+                    values = (x for x in rule.between_timestamps(
+                        after, horizon, inc=True) if x > start)
+
+                self._db.executemany("INSERT OR IGNORE INTO rrule_occurrences "
+                                     "(rule, time) VALUES (?, ?)",
+                                     ((ruleid, x) for x in values))
+                self._db.execute("UPDATE rrule_rules SET horizon = ? "
+                                 "WHERE id = ?", (end, ruleid))
+
+    def between(self, ruleid, after, before, inc=False):
+        """
+        Returns the recurrences of a rule between two datetimes, as
+        :meth:`~dateutil.rrule.rrulebase.between` does, storing them first if
+        needed.
+        """
+        self.refresh(before, [ruleid])
+        first, last = _timestamp(after), _timestamp(before)
+        if inc:
+            query = "time >= ? AND time <= ?"
+        else:
+            query = "time > ? AND time < ?"
+        rows = self._db.execute("SELECT time FROM rrule_occurrences "
+                                "WHERE rule = ? AND " + query +
+                                " ORDER BY time", (ruleid, first, last))
+        return [self._datetime(row[0], after.tzinfo) for row in rows]
+
+    def occurrences(self, after, before, inc=False):
+        """
+        Returns the recurrences of all the rules between two datetimes,
+        storing them first if needed.
+
+        :param after:
+            The datetime after which the recurrences are returned.
+
+        :param before:
+            The datetime before which the recurrences are returned.
+
+        :param inc:
+            If `True`, `after` and `before` are included in the output if they
+            are recurrences, as with
+            :meth:`~dateutil.rrule.rrulebase.between`.
+
+        :return:
+            A list of ``(datetime, ruleid)`` tuples, in order. Aware
+            datetimes are in the time zone of ``after``.
+        """
+        self.refresh(before)
+        first, last = _timestamp(after), _timestamp(before)
+        if inc:
+            query = "time >= ? AND time <= ?"
+        else:
+            query = "time > ? AND time < ?"
+        rows = self._db.execute("SELECT time, rule FROM rrule_occurrences "
+                                "WHERE " + query + " ORDER BY time, rule",
+                                (first, last))
+        # Rules stored by other stores may have changed since.
+        return [(self._datetime(time, after.tzinfo), ruleid)
+                for time, ruleid in rows if ruleid in self._rules]
+
+    def close(self):
+        """
+        Closes the database.
+        """
+        self._db.close()
+
+    @staticmethod
+    def _datetime(value, tzinfo):
+        """
+        Returns the datetime of a timestamp stored for naive recurrences if
+        ``tzinfo`` is ``None``, and otherwise for aware ones, in ``tzinfo``.
+        """
+        dt = (datetime.datetime.fromordinal(_EPOCH_ORDINAL) +
+              datetime.timedelta(microseconds=value))
+        if tzinfo is None:
+            return dt
+        return tzinfo.fromutc(dt.replace(tzinfo=tzinfo))
+
+
+def _rulekey(rule):
+    """
+    Returns a string defining the recurrences of ``rule``, which is the same
+    for the rules with the same recurrences.
+    """
+    if isinstance(rule, rrule):
+        key = str(rule)
+        if rule._tzinfo is not None:
+            key += '\nTZ:' + _tzkey(rule._tzinfo)
+        if rule._until is not None and rule._until.tzinfo is not None:
+            # The string of the rule has the UNTIL digits without its zone
+            key += '\nUNTIL:' + _datekey(rule._until)
+        return key
+    elif isinstance(rule, rruleset):
+        lines = (['RRULE:' + _rulekey(rr) for rr in rule._rrule] +
+                 ['EXRULE:' + _rulekey(rr) for rr in rule._exrule] +
+                 sorted('RDATE:' + _datekey(dt) for dt in rule._rdate) +
+                 sorted('EXDATE:' + _datekey(dt) for dt in rule._exdate))
+        return '\n'.join(line.replace('\n', '\n ') for line in lines)
+    raise TypeError("Can't store the recurrences of %r" % rule)
+
+
+def _datekey(dt):
+    """
+    Returns a string defining the datetime ``dt``.
+    """
+    tzinfo = getattr(dt, 'tzinfo', None)
+    if tzinfo is None:
+        return repr(dt)
+    return '%r %s' % (dt.replace(tzinfo=None), _tzkey(tzinfo))
+
+
+def _tzkey(tzinfo):
+    """
+    Returns a string defining the time zone ``tzinfo``, or raises
+    :exc:`ValueError` for the local time zone.
+    """
+    if isinstance(tzinfo, _TZLOCAL_CLASSES):
+        raise ValueError("Can't store the recurrences in the local time "
+                         "zone, which depends on the machine")
+    return repr(tzinfo)
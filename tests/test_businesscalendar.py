@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from datetime import datetime, date, timedelta
+
+from dateutil.businesscalendar import businesscalendar
+from dateutil.rrule import (
+    rrule, YEARLY, WEEKLY, MO, TU, WE, TH, SA
+)
+
+import pytest
+
+
+def test_business_calendar():
+    christmas = rrule(YEARLY, bymonth=12, bymonthday=25,
+                      dtstart=datetime(1990, 1, 1))
+    cal = businesscalendar(holidays=[christmas, date(1997, 12, 26)],
+                           easter=(-2, 1))
+
+    assert cal.is_business_day(date(1997, 12, 24))
+    assert not cal.is_business_day(date(1997, 12, 25))
+    assert not cal.is_business_day(datetime(1997, 12, 27, 9, 0))
+    assert not cal.is_business_day(date(1997, 3, 28))  # Good Friday
+    assert not cal.is_business_day(date(1997, 3, 31))  # Easter Monday
+
+    assert cal.roll_forward(date(1997, 12, 25)) == date(1997, 12, 29)
+    assert cal.roll_backward(date(1997, 12, 25)) == date(1997, 12, 24)
+    assert cal.roll_forward(date(1997, 12, 24)) == date(1997, 12, 24)
+    assert cal.roll_backward(date(1998, 1, 3)) == date(1998, 1, 2)
+
+    assert cal.add_business_days(date(1997, 12, 24), 1) == date(1997, 12, 29)
+    assert cal.add_business_days(date(1997, 12, 27), 1) == date(1997, 12, 29)
+    assert (cal.add_business_days(datetime(1997, 12, 29, 9, 0), -2) ==
+            datetime(1997, 12, 23, 9, 0))
+    assert cal.add_business_days(date(1997, 12, 27), 0) == date(1997, 12, 29)
+
+    assert cal.business_days_between(date(1997, 12, 24),
+                                     date(1997, 12, 30)) == 2
+    assert cal.business_days_between(date(1997, 12, 30),
+                                     date(1997, 12, 24)) == -2
+
+
+def test_business_calendar_years():
+    cal = businesscalendar(weekdays=(MO, TU, WE, TH), holidays=[
+        rrule(YEARLY, bymonth=1, bymonthday=1, dtstart=datetime(1990, 1, 1))])
+    day = date(1997, 9, 2)
+    days = [day + timedelta(days=i) for i in range(2000)]
+    business = [d for d in days
+                if d.weekday() < 4 and (d.month, d.day) != (1, 1)]
+
+    for n in (1, 100, 700, 1000):
+        assert cal.add_business_days(day, n) == business[n]
+        assert cal.add_business_days(business[n], -n) == day
+        assert cal.business_days_between(day, business[n]) == n
+
+
+def test_business_calendar_no_business_day():
+    cal = businesscalendar(weekdays=(SA,), holidays=[
+        rrule(WEEKLY, byweekday=SA, dtstart=datetime(1990, 1, 1))])
+    assert not cal.is_business_day(date(1997, 9, 6))
+    with pytest.raises(ValueError, match="no business day in 1997"):
+        cal.add_business_days(date(1997, 9, 2), 1)
+    with pytest.raises(ValueError, match="no business day in 1997"):
+        cal.roll_backward(date(1997, 9, 2))
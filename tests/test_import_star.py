@@ -14,18 +14,25 @@ new_locals.pop('prev_locals')
 @pytest.mark.import_star
 def test_imported_modules():
     """ Test that `from dateutil import *` adds modules in __all__ locally """
+    import dateutil.businesscalendar
     import dateutil.easter
     import dateutil.parser
     import dateutil.relativedelta
     import dateutil.rrule
+    import dateutil.rrulerunner
+    import dateutil.rrulestore
     import dateutil.tz
     import dateutil.utils
     import dateutil.zoneinfo
 
+    assert (dateutil.businesscalendar ==
+            new_locals.pop("businesscalendar"))
     assert dateutil.easter == new_locals.pop("easter")
     assert dateutil.parser == new_locals.pop("parser")
     assert dateutil.relativedelta == new_locals.pop("relativedelta")
     assert dateutil.rrule == new_locals.pop("rrule")
+    assert dateutil.rrulerunner == new_locals.pop("rrulerunner")
+    assert dateutil.rrulestore == new_locals.pop("rrulestore")
     assert dateutil.tz == new_locals.pop("tz")
     assert dateutil.utils == new_locals.pop("utils")
     assert dateutil.zoneinfo == new_locals.pop("zoneinfo")
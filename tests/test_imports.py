@@ -49,7 +49,8 @@ def clean_import():
 @filter_import_warning
 @pytest.mark.parametrize(
     "module",
-    ["easter", "parser", "relativedelta", "rrule", "tz", "utils", "zoneinfo"],
+    ["businesscalendar", "easter", "parser", "relativedelta", "rrule",
+     "rrulerunner", "rrulestore", "tz", "utils", "zoneinfo"],
 )
 def test_lazy_import(clean_import, module):
     """Test that dateutil.[submodule] works for py version > 3.7"""
@@ -79,6 +80,20 @@ def test_import_version_root():
     assert hasattr(dateutil, '__version__')
 
 
+# Test that dateutil.businesscalendar-related imports work properly
+def test_import_businesscalendar_direct():
+    import dateutil.businesscalendar
+
+
+def test_import_businesscalendar_from():
+    from dateutil import businesscalendar
+
+
+def test_import_businesscalendar_all():
+    from dateutil.businesscalendar import businesscalendar
+    assert businesscalendar is not None
+
+
 # Test that dateutil.easter-related imports work properly
 def test_import_easter_direct():
     import dateutil.easter
@@ -163,6 +178,34 @@ def test_import_rrule_all():
     assert weekday is not None
 
 
+# Test that dateutil.rrulerunner related imports work properly
+def test_import_rrulerunner_direct():
+    import dateutil.rrulerunner
+
+
+def test_import_rrulerunner_from():
+    from dateutil import rrulerunner
+
+
+def test_import_rrulerunner_all():
+    from dateutil.rrulerunner import rrulerunner
+    assert rrulerunner is not None
+
+
+# Test that dateutil.rrulestore related imports work properly
+def test_import_rrulestore_direct():
+    import dateutil.rrulestore
+
+
+def test_import_rrulestore_from():
+    from dateutil import rrulestore
+
+
+def test_import_rrulestore_all():
+    from dateutil.rrulestore import rrulestore
+    assert rrulestore is not None
+
+
 # Test that dateutil.tz related imports work properly
 def test_import_tztest_direct():
     import dateutil.tz
@@ -89,3 +89,113 @@ def test_tzstr_internal_timedeltas():
 
     assert tz1._start_delta != tz2._start_delta
     assert tz1._end_delta != tz2._end_delta
+
+
+@pytest.mark.rrule
+def test_rrule_masks_shared():
+    from datetime import datetime
+    from dateutil.rrule import rrule, YEARLY, MONTHLY, MO, FR
+
+    for kwargs in [dict(freq=YEARLY, byweekno=20, byweekday=MO),
+                   dict(freq=MONTHLY, byweekday=FR(-1)),
+                   dict(freq=YEARLY, byeaster=0)]:
+        rrule.mask_cache_clear()
+        rr1 = rrule(dtstart=datetime(1997, 1, 1, 9, 0), count=3, **kwargs)
+        rr2 = rrule(dtstart=datetime(1997, 1, 1, 18, 0), count=3, **kwargs)
+
+        assert list(rr1._iter()) == [dt.replace(hour=9) for dt in rr2._iter()]
+
+        info = rrule.mask_cache_info()
+        assert info.hits >= info.misses > 0
+        assert info.misses == info.currsize
+
+
+@pytest.mark.rrule
+def test_rrule_mask_cache_size():
+    from datetime import datetime
+    from dateutil.rrule import rrule, WEEKLY
+
+    rr = rrule(WEEKLY, byweekno=(1, -1), count=20,
+               dtstart=datetime(1997, 1, 1))
+    expected = list(rr._iter())
+    maxsize = rrule.mask_cache_info().maxsize
+    try:
+        rrule.set_mask_cache_size(2)
+        assert list(rr._iter()) == expected
+        assert rrule.mask_cache_info().currsize == 2
+    finally:
+        rrule.set_mask_cache_size(maxsize)
+
+    rrule.mask_cache_clear()
+    assert rrule.mask_cache_info() == (0, 0, maxsize, 0)
+
+
+@pytest.mark.rrule
+def test_rrule_daymask():
+    from datetime import datetime
+    from dateutil.rrule import rrule, MONTHLY, FR, _iterinfo
+
+    rr = rrule(MONTHLY, bymonth=(3, 6, 9, 12), byweekday=FR(-1),
+               dtstart=datetime(1997, 1, 1))
+    ii = _iterinfo(rr)
+    ii.rebuild(1997, 1)
+
+    assert ii.days == (86, 177, 268, 359)
+    assert [i for i, bit in enumerate(ii.daymask) if bit] == list(ii.days)
+    assert ii.isfiltered(85) and not ii.isfiltered(86)
+
+    # The mask covers the whole year, so other months don't rebuild it
+    daymask = ii.daymask
+    ii.rebuild(1997, 6)
+    assert ii.daymask is daymask
+
+    # The mask is shared by the rules, so it can't be changed
+    with pytest.raises(TypeError):
+        daymask[0] = 1
+
+
+@pytest.mark.rrule
+def test_rrule_masks_cycle():
+    from datetime import datetime
+    from dateutil.rrule import rrule, YEARLY, MO, _iterinfo
+
+    rr = rrule(YEARLY, bymonth=2, bymonthday=29, byweekday=MO,
+               dtstart=datetime(1997, 1, 1))
+    ii = _iterinfo(rr)
+    ii.rebuild(2016, 1)
+    daymask = ii.daymask
+    ii.rebuild(2017, 1)
+    ii.rebuild(2416, 1)
+    assert ii.daymask is daymask
+
+    # The leap years whose 29th of February is a monday
+    cycle = rr._cycleyears()
+    assert 2016 % 400 in cycle and 2012 % 400 not in cycle
+    assert all(datetime(2000 + offset, 2, 29).weekday() == 0
+               for offset in cycle)
+
+
+@pytest.mark.rrule
+def test_rrule_cache_compact():
+    import bisect
+    from datetime import datetime
+    from dateutil import tz
+    from dateutil.rrule import rrule, HOURLY
+
+    NYC = tz.gettz('America/New_York')
+    rr = rrule(HOURLY, interval=7, count=50, cache=True,
+               dtstart=datetime(2017, 3, 10, 0, 0, 1, 5, tzinfo=NYC))
+    expected = list(rr)
+
+    cache = rr._cache
+    assert cache.values.itemsize == 8
+    assert cache == expected and list(cache) == expected
+    assert cache[3:-4] == expected[3:-4] and cache[-1] == expected[-1]
+
+    # Searches in the time zone of the recurrences compare the stored
+    # values, and other ones the datetimes.
+    for dt in expected + [datetime(2017, 3, 12, 3, tzinfo=NYC),
+                          datetime(2017, 3, 12, 7, tzinfo=tz.UTC)]:
+        assert cache.bisect(dt) == bisect.bisect_left(expected, dt)
+        assert (cache.bisect(dt, right=True) ==
+                bisect.bisect_right(expected, dt))
@@ -1,13 +1,18 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
 
-from datetime import datetime, date
+from datetime import datetime, date, timedelta
+import itertools
+import pickle
+import time
 import unittest
 from six import PY2
 
 from dateutil import tz
 from dateutil.rrule import (
-    rrule, rruleset, rrulestr,
+    rrule, rruleset, rrulestr, rrulequeue, rruleintervals,
+    expand_many, expand_split,
+    intersection, union,
     YEARLY, MONTHLY, WEEKLY, DAILY,
     HOURLY, MINUTELY, SECONDLY,
     MO, TU, WE, TH, FR, SA, SU
@@ -490,6 +495,17 @@ class RRuleTest(unittest.TestCase):
                           datetime(1998, 1, 29, 9, 0),
                           datetime(1998, 3, 3, 9, 0)])
 
+    def testMonthlyByNWeekDayInterval(self):
+        self.assertEqual(list(rrule(MONTHLY,
+                              count=4,
+                              interval=5,
+                              byweekday=FR(-1),
+                              dtstart=datetime(1997, 9, 2, 9, 0))),
+                         [datetime(1997, 9, 26, 9, 0),
+                          datetime(1998, 2, 27, 9, 0),
+                          datetime(1998, 7, 31, 9, 0),
+                          datetime(1998, 12, 25, 9, 0)])
+
     def testMonthlyByMonthAndNWeekDayLarge(self):
         self.assertEqual(list(rrule(MONTHLY,
                               count=3,
@@ -2490,6 +2506,65 @@ class RRuleTest(unittest.TestCase):
                          [datetime(1997, 9, 4, 9, 0),
                           datetime(1997, 9, 2, 9, 0)])
 
+    def testGetItemRegular(self):
+        rr = rrule(DAILY, interval=3, dtstart=datetime(1905, 1, 1, 9, 0))
+        self.assertEqual(rr[10000], datetime(1987, 2, 20, 9, 0))
+
+    def testGetItemRegularWeekly(self):
+        rr = rrule(WEEKLY, byweekday=(MO, WE, FR),
+                   dtstart=datetime(1997, 9, 3, 9, 0))
+        self.assertEqual(rr[0], datetime(1997, 9, 3, 9, 0))
+        self.assertEqual(rr[2], datetime(1997, 9, 8, 9, 0))
+        self.assertEqual(rr[3000], datetime(2016, 11, 2, 9, 0))
+
+    def testGetItemRegularBySetPos(self):
+        rr = rrule(MONTHLY, bymonthday=(1, 15), byhour=(9, 18),
+                   bysetpos=(2, -1), dtstart=datetime(1997, 9, 2, 9, 0))
+        self.assertEqual(rr[:3],
+                         [datetime(1997, 9, 15, 18, 0),
+                          datetime(1997, 10, 1, 18, 0),
+                          datetime(1997, 10, 15, 18, 0)])
+        self.assertEqual(rr[2001], datetime(2081, 2, 1, 18, 0))
+
+    def testGetItemRegularNegUntil(self):
+        rr = rrule(HOURLY, interval=5, dtstart=datetime(1997, 9, 2, 9, 0),
+                   until=datetime(2099, 1, 1))
+        self.assertEqual(rr[-1], datetime(2099, 1, 1, 0, 0))
+        self.assertEqual(rr[-2], datetime(2098, 12, 31, 19, 0))
+
+    def testGetItemRegularNegInfinite(self):
+        rr = rrule(YEARLY, dtstart=datetime(1997, 9, 2, 9, 0))
+        self.assertEqual(rr[-1], datetime(9999, 9, 2, 9, 0))
+
+    def testGetItemRegularSliceNeg(self):
+        rr = rrule(MINUTELY, count=1000, dtstart=datetime(1997, 9, 2, 9, 0))
+        self.assertEqual(rr[-3::-400],
+                         [datetime(1997, 9, 3, 1, 37),
+                          datetime(1997, 9, 2, 18, 57),
+                          datetime(1997, 9, 2, 12, 17)])
+
+    def testGetItemRegularIndexError(self):
+        rr = rrule(SECONDLY, count=3, dtstart=datetime(1997, 9, 2, 9, 0))
+        with self.assertRaises(IndexError):
+            rr[3]
+
+        with self.assertRaises(IndexError):
+            rr[-4]
+
+    def testGetItemSliceStopZero(self):
+        self.assertEqual(rrule(DAILY,
+                               dtstart=datetime(1997, 9, 2, 9, 0))[:0],
+                         [])
+        self.assertEqual(rrule(DAILY, bymonthday=(-2,),
+                               dtstart=datetime(1997, 9, 2, 9, 0))[:0],
+                         [])
+
+    def testGetItemSliceNegStart(self):
+        self.assertEqual(rrule(MONTHLY, count=5, bymonthday=(-2,),
+                               dtstart=datetime(1997, 9, 2, 9, 0))[-2:],
+                         [datetime(1997, 12, 30, 9, 0),
+                          datetime(1998, 1, 30, 9, 0)])
+
     def testCount(self):
         self.assertEqual(rrule(DAILY,
                                count=3,
@@ -2502,6 +2577,167 @@ class RRuleTest(unittest.TestCase):
                                dtstart=datetime(1997, 9, 2, 9, 0)).count(),
                          0)
 
+    def testCountUntilHourly(self):
+        rr = rrule(HOURLY, byhour=range(9, 17),
+                   byweekday=(MO, TU, WE, TH, FR),
+                   dtstart=datetime(2020, 1, 1),
+                   until=datetime(2099, 12, 31))
+        self.assertEqual(rr.count(), 166968)
+
+    def testCountUntilIrregularInterval(self):
+        rr = rrule(HOURLY, interval=7, byweekday=(MO, FR),
+                   dtstart=datetime(2020, 1, 1, 5, 17),
+                   until=datetime(2099, 12, 31))
+        self.assertEqual(rr.count(), 25044)
+
+    def testCountUntilSecondly(self):
+        rr = rrule(SECONDLY, interval=7, byminute=(0, 30),
+                   dtstart=datetime(1997, 9, 2, 9, 0),
+                   until=datetime(1998, 9, 2, 9, 0))
+        self.assertEqual(rr.count(), 150171)
+
+    def testCountUntilNWeekDay(self):
+        rr = rrule(MONTHLY, byweekday=FR(-1),
+                   dtstart=datetime(2020, 1, 1),
+                   until=datetime(2099, 12, 31))
+        self.assertEqual(rr.count(), 960)
+
+    def testCountUntilWeekNo(self):
+        rr = rrule(WEEKLY, interval=3, byweekday=(TU, SU),
+                   byweekno=(1, 2, 3, 20, 52, 53, -1),
+                   dtstart=datetime(2020, 1, 1),
+                   until=datetime(2199, 12, 31))
+        self.assertEqual(rr.count(), 621)
+
+    def testCountUntilBySetPos(self):
+        rr = rrule(WEEKLY, bysetpos=-1, byweekday=(MO, TU),
+                   dtstart=datetime(1997, 9, 2, 9, 0),
+                   until=datetime(2050, 1, 1))
+        self.assertEqual(rr.count(), 2731)
+
+    def testCountUntilAware(self):
+        NYC = tz.gettz('America/New_York')
+        rr = rrule(DAILY, interval=3, bymonthday=(1, 13, -1),
+                   dtstart=datetime(2020, 1, 1, tzinfo=NYC),
+                   until=datetime(2099, 12, 31, tzinfo=tz.UTC))
+        self.assertEqual(rr.count(), 940)
+
+    def testCountCountReached(self):
+        rr = rrule(YEARLY, count=300, byweekday=FR, bymonthday=13,
+                   bysetpos=(1, -1), dtstart=datetime(1900, 1, 1))
+        self.assertEqual(rr.count(), 300)
+
+    def testCountInfinite(self):
+        rr = rrule(DAILY, dtstart=datetime(2000, 1, 1))
+        self.assertEqual(rr.count(), 2921940)
+
+    def testCountCached(self):
+        rr = rrule(HOURLY, interval=7, byweekday=(MO, FR), cache=True,
+                   dtstart=datetime(2020, 1, 1, 5, 17),
+                   until=datetime(2030, 12, 31))
+        self.assertEqual(rr.count(), len(list(rr)))
+
+    def testLen(self):
+        rr = rrule(MONTHLY, byweekday=FR(-1),
+                   dtstart=datetime(2020, 1, 1),
+                   until=datetime(2099, 12, 31))
+        self.assertEqual(len(rr), 960)
+        self.assertEqual(len(list(rr)), 960)
+
+    def testLenZero(self):
+        rr = rrule(DAILY, count=0, dtstart=datetime(1997, 9, 2, 9, 0))
+        self.assertEqual(len(rr), 0)
+        self.assertTrue(rr)
+
+    def testIsEmptyImpossibleDay(self):
+        rr = rrule(YEARLY, bymonth=2, bymonthday=30,
+                   dtstart=datetime(1997, 9, 2, 9, 0))
+        self.assertTrue(rr.is_empty())
+        self.assertEqual(list(rr), [])
+        self.assertEqual(rr.after(datetime(1997, 9, 2, 9, 0)), None)
+
+    def testIsEmptyMonthlyByMonth(self):
+        rr = rrule(MONTHLY, bymonth=4, bymonthday=31,
+                   dtstart=datetime(1997, 9, 2, 9, 0))
+        self.assertTrue(rr.is_empty())
+        self.assertEqual(rr.count(), 0)
+
+    def testIsEmptyWeekNo(self):
+        # Week 53 always starts in late December
+        rr = rrule(YEARLY, byweekno=53, bymonth=6,
+                   dtstart=datetime(1997, 9, 2, 9, 0))
+        self.assertTrue(rr.is_empty())
+
+    def testIsEmptyNWeekDay(self):
+        # A fifth monday in February is always the 29th
+        rr = rrule(YEARLY, bymonth=2, byweekday=MO(5), bymonthday=(1, 2),
+                   dtstart=datetime(1997, 9, 2, 9, 0))
+        self.assertTrue(rr.is_empty())
+
+    def testIsEmptyCount(self):
+        rr = rrule(DAILY, count=0, dtstart=datetime(1997, 9, 2, 9, 0))
+        self.assertTrue(rr.is_empty())
+
+    def testIsEmptyUntil(self):
+        rr = rrule(DAILY, until=datetime(1997, 9, 1, 9, 0),
+                   dtstart=datetime(1997, 9, 2, 9, 0))
+        self.assertTrue(rr.is_empty())
+
+    def testIsEmptyLeapDay(self):
+        rr = rrule(YEARLY, bymonth=2, bymonthday=29, byweekday=MO,
+                   dtstart=datetime(1997, 9, 2, 9, 0))
+        self.assertFalse(rr.is_empty())
+        self.assertEqual(rr[0], datetime(2016, 2, 29, 9, 0))
+
+    def testSparseYearly(self):
+        self.assertEqual(list(rrule(YEARLY,
+                              count=3,
+                              bymonth=2,
+                              bymonthday=29,
+                              byweekday=MO,
+                              dtstart=datetime(1997, 9, 2, 9, 0))),
+                         [datetime(2016, 2, 29, 9, 0),
+                          datetime(2044, 2, 29, 9, 0),
+                          datetime(2072, 2, 29, 9, 0)])
+
+    def testSparseDaily(self):
+        self.assertEqual(list(rrule(DAILY,
+                              count=3,
+                              bymonth=2,
+                              bymonthday=29,
+                              byweekday=MO,
+                              dtstart=datetime(1997, 9, 2, 9, 0))),
+                         [datetime(2016, 2, 29, 9, 0),
+                          datetime(2044, 2, 29, 9, 0),
+                          datetime(2072, 2, 29, 9, 0)])
+
+    def testSparseWeeklyByWeekNo(self):
+        self.assertEqual(list(rrule(WEEKLY,
+                              count=3,
+                              byweekno=53,
+                              byweekday=TH,
+                              dtstart=datetime(1997, 9, 2, 9, 0))),
+                         [datetime(1998, 12, 31, 9, 0),
+                          datetime(2004, 12, 30, 9, 0),
+                          datetime(2009, 12, 31, 9, 0)])
+
+    def testSparseMonthlyInterval(self):
+        self.assertEqual(list(rrule(MONTHLY,
+                              count=3,
+                              interval=5,
+                              bymonth=2,
+                              bymonthday=29,
+                              dtstart=datetime(1997, 9, 2, 9, 0))),
+                         [datetime(2008, 2, 29, 9, 0),
+                          datetime(2028, 2, 29, 9, 0),
+                          datetime(2048, 2, 29, 9, 0)])
+
+    def testSparseCount(self):
+        rr = rrule(YEARLY, bymonth=2, bymonthday=29, byweekday=MO,
+                   until=datetime(9000, 1, 1),
+                   dtstart=datetime(1997, 9, 2, 9, 0))
+        self.assertEqual(rr.count(), sum(1 for _ in rr))
+
     def testContains(self):
         rr = rrule(DAILY, count=3, dtstart=datetime(1997, 9, 2, 9, 0))
         self.assertEqual(datetime(1997, 9, 3, 9, 0) in rr, True)
@@ -2510,6 +2746,64 @@ class RRuleTest(unittest.TestCase):
         rr = rrule(DAILY, count=3, dtstart=datetime(1997, 9, 2, 9, 0))
         self.assertEqual(datetime(1997, 9, 3, 9, 0) not in rr, False)
 
+    def testContainsFar(self):
+        rr = rrule(WEEKLY, interval=2, byweekday=(MO, TH),
+                   dtstart=datetime(1905, 1, 2, 9, 0))
+        self.assertIn(datetime(2024, 5, 16, 9, 0), rr)
+        self.assertNotIn(datetime(2024, 5, 23, 9, 0), rr)
+        self.assertNotIn(datetime(2024, 5, 16, 9, 0, 1), rr)
+        self.assertNotIn(datetime(2024, 5, 15, 9, 0), rr)
+
+    def testContainsByMonthDay(self):
+        rr = rrule(MONTHLY, bymonthday=(1, -1), byhour=(9, 17),
+                   dtstart=datetime(1997, 9, 2, 9, 0))
+        self.assertIn(datetime(2024, 2, 29, 17, 0), rr)
+        self.assertNotIn(datetime(2024, 2, 28, 17, 0), rr)
+        self.assertNotIn(datetime(2024, 2, 29, 12, 0), rr)
+        self.assertNotIn(datetime(1997, 9, 1, 9, 0), rr)
+
+    def testContainsBySetPos(self):
+        rr = rrule(MONTHLY, byweekday=(MO, TU, WE, TH, FR), bysetpos=-1,
+                   dtstart=datetime(1997, 9, 2, 9, 0))
+        self.assertIn(datetime(2024, 5, 31, 9, 0), rr)
+        self.assertNotIn(datetime(2024, 5, 30, 9, 0), rr)
+
+    def testContainsByWeekNoCrossYear(self):
+        rr = rrule(WEEKLY, byweekno=1, byweekday=(MO, FR),
+                   dtstart=datetime(1997, 9, 2, 9, 0))
+        self.assertIn(datetime(2024, 1, 1, 9, 0), rr)
+        self.assertIn(datetime(2024, 12, 30, 9, 0), rr)
+        self.assertNotIn(datetime(2024, 12, 27, 9, 0), rr)
+
+    def testContainsHourly(self):
+        rr = rrule(HOURLY, interval=5, byhour=(2, 7, 22),
+                   dtstart=datetime(1997, 9, 2, 2, 30))
+        self.assertIn(datetime(2024, 5, 18, 2, 30), rr)
+        self.assertNotIn(datetime(2024, 5, 17, 22, 30), rr)
+
+    def testContainsCount(self):
+        rr = rrule(DAILY, count=3, dtstart=datetime(1997, 9, 2, 9, 0))
+        self.assertIn(datetime(1997, 9, 4, 9, 0), rr)
+        self.assertNotIn(datetime(1997, 9, 5, 9, 0), rr)
+
+    def testContainsUntil(self):
+        rr = rrule(DAILY, until=datetime(1997, 9, 4, 9, 0),
+                   dtstart=datetime(1997, 9, 2, 9, 0))
+        self.assertIn(datetime(1997, 9, 4, 9, 0), rr)
+        self.assertNotIn(datetime(1997, 9, 5, 9, 0), rr)
+
+    def testContainsAware(self):
+        NYC = tz.gettz('America/New_York')
+        rr = rrule(DAILY, dtstart=datetime(1997, 9, 2, 9, 0, tzinfo=NYC))
+        self.assertIn(datetime(2024, 7, 1, 13, 0, tzinfo=tz.UTC), rr)
+        self.assertIn(datetime(2024, 12, 1, 14, 0, tzinfo=tz.UTC), rr)
+        self.assertNotIn(datetime(2024, 12, 1, 13, 0, tzinfo=tz.UTC), rr)
+
+    def testContainsNaiveAware(self):
+        rr = rrule(DAILY, dtstart=datetime(1997, 9, 2, 9, 0, tzinfo=tz.UTC))
+        with self.assertRaises(TypeError):
+            datetime(1997, 9, 3, 9, 0) in rr
+
     def testBefore(self):
         self.assertEqual(rrule(DAILY,  # count=5
             dtstart=datetime(1997, 9, 2, 9, 0)).before(datetime(1997, 9, 5, 9, 0)),
@@ -2592,6 +2886,75 @@ class RRuleTest(unittest.TestCase):
                           datetime(1997, 9, 5, 9, 0),
                           datetime(1997, 9, 6, 9, 0)])
 
+    def testAfterSeek(self):
+        rr = rrule(DAILY, interval=3, dtstart=datetime(1905, 1, 1, 9, 0))
+        self.assertEqual(rr.after(datetime(2024, 5, 17, 12, 0)),
+                         datetime(2024, 5, 18, 9, 0))
+
+    def testAfterSeekInc(self):
+        rr = rrule(WEEKLY, interval=2, byweekday=(MO, FR),
+                   dtstart=datetime(1905, 1, 3, 9, 0))
+        self.assertEqual(rr.after(datetime(2024, 5, 17, 9, 0), inc=True),
+                         datetime(2024, 5, 17, 9, 0))
+
+    def testAfterSeekBySetPos(self):
+        rr = rrule(MONTHLY, byweekday=(MO, TU, WE, TH, FR), bysetpos=-1,
+                   dtstart=datetime(1905, 1, 1, 9, 0))
+        self.assertEqual(rr.after(datetime(2024, 5, 30, 9, 0)),
+                         datetime(2024, 5, 31, 9, 0))
+
+    def testAfterSeekHourly(self):
+        rr = rrule(HOURLY, interval=5, byhour=(2, 7, 22),
+                   dtstart=datetime(1997, 9, 2, 2, 30))
+        self.assertEqual(rr.after(datetime(2024, 5, 17, 12, 0)),
+                         datetime(2024, 5, 18, 2, 30))
+
+    def testAfterSeekUntil(self):
+        rr = rrule(YEARLY, dtstart=datetime(1905, 2, 1, 9, 0),
+                   until=datetime(2020, 1, 1))
+        self.assertEqual(rr.after(datetime(2019, 2, 1, 9, 0)), None)
+
+    def testAfterSeekAware(self):
+        rr = rrule(HOURLY, interval=7,
+                   dtstart=datetime(1997, 9, 2, 9, 0, tzinfo=tz.UTC))
+        dt = datetime(2024, 5, 17, 12, 0, tzinfo=tz.tzoffset(None, 3 * 3600))
+        self.assertEqual(rr.after(dt),
+                         datetime(2024, 5, 17, 14, 0, tzinfo=tz.UTC))
+
+    def testBeforeSeek(self):
+        rr = rrule(YEARLY, bymonth=2, bymonthday=29, byweekday=MO,
+                   dtstart=datetime(1905, 1, 1, 9, 0))
+        self.assertEqual(rr.before(datetime(2024, 5, 17)),
+                         datetime(2016, 2, 29, 9, 0))
+
+    def testBeforeSeekInc(self):
+        rr = rrule(MINUTELY, interval=7, dtstart=datetime(1997, 9, 2, 9, 0))
+        self.assertEqual(rr.before(datetime(2024, 5, 17, 12, 1), inc=True),
+                         datetime(2024, 5, 17, 12, 1))
+
+    def testBeforeSeekStart(self):
+        rr = rrule(DAILY, dtstart=datetime(1997, 9, 2, 9, 0))
+        self.assertEqual(rr.before(datetime(1997, 9, 5, 9, 0)),
+                         datetime(1997, 9, 4, 9, 0))
+        self.assertEqual(rr.before(datetime(1997, 9, 2, 9, 0)), None)
+
+    def testXAfterSeek(self):
+        rr = rrule(SECONDLY, interval=20, dtstart=datetime(1997, 9, 2, 9, 0))
+        self.assertEqual(list(rr.xafter(datetime(2024, 5, 17, 12, 0),
+                                        count=3)),
+                         [datetime(2024, 5, 17, 12, 0, 20),
+                          datetime(2024, 5, 17, 12, 0, 40),
+                          datetime(2024, 5, 17, 12, 1, 0)])
+
+    def testBetweenSeek(self):
+        rr = rrule(MONTHLY, bymonthday=-1, dtstart=datetime(1905, 1, 1, 9, 0))
+        self.assertEqual(rr.between(datetime(2024, 1, 31, 9, 0),
+                                    datetime(2024, 4, 30, 9, 0), inc=True),
+                         [datetime(2024, 1, 31, 9, 0),
+                          datetime(2024, 2, 29, 9, 0),
+                          datetime(2024, 3, 31, 9, 0),
+                          datetime(2024, 4, 30, 9, 0)])
+
     def testCachePre(self):
         rr = rrule(DAILY, count=15, cache=True,
                    dtstart=datetime(1997, 9, 2, 9, 0))
@@ -2665,6 +3028,120 @@ class RRuleTest(unittest.TestCase):
         for x in rr: pass
         self.assertEqual(datetime(1997, 9, 3, 9, 0) in rr, True)
 
+    def testCachePostWindow(self):
+        rr = rrule(DAILY, count=15, cache=True,
+                   dtstart=datetime(1997, 9, 2, 9, 0))
+        for x in rr: pass
+        self.assertEqual(rr.after(datetime(1997, 9, 5, 9, 0)),
+                         datetime(1997, 9, 6, 9, 0))
+        self.assertEqual(rr.before(datetime(1997, 9, 5, 9, 0), inc=True),
+                         datetime(1997, 9, 5, 9, 0))
+        self.assertEqual(rr.before(datetime(1997, 9, 2, 9, 0)), None)
+        self.assertEqual(rr.after(datetime(1997, 9, 16, 9, 0)), None)
+        self.assertEqual(rr.between(datetime(1997, 9, 5, 9, 0),
+                                    datetime(1997, 9, 8, 9, 0)),
+                         [datetime(1997, 9, 6, 9, 0),
+                          datetime(1997, 9, 7, 9, 0)])
+        self.assertEqual(list(rr.xafter(datetime(1997, 9, 15, 9, 0),
+                                        inc=True)),
+                         [datetime(1997, 9, 15, 9, 0),
+                          datetime(1997, 9, 16, 9, 0)])
+
+    def testCachePartialWindow(self):
+        rr = rrule(DAILY, count=15, cache=True,
+                   dtstart=datetime(1997, 9, 2, 9, 0))
+        for x in rr:
+            if x.day == 6:
+                break
+        # Windows inside and beyond the cached recurrences
+        self.assertEqual(rr.between(datetime(1997, 9, 3, 9, 0),
+                                    datetime(1997, 9, 5, 9, 0), inc=True),
+                         [datetime(1997, 9, 3, 9, 0),
+                          datetime(1997, 9, 4, 9, 0),
+                          datetime(1997, 9, 5, 9, 0)])
+        self.assertEqual(rr.before(datetime(1997, 9, 14, 9, 0)),
+                         datetime(1997, 9, 13, 9, 0))
+        self.assertEqual(rr.after(datetime(1997, 9, 13, 9, 0)),
+                         datetime(1997, 9, 14, 9, 0))
+        self.assertEqual(list(rr), list(rr._iter()))
+
+    def testCachePartialContains(self):
+        rr = rrule(DAILY, count=15, cache=True,
+                   dtstart=datetime(1997, 9, 2, 9, 0))
+        rr[3]
+        self.assertIn(datetime(1997, 9, 3, 9, 0), rr)
+        self.assertNotIn(datetime(1997, 9, 3, 10, 0), rr)
+        self.assertIn(datetime(1997, 9, 14, 9, 0), rr)
+
+    def testCacheWindow(self):
+        kwargs = dict(byhour=9, dtstart=datetime(1997, 9, 2, 9, 0))
+        rr = rrule(MINUTELY, cache=True, cachesize=100, **kwargs)
+        expected = rrule(MINUTELY, count=1200, **kwargs)
+        self.assertEqual(rr[1000], datetime(1997, 9, 18, 9, 40))
+        self.assertEqual(rr.after(datetime(1997, 9, 20, 12, 0)),
+                         datetime(1997, 9, 21, 9, 0))
+        self.assertEqual(rr.before(datetime(1997, 9, 20, 8, 0)),
+                         datetime(1997, 9, 19, 9, 59))
+        self.assertEqual(rr.between(datetime(1997, 9, 20, 9, 57),
+                                    datetime(1997, 9, 21, 9, 2)),
+                         [datetime(1997, 9, 20, 9, 58),
+                          datetime(1997, 9, 20, 9, 59),
+                          datetime(1997, 9, 21, 9, 0),
+                          datetime(1997, 9, 21, 9, 1)])
+        self.assertEqual([x for x, _ in zip(rr, range(1200))], list(expected))
+
+        # The oldest segments were dropped
+        self.assertLessEqual(rr._window.size, 100)
+        self.assertEqual(rr._cache, None)
+
+    def testCacheWindowCount(self):
+        kwargs = dict(count=500, byhour=(9, 17),
+                      dtstart=datetime(1997, 9, 2, 9, 0))
+        rr = rrule(HOURLY, cache=True, cachesize=20, **kwargs)
+        self.assertEqual(rr[499], datetime(1998, 5, 9, 17, 0))
+        self.assertEqual(rr.after(datetime(1998, 5, 9, 17, 0)), None)
+        self.assertEqual(list(rr), list(rrule(HOURLY, **kwargs)))
+        self.assertEqual(rr.count(), 500)
+
+    def testCacheWindowAware(self):
+        rr = rrule(DAILY, cache=True, cachesize=10,
+                   dtstart=datetime(1997, 9, 2, 9, 0, tzinfo=tz.UTC))
+        self.assertEqual(rr.after(datetime(1998, 1, 1, tzinfo=tz.UTC)),
+                         datetime(1998, 1, 1, 9, 0, tzinfo=tz.UTC))
+        # Other time zones are looked up without the cache
+        self.assertEqual(rr.after(datetime(1998, 1, 1, 8, 0,
+                                           tzinfo=tz.tzoffset(None, -3600))),
+                         datetime(1998, 1, 2, 9, 0, tzinfo=tz.UTC))
+
+    def testCacheWindowReplace(self):
+        rr = rrule(DAILY, cache=True, cachesize=10,
+                   dtstart=datetime(1997, 9, 2, 9, 0))
+        self.assertEqual(rr.replace(interval=2)._window.maxsize, 10)
+        self.assertIsNone(rr.replace(cache=False)._window)
+
+    def testCacheSizeFlag(self):
+        # A truthy cache caches every recurrence, whatever its type
+        rr = rrule(DAILY, count=5, cache=1,
+                   dtstart=datetime(1997, 9, 2, 9, 0))
+        list(rr)
+        self.assertIsNone(rr._window)
+        self.assertTrue(rr._cache_complete)
+        self.assertEqual(len(rr._cache), 5)
+        with self.assertRaises(ValueError):
+            rrule(DAILY, cache=True, cachesize=0)
+
+    def testCacheCompactAware(self):
+        NYC = tz.gettz('America/New_York')
+        rr = rrule(DAILY, count=5, cache=True,
+                   dtstart=datetime(2017, 3, 10, 9, 0, tzinfo=NYC))
+        expected = list(rr.replace(cache=False))
+        self.assertEqual(list(rr), expected)
+        self.assertEqual(list(rr), expected)
+        self.assertTrue(all(dt.tzinfo is NYC for dt in rr))
+        self.assertEqual(rr.after(datetime(2017, 3, 12, 13, 0, tzinfo=tz.UTC),
+                                  inc=True),
+                         datetime(2017, 3, 12, 9, 0, tzinfo=NYC))
+
     def testStr(self):
         self.assertEqual(list(rrulestr(
                               "DTSTART:19970902T090000\n"
@@ -4639,6 +5116,511 @@ def test_generated_aware_dtstart_rrulestr():
     assert list(rrule_r) == list(rrule_without_dtstart)
 
 
+@pytest.mark.rrule
+def test_to_numpy():
+    np = pytest.importorskip('numpy')
+    rr = rrule(HOURLY, interval=5, byhour=range(9, 17),
+               byweekday=(MO, TU, WE, TH, FR),
+               dtstart=datetime(1997, 9, 2, 9, 0),
+               until=datetime(1998, 9, 2, 9, 0))
+    values = rr.to_numpy()
+
+    assert values.dtype == np.dtype('datetime64[us]')
+    assert values.tolist() == list(rr)
+
+
+@pytest.mark.rrule
+@pytest.mark.parametrize('inc', [True, False])
+def test_to_numpy_between(inc):
+    pytest.importorskip('numpy')
+    rr = rrule(WEEKLY, byweekday=(TU, SU), byweekno=(1, 20, -1),
+               dtstart=datetime(1997, 9, 2, 9, 0))
+    after = datetime(1998, 12, 27, 9, 0)
+    before = datetime(2002, 5, 14, 9, 0)
+
+    values = rr.to_numpy(after, before, inc=inc)
+    assert values.tolist() == rr.between(after, before, inc=inc)
+
+
+@pytest.mark.rrule
+def test_to_numpy_count():
+    pytest.importorskip('numpy')
+    rr = rrule(MONTHLY, count=20, byweekday=FR(-1),
+               dtstart=datetime(1997, 9, 2, 9, 0))
+    values = rr.to_numpy(after=datetime(1998, 1, 1))
+
+    assert values.tolist() == list(rr)[4:]
+
+
+@pytest.mark.rrule
+def test_to_numpy_bysetpos():
+    pytest.importorskip('numpy')
+    rr = rrule(MONTHLY, count=5, bysetpos=-1,
+               byweekday=(MO, TU, WE, TH, FR),
+               dtstart=datetime(1997, 9, 2, 9, 0))
+
+    assert rr.to_numpy().tolist() == list(rr)
+
+
+@pytest.mark.rrule
+def test_to_numpy_aware():
+    np = pytest.importorskip('numpy')
+    NYC = tz.gettz('America/New_York')
+    rr = rrule(DAILY, byhour=(1, 2, 3), count=9,
+               dtstart=datetime(2018, 3, 10, 1, 0, tzinfo=NYC))
+    values, offsets = rr.to_numpy()
+
+    assert values.tolist() == [dt.astimezone(tz.UTC).replace(tzinfo=None)
+                               for dt in rr]
+    assert offsets.dtype == np.dtype('timedelta64[s]')
+    assert offsets.tolist() == [dt.utcoffset() for dt in rr]
+
+
+@pytest.mark.rrule
+def test_to_numpy_naive_aware():
+    pytest.importorskip('numpy')
+    rr = rrule(DAILY, count=3, dtstart=datetime(2018, 3, 10, tzinfo=tz.UTC))
+
+    with pytest.raises(TypeError):
+        rr.to_numpy(after=datetime(2018, 3, 10))
+
+
+def _timestamp(dt):
+    # Microseconds since the epoch, of the UTC time if aware
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(tz.UTC).replace(tzinfo=None)
+    delta = dt - datetime(1970, 1, 1)
+    return ((delta.days * 86400 + delta.seconds) * 1000000 +
+            delta.microseconds)
+
+
+@pytest.mark.rrule
+def test_iter_timestamps():
+    rr = rrule(HOURLY, interval=5, byhour=range(9, 17),
+               byweekday=(MO, TU, WE, TH, FR),
+               dtstart=datetime(1997, 9, 2, 9, 0),
+               until=datetime(1998, 9, 2, 9, 0))
+
+    assert list(rr.iter_timestamps()) == [_timestamp(dt) for dt in rr]
+
+
+@pytest.mark.rrule
+def test_iter_timestamps_aware():
+    NYC = tz.gettz('America/New_York')
+    rr = rrule(MINUTELY, interval=20, byhour=(1, 2, 3),
+               dtstart=datetime(2018, 3, 10, 1, 0, tzinfo=NYC),
+               until=datetime(2018, 3, 12, 6, 40, tzinfo=tz.UTC))
+    values = list(rr.iter_timestamps())
+
+    assert values == [_timestamp(dt) for dt in rr]
+    assert values[-1] == _timestamp(datetime(2018, 3, 12, 6, 40,
+                                             tzinfo=tz.UTC))
+
+
+@pytest.mark.rrule
+@pytest.mark.parametrize('inc', [True, False])
+def test_between_timestamps(inc):
+    rr = rrule(WEEKLY, byweekday=(TU, SU), byweekno=(1, 20, -1),
+               dtstart=datetime(1997, 9, 2, 9, 0))
+    after = datetime(1998, 12, 27, 9, 0)
+    before = datetime(2002, 5, 14, 9, 0)
+
+    values = rr.between_timestamps(after, before, inc=inc)
+    assert values == [_timestamp(dt)
+                      for dt in rr.between(after, before, inc=inc)]
+
+
+@pytest.mark.rrule
+def test_between_timestamps_naive_aware():
+    rr = rrule(DAILY, count=3, dtstart=datetime(2018, 3, 10, tzinfo=tz.UTC))
+
+    with pytest.raises(TypeError):
+        rr.between_timestamps(datetime(2018, 3, 10), datetime(2018, 3, 12))
+
+
+@pytest.mark.rrule
+@pytest.mark.parametrize('inc', [True, False])
+def test_iter_before(inc):
+    rr = rrule(DAILY, byweekday=(MO, FR), dtstart=datetime(1997, 9, 2, 9, 0))
+    dt = datetime(2003, 5, 5, 9, 0)
+    expected = rr.between(datetime(1997, 9, 1), dt, inc=inc)[::-1]
+
+    gen = rr.iter_before(dt, inc=inc)
+    assert [next(gen) for i in range(50)] == expected[:50]
+    assert list(rr.iter_before(dt, inc=inc)) == expected
+
+
+@pytest.mark.rrule
+def test_iter_before_count():
+    rr = rrule(MONTHLY, count=10, byweekday=FR(-1),
+               dtstart=datetime(1997, 9, 2, 9, 0))
+
+    assert list(rr.iter_before(datetime(2010, 1, 1))) == list(rr)[::-1]
+    assert list(rr.iter_before(datetime(1998, 1, 30, 9, 0))) == \
+        list(rr)[3::-1]
+
+
+@pytest.mark.rrule
+def test_iter_before_aware():
+    NYC = tz.gettz('America/New_York')
+    rr = rrule(HOURLY, interval=7, until=datetime(2018, 11, 20, tzinfo=NYC),
+               dtstart=datetime(2018, 10, 1, 1, 0, tzinfo=NYC))
+    dt = datetime(2018, 11, 4, 6, 30, tzinfo=tz.UTC)
+
+    assert list(rr.iter_before(dt)) == rr.between(rr[0], dt, inc=True)[::-1]
+
+
+@pytest.mark.rrule
+def test_cursor():
+    rr = rrule(DAILY, byweekday=(MO, FR), dtstart=datetime(1997, 9, 2, 9, 0))
+    cursor = rr.cursor()
+    first = [next(cursor) for i in range(10)]
+
+    cursor = pickle.loads(pickle.dumps(cursor, pickle.HIGHEST_PROTOCOL))
+    rest = [next(cursor) for i in range(10)]
+    assert first + rest == rr[:20]
+
+
+@pytest.mark.rrule
+def test_cursor_count():
+    rr = rrule(MONTHLY, count=10, byweekday=FR(-1),
+               dtstart=datetime(1997, 9, 2, 9, 0))
+    cursor = rr.cursor(after=datetime(1998, 1, 1))
+    first = [next(cursor) for i in range(3)]
+
+    cursor = pickle.loads(pickle.dumps(cursor, pickle.HIGHEST_PROTOCOL))
+    assert first + list(cursor) == list(rr)[4:]
+    assert list(cursor) == []
+
+
+@pytest.mark.rrule
+def test_pickle_cached():
+    rr = rrule(DAILY, count=5, dtstart=datetime(1997, 9, 2, 9, 0), cache=True)
+    list(rr)
+
+    for rule in [rr, rr.replace(cachesize=3)]:
+        copy = pickle.loads(pickle.dumps(rule, pickle.HIGHEST_PROTOCOL))
+        assert list(copy) == list(rr)
+
+
+@pytest.mark.rrule
+@pytest.mark.parametrize('workers', [None, 2])
+def test_expand_many(workers):
+    rules = [rrule(DAILY, interval=i, dtstart=datetime(1997, 9, 2, 9, 0))
+             for i in range(1, 20)]
+    rules.append(rrule(WEEKLY, byweekday=(MO, FR), count=500,
+                       dtstart=datetime(1997, 9, 2, 9, 0, 0, 500)))
+    rrset = rruleset()
+    rrset.rrule(rules[0])
+    rrset.exdate(datetime(2000, 1, 3, 9, 0))
+    rules.append(rrset)
+
+    after = datetime(2000, 1, 1)
+    before = datetime(2000, 3, 1)
+    result = expand_many(rules, after, before, workers=workers, chunksize=4)
+    assert list(result) == [rule.between(after, before) for rule in rules]
+
+
+@pytest.mark.rrule
+@pytest.mark.parametrize('workers', [None, 2])
+def test_expand_many_aware(workers):
+    rules = [rrule(MONTHLY, bymonthday=-1, dtstart=datetime(1997, 9, 2, 9, 0,
+                                                            tzinfo=tz.UTC)),
+             rrule(WEEKLY, dtstart=datetime(1997, 9, 2, 9, 0,
+                                            tzinfo=tz.gettz('US/Eastern')))]
+
+    after = datetime(2000, 1, 1, tzinfo=tz.UTC)
+    before = datetime(2000, 6, 1, tzinfo=tz.UTC)
+    result = expand_many(rules, after, before, inc=True, workers=workers)
+    assert list(result) == [rule.between(after, before, inc=True)
+                            for rule in rules]
+
+
+@pytest.mark.rrule
+@pytest.mark.parametrize('inc', [True, False])
+@pytest.mark.parametrize('rule', [
+    rrule(MINUTELY, interval=7, dtstart=datetime(1997, 9, 2, 9, 0)),
+    rrule(MINUTELY, count=10000, byhour=(9, 10),
+          dtstart=datetime(1997, 9, 2, 9, 0)),
+    rrule(MONTHLY, byweekday=(MO, TU, WE, TH, FR), bysetpos=(1, -1),
+          dtstart=datetime(1997, 9, 2, 9, 0)),
+    rrule(DAILY, count=40, bysecond=(0, 30),
+          dtstart=datetime(1997, 9, 2, 9, 0, tzinfo=tz.UTC))])
+def test_expand_split(rule, inc):
+    after = datetime(1997, 9, 20, 9, 0, tzinfo=rule[0].tzinfo)
+    before = datetime(1998, 1, 5, 9, 0, tzinfo=rule[0].tzinfo)
+    expected = rule.between(after, before, inc)
+    assert list(expand_split(rule, after, before, inc)) == expected
+    assert list(expand_split(rule, after, before, inc, workers=2,
+                             windows=11)) == expected
+
+
+@pytest.mark.rrule
+def test_queue():
+    daily = rrule(DAILY, count=3, dtstart=datetime(1997, 9, 2, 9, 0))
+    hourly = rrule(HOURLY, interval=12, dtstart=datetime(1997, 9, 2, 15, 0))
+    rrset = rruleset()
+    rrset.rdate(datetime(1997, 9, 3, 12, 0))
+    queue = rrulequeue([daily, hourly, rrset])
+    assert len(queue) == 3
+    assert queue.peek() == (datetime(1997, 9, 2, 9, 0), daily)
+
+    assert queue.pop_due(datetime(1997, 9, 3, 9, 0), inc=False) == [
+        (datetime(1997, 9, 2, 9, 0), daily),
+        (datetime(1997, 9, 2, 15, 0), hourly),
+        (datetime(1997, 9, 3, 3, 0), hourly)]
+    assert queue.pop_due(datetime(1997, 9, 3, 12, 0)) == [
+        (datetime(1997, 9, 3, 9, 0), daily),
+        (datetime(1997, 9, 3, 12, 0), rrset)]
+    assert rrset not in queue
+
+    queue.remove(hourly)
+    assert queue.pop_due(datetime(1997, 9, 10)) == [
+        (datetime(1997, 9, 4, 9, 0), daily)]
+    assert len(queue) == 0
+    assert queue.peek() is None
+
+
+@pytest.mark.rrule
+def test_queue_add_pickle():
+    rules = [rrule(DAILY, byhour=h, dtstart=datetime(1997, 9, 2))
+             for h in range(24)]
+    queue = rrulequeue()
+    for rule in rules:
+        queue.add(rule, after=datetime(1997, 9, 5, 12, 0))
+    queue.add(rules[0])
+    assert queue.peek() == (datetime(1997, 9, 2, 0, 0), rules[0])
+
+    queue.discard(rules[0])
+    queue.discard(rules[0])
+    queue = pickle.loads(pickle.dumps(queue, pickle.HIGHEST_PROTOCOL))
+    due = queue.pop_due(datetime(1997, 9, 6, 12, 0))
+    assert [dt for dt, rule in due] == list(
+        rrule(HOURLY, byhour=range(1, 24), dtstart=datetime(1997, 9, 5, 13),
+              until=datetime(1997, 9, 6, 12)))
+    assert len(queue) == 23
+
+
+@pytest.mark.rrule
+def test_intervals():
+    daily = rrule(DAILY, byweekday=(MO, TU, WE, TH, FR), byhour=9,
+                  dtstart=datetime(1997, 9, 1))
+    weekly = rruleset()
+    weekly.rrule(rrule(WEEKLY, byweekday=TU, byhour=10,
+                       dtstart=datetime(1997, 9, 1)))
+    weekly.exdate(datetime(1997, 9, 16, 10, 0))
+    long = rrule(MONTHLY, bymonthday=-1, byhour=20,
+                 dtstart=datetime(1997, 9, 1))
+
+    intervals = rruleintervals()
+    intervals.add(daily, timedelta(minutes=30))
+    intervals.add(weekly, lambda dt: timedelta(hours=dt.day % 2 + 1),
+                  maxduration=timedelta(hours=2))
+    intervals.add(long, timedelta(days=2))
+    assert len(intervals) == 3
+
+    assert intervals.overlapping(datetime(1997, 9, 30, 9, 15),
+                                 datetime(1997, 10, 1, 9, 0)) == [
+        (datetime(1997, 9, 30, 9, 0), datetime(1997, 9, 30, 9, 30), daily),
+        (datetime(1997, 9, 30, 10, 0), datetime(1997, 9, 30, 11, 0), weekly),
+        (datetime(1997, 9, 30, 20, 0), datetime(1997, 10, 2, 20, 0), long)]
+    assert intervals.is_free(datetime(1997, 9, 16, 9, 30),
+                             datetime(1997, 9, 16, 12, 0))
+    assert not intervals.is_free(datetime(1997, 9, 23, 9, 30),
+                                 datetime(1997, 9, 23, 10, 1))
+    assert list(intervals.busy(datetime(1997, 9, 2, 9, 15),
+                               datetime(1997, 9, 3, 9, 0))) == [
+        (datetime(1997, 9, 2, 9, 0), datetime(1997, 9, 2, 9, 30)),
+        (datetime(1997, 9, 2, 10, 0), datetime(1997, 9, 2, 11, 0))]
+    assert list(intervals.busy(datetime(1997, 10, 2, 0, 0),
+                               datetime(1997, 10, 3, 0, 0))) == [
+        (datetime(1997, 9, 30, 20, 0), datetime(1997, 10, 2, 20, 0))]
+
+    intervals.remove(long)
+    assert long not in intervals
+    assert intervals.is_free(datetime(1997, 10, 1, 20, 0),
+                             datetime(1997, 10, 2, 9, 0))
+    with pytest.raises(ValueError):
+        intervals.remove(long)
+    with pytest.raises(ValueError):
+        intervals.add(long, lambda dt: timedelta(hours=1))
+
+
+@pytest.mark.rrule
+def test_intervals_free():
+    calendars = []
+    for hour in range(9, 17, 2):
+        rrset = rruleset()
+        rrset.rrule(rrule(DAILY, byweekday=(MO, TU, WE, TH, FR), byhour=hour,
+                          dtstart=datetime(1997, 9, 1)))
+        rrset.exdate(datetime(1997, 9, 3, hour, 0))
+        rrset.rdate(datetime(1997, 9, 3, hour + 1, 0))
+        calendars.append((rrset, timedelta(hours=1)))
+    calendars.append((rrule(DAILY, byhour=12, byminute=30,
+                            dtstart=datetime(1997, 9, 1)),
+                      timedelta(minutes=30)))
+    intervals = rruleintervals(calendars)
+
+    start = datetime(1997, 9, 2, 8, 0)
+    end = datetime(1997, 9, 2, 18, 0)
+    assert list(intervals.busy(start, end)) == [
+        (datetime(1997, 9, 2, 9, 0), datetime(1997, 9, 2, 10, 0)),
+        (datetime(1997, 9, 2, 11, 0), datetime(1997, 9, 2, 12, 0)),
+        (datetime(1997, 9, 2, 12, 30), datetime(1997, 9, 2, 14, 0)),
+        (datetime(1997, 9, 2, 15, 0), datetime(1997, 9, 2, 16, 0))]
+    assert list(intervals.free(start, end)) == [
+        (datetime(1997, 9, 2, 8, 0), datetime(1997, 9, 2, 9, 0)),
+        (datetime(1997, 9, 2, 10, 0), datetime(1997, 9, 2, 11, 0)),
+        (datetime(1997, 9, 2, 12, 0), datetime(1997, 9, 2, 12, 30)),
+        (datetime(1997, 9, 2, 14, 0), datetime(1997, 9, 2, 15, 0)),
+        (datetime(1997, 9, 2, 16, 0), datetime(1997, 9, 2, 18, 0))]
+    assert list(intervals.free(start, end, timedelta(hours=1))) == [
+        (datetime(1997, 9, 2, 8, 0), datetime(1997, 9, 2, 9, 0)),
+        (datetime(1997, 9, 2, 10, 0), datetime(1997, 9, 2, 11, 0)),
+        (datetime(1997, 9, 2, 14, 0), datetime(1997, 9, 2, 15, 0)),
+        (datetime(1997, 9, 2, 16, 0), datetime(1997, 9, 2, 18, 0))]
+
+    # The exdates and rdates move the events of the 3rd by an hour
+    start = datetime(1997, 9, 3, 9, 30)
+    end = datetime(1997, 9, 3, 17, 15)
+    assert list(intervals.free(start, end)) == [
+        (datetime(1997, 9, 3, 9, 30), datetime(1997, 9, 3, 10, 0)),
+        (datetime(1997, 9, 3, 11, 0), datetime(1997, 9, 3, 12, 0)),
+        (datetime(1997, 9, 3, 13, 0), datetime(1997, 9, 3, 14, 0)),
+        (datetime(1997, 9, 3, 15, 0), datetime(1997, 9, 3, 16, 0)),
+        (datetime(1997, 9, 3, 17, 0), datetime(1997, 9, 3, 17, 15))]
+    assert list(intervals.free(start, end, timedelta(minutes=30))) == [
+        (datetime(1997, 9, 3, 9, 30), datetime(1997, 9, 3, 10, 0)),
+        (datetime(1997, 9, 3, 11, 0), datetime(1997, 9, 3, 12, 0)),
+        (datetime(1997, 9, 3, 13, 0), datetime(1997, 9, 3, 14, 0)),
+        (datetime(1997, 9, 3, 15, 0), datetime(1997, 9, 3, 16, 0))]
+
+
+@pytest.mark.rrule
+def test_intersection():
+    payday = rrule(WEEKLY, interval=2, byweekday=FR,
+                   dtstart=datetime(1997, 9, 5, 9, 0))
+    monthend = rrule(MONTHLY, bymonthday=-1,
+                     dtstart=datetime(1997, 9, 1, 9, 0))
+    rr = intersection(payday, monthend)
+    assert isinstance(rr, rrule)
+    assert rr[:3] == [datetime(1997, 10, 31, 9, 0),
+                      datetime(1999, 4, 30, 9, 0),
+                      datetime(2000, 3, 31, 9, 0)]
+
+    rr = intersection(rrule(DAILY, interval=4,
+                            dtstart=datetime(1997, 9, 2, 9, 0)),
+                      rrule(DAILY, interval=6, byhour=(9, 18),
+                            dtstart=datetime(1997, 9, 4, 9, 0),
+                            until=datetime(1997, 10, 5)))
+    assert isinstance(rr, rrule)
+    assert list(rr) == [datetime(1997, 9, 10, 9, 0),
+                        datetime(1997, 9, 22, 9, 0),
+                        datetime(1997, 10, 4, 9, 0)]
+
+
+@pytest.mark.rrule
+@pytest.mark.parametrize('a, b', [([1], [-52]), ([53], [-1]), ([1, 2], [2])])
+def test_intersection_byweekno(a, b):
+    rules = [rrule(DAILY, byweekno=byweekno, byweekday=MO,
+                   dtstart=datetime(2020, 1, 1), until=datetime(2024, 12, 31))
+             for byweekno in (a, b)]
+    expected = sorted(set(rules[0]) & set(rules[1]))
+    assert expected
+    assert list(intersection(*rules)) == expected
+
+
+@pytest.mark.rrule
+def test_intersection_empty():
+    odd = rrule(DAILY, interval=2, dtstart=datetime(1997, 9, 2, 9, 0))
+    even = rrule(DAILY, interval=2, dtstart=datetime(1997, 9, 3, 9, 0))
+    evening = rrule(DAILY, dtstart=datetime(1997, 9, 2, 18, 0))
+    for a, b in [(odd, even), (odd, evening)]:
+        rr = intersection(a, b)
+        assert isinstance(rr, rruleset)
+        assert list(rr) == []
+
+
+@pytest.mark.rrule
+def test_intersection_empty_pair():
+    start = datetime(1997, 9, 2, 9, 0)
+    january = rrule(DAILY, bymonth=1, dtstart=start)
+    february = rrule(DAILY, bymonth=2, dtstart=start)
+    counted = rrule(DAILY, count=1000, dtstart=start)
+    for rules in [(january, february, rrule(DAILY, dtstart=start)),
+                  (counted, january, february)]:
+        rr = intersection(*rules)
+        assert isinstance(rr, rruleset)
+        assert rr.after(start) is None
+
+
+@pytest.mark.rrule
+def test_intersection_merge():
+    weekdays = rruleset()
+    weekdays.rrule(rrule(DAILY, byweekday=(MO, TU, WE, TH, FR),
+                         dtstart=datetime(1997, 9, 1, 9, 0)))
+    weekdays.exdate(datetime(1997, 9, 15, 9, 0))
+    counted = rrule(DAILY, interval=7, count=10,
+                    dtstart=datetime(1997, 9, 1, 9, 0))
+    rr = intersection(weekdays, counted)
+
+    expected = [dt for dt in counted if dt != datetime(1997, 9, 15, 9, 0)]
+    assert list(rr) == expected
+    assert rr.between(datetime(1997, 9, 8, 9, 0),
+                      datetime(1997, 10, 1), inc=True) == expected[1:4]
+    assert rr.after(datetime(1997, 9, 10)) == expected[2]
+    assert rr.before(datetime(1997, 9, 23)) == expected[2]
+    assert datetime(1997, 9, 22, 9, 0) in rr
+    assert datetime(1997, 9, 15, 9, 0) not in rr
+
+    # Rules without common recurrence are only searched inside the window
+    monthly = rrule(MONTHLY, bymonthday=31, byhour=9, byminute=30,
+                    dtstart=datetime(1997, 9, 1))
+    rr = intersection(weekdays, monthly)
+    assert rr.between(datetime(1997, 9, 1), datetime(2097, 9, 1)) == []
+
+
+@pytest.mark.rrule
+def test_intersection_horizon():
+    saturdays = rrule(DAILY, byweekday=SA, dtstart=datetime(1997, 9, 1))
+    mondays = rrule(MONTHLY, byweekday=MO(1), dtstart=datetime(1997, 9, 1))
+    rr = intersection(saturdays, mondays)
+    dt = datetime(2020, 1, 1)
+
+    start = time.time()
+    assert rr.after(dt) is None
+    assert rr.before(dt) is None
+    assert list(rr) == []
+    assert rr.count() == 0
+    assert rr.between(dt, datetime(2500, 1, 1)) == []
+    # Instead of going through the recurrences until the year 9999
+    assert time.time() - start < 5
+
+    # The common recurrences are found within the horizon of each other
+    weekly = rrule(WEEKLY, dtstart=datetime(1997, 9, 1))
+    yearly = rruleset()
+    yearly.rrule(rrule(YEARLY, dtstart=datetime(1997, 9, 1)))
+    for horizon, expected in [(timedelta(days=365 * 7), 2),
+                              (timedelta(days=365 * 5), 1),
+                              (None, 2)]:
+        rr = intersection(weekly, yearly, horizon=horizon)
+        assert len(list(itertools.islice(rr, 2))) == expected
+
+    with pytest.raises(TypeError):
+        intersection(weekly, yearly, until=dt)
+
+
+@pytest.mark.rrule
+def test_union():
+    a = rrule(DAILY, interval=2, count=3, dtstart=datetime(1997, 9, 2, 9, 0))
+    b = rrule(DAILY, interval=3, count=3, dtstart=datetime(1997, 9, 2, 9, 0))
+    assert list(union(a, b)) == [datetime(1997, 9, 2, 9, 0),
+                                 datetime(1997, 9, 4, 9, 0),
+                                 datetime(1997, 9, 5, 9, 0),
+                                 datetime(1997, 9, 6, 9, 0),
+                                 datetime(1997, 9, 8, 9, 0)]
+
+
 @pytest.mark.rruleset
 class RRuleSetTest(unittest.TestCase):
     def testSet(self):
@@ -4736,6 +5718,103 @@ class RRuleSetTest(unittest.TestCase):
                            dtstart=datetime(1997, 9, 2, 9, 0)))
         self.assertEqual(rrset.count(), 3)
 
+    def testSetContains(self):
+        rrset = rruleset()
+        rrset.rrule(rrule(WEEKLY, byweekday=(TU, TH),
+                          dtstart=datetime(1997, 9, 2, 9, 0)))
+        rrset.rdate(datetime(2024, 5, 18, 9, 0))
+        rrset.exrule(rrule(MONTHLY, bymonthday=(1, 2),
+                           dtstart=datetime(1997, 9, 2, 9, 0)))
+        rrset.exdate(datetime(2024, 5, 14, 9, 0))
+        self.assertIn(datetime(2024, 5, 16, 9, 0), rrset)
+        self.assertIn(datetime(2024, 5, 18, 9, 0), rrset)
+        self.assertNotIn(datetime(2024, 5, 14, 9, 0), rrset)
+        self.assertNotIn(datetime(2024, 5, 15, 9, 0), rrset)
+        self.assertNotIn(datetime(2024, 4, 2, 9, 0), rrset)
+
+    def testSetToNumpy(self):
+        pytest.importorskip('numpy')
+        rrset = rruleset()
+        rrset.rrule(rrule(WEEKLY, byweekday=(TU, TH), count=10,
+                          dtstart=datetime(1997, 9, 2, 9, 0)))
+        rrset.rdate(datetime(1997, 9, 3, 9, 0))
+        rrset.rdate(datetime(1997, 9, 4, 9, 0))
+        rrset.exrule(rrule(MONTHLY, bymonthday=(9, 11),
+                           dtstart=datetime(1997, 9, 2, 9, 0)))
+        rrset.exdate(datetime(1997, 9, 25, 9, 0))
+        self.assertEqual(rrset.to_numpy().tolist(), list(rrset))
+        self.assertEqual(rrset.to_numpy(datetime(1997, 9, 4, 9, 0),
+                                        datetime(1997, 9, 30, 9, 0),
+                                        inc=True).tolist(),
+                         rrset.between(datetime(1997, 9, 4, 9, 0),
+                                       datetime(1997, 9, 30, 9, 0),
+                                       inc=True))
+
+    def testSetIterTimestamps(self):
+        rrset = rruleset()
+        rrset.rrule(rrule(WEEKLY, byweekday=(TU, TH), count=10,
+                          dtstart=datetime(1997, 9, 2, 9, 0)))
+        rrset.rdate(datetime(1997, 9, 3, 9, 0))
+        rrset.rdate(datetime(1997, 9, 4, 9, 0))
+        rrset.exrule(rrule(MONTHLY, bymonthday=(9, 11),
+                           dtstart=datetime(1997, 9, 2, 9, 0)))
+        rrset.exdate(datetime(1997, 9, 25, 9, 0))
+        self.assertEqual(list(rrset.iter_timestamps()),
+                         [_timestamp(dt) for dt in rrset])
+        self.assertEqual(rrset.between_timestamps(datetime(1997, 9, 4, 9, 0),
+                                                  datetime(1997, 9, 30, 9, 0),
+                                                  inc=True),
+                         [_timestamp(dt)
+                          for dt in rrset.between(datetime(1997, 9, 4, 9, 0),
+                                                  datetime(1997, 9, 30, 9, 0),
+                                                  inc=True)])
+
+    def testSetBetweenTimestampsSeeks(self):
+        # Iterating from 1900 would never reach 2020
+        rrset = rruleset()
+        rrset.rrule(rrule(SECONDLY, interval=30,
+                          dtstart=datetime(1900, 1, 1)))
+        rrset.exrule(rrule(MINUTELY, byminute=1,
+                           dtstart=datetime(1900, 1, 1)))
+        rrset.rdate(datetime(2020, 1, 1, 0, 0, 45))
+        rrset.exdate(datetime(2020, 1, 1, 0, 0, 30))
+        after = datetime(2020, 1, 1)
+        before = datetime(2020, 1, 1, 0, 2, 30)
+        self.assertEqual(rrset.between_timestamps(after, before, inc=True),
+                         [_timestamp(datetime(2020, 1, 1, 0, m, s))
+                          for m, s in ((0, 0), (0, 45), (1, 30),
+                                       (2, 0), (2, 30))])
+
+    def testSetIterBefore(self):
+        rrset = rruleset()
+        rrset.rrule(rrule(WEEKLY, byweekday=(TU, TH), count=10,
+                          dtstart=datetime(1997, 9, 2, 9, 0)))
+        rrset.rdate(datetime(1997, 9, 3, 9, 0))
+        rrset.rdate(datetime(1997, 9, 4, 9, 0))
+        rrset.exrule(rrule(MONTHLY, bymonthday=(9, 11),
+                           dtstart=datetime(1997, 9, 2, 9, 0)))
+        rrset.exdate(datetime(1997, 9, 25, 9, 0))
+        self.assertEqual(list(rrset.iter_before(datetime(1997, 9, 30, 9, 0),
+                                                inc=True)),
+                         rrset.between(datetime(1997, 9, 1),
+                                       datetime(1997, 9, 30, 9, 0),
+                                       inc=True)[::-1])
+
+    def testSetCursor(self):
+        rrset = rruleset()
+        rrset.rrule(rrule(WEEKLY, byweekday=(TU, TH), count=10,
+                          dtstart=datetime(1997, 9, 2, 9, 0)))
+        rrset.rdate(datetime(1997, 9, 3, 9, 0))
+        rrset.rdate(datetime(1997, 9, 4, 9, 0))
+        rrset.exrule(rrule(MONTHLY, bymonthday=(9, 11),
+                           dtstart=datetime(1997, 9, 2, 9, 0)))
+        rrset.exdate(datetime(1997, 9, 25, 9, 0))
+        cursor = rrset.cursor()
+        first = [next(cursor) for i in range(4)]
+        cursor = pickle.loads(pickle.dumps(cursor,
+                                           pickle.HIGHEST_PROTOCOL))
+        self.assertEqual(first + list(cursor), list(rrset))
+
     def testSetCachePre(self):
         rrset = rruleset()
         rrset.rrule(rrule(YEARLY, count=2, byweekday=TU,
@@ -4771,6 +5850,52 @@ class RRuleSetTest(unittest.TestCase):
                           datetime(1997, 9, 4, 9, 0),
                           datetime(1997, 9, 9, 9, 0)])
 
+    def testSetCachePostWindow(self):
+        rrset = rruleset(cache=True)
+        rrset.rrule(rrule(YEARLY, count=2, byweekday=TU,
+                          dtstart=datetime(1997, 9, 2, 9, 0)))
+        rrset.rrule(rrule(YEARLY, count=1, byweekday=TH,
+                          dtstart=datetime(1997, 9, 2, 9, 0)))
+        for x in rrset: pass
+        self.assertEqual(rrset.between(datetime(1997, 9, 2, 9, 0),
+                                       datetime(1997, 9, 9, 9, 0)),
+                         [datetime(1997, 9, 4, 9, 0)])
+        self.assertIn(datetime(1997, 9, 9, 9, 0), rrset)
+        self.assertNotIn(datetime(1997, 9, 3, 9, 0), rrset)
+
+    def testSetSeek(self):
+        rrset = rruleset()
+        rrset.rrule(rrule(DAILY, byhour=(9, 18),
+                          dtstart=datetime(1997, 9, 2, 9, 0)))
+        rrset.rrule(rrule(WEEKLY, count=1000, byweekday=SA,
+                          dtstart=datetime(1997, 9, 2, 12, 0)))
+        rrset.exrule(rrule(WEEKLY, byweekday=SU, byhour=(9, 18),
+                           dtstart=datetime(1997, 9, 2, 9, 0)))
+        for day in range(0, 10000, 3):
+            rrset.exdate(datetime(1997, 9, 2, 9, 0) + timedelta(days=day))
+        rrset.rdate(datetime(2010, 3, 4, 12, 0))
+
+        after = datetime(2010, 3, 2, 9, 0)
+        before = datetime(2010, 3, 7, 18, 0)
+        expected = [datetime(2010, 3, 2, 9, 0),
+                    datetime(2010, 3, 2, 18, 0),
+                    datetime(2010, 3, 3, 9, 0),
+                    datetime(2010, 3, 3, 18, 0),
+                    datetime(2010, 3, 4, 12, 0),
+                    datetime(2010, 3, 4, 18, 0),
+                    datetime(2010, 3, 5, 9, 0),
+                    datetime(2010, 3, 5, 18, 0),
+                    datetime(2010, 3, 6, 9, 0),
+                    datetime(2010, 3, 6, 12, 0),
+                    datetime(2010, 3, 6, 18, 0)]
+        self.assertEqual(rrset.between(after, before, inc=True), expected)
+        self.assertEqual(list(rrset.xafter(after, count=3)), expected[1:4])
+        self.assertEqual(rrset.after(before), datetime(2010, 3, 8, 9, 0))
+        self.assertEqual(rrset.before(after), datetime(2010, 3, 1, 18, 0))
+        self.assertIn(after, rrset)
+        self.assertNotIn(before, rrset)
+        self.assertNotIn(datetime(2010, 3, 4, 9, 0), rrset)
+
     def testSetRRuleCount(self):
         # Test that the count is updated when an rrule is added
         rrset = rruleset(cache=False)
@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from datetime import datetime, timedelta
+import time
+
+from dateutil import tz
+from dateutil.rrule import rruleset
+from dateutil.rrulerunner import rrulerunner
+
+import pytest
+
+
+@pytest.mark.parametrize('tzinfo', [None, tz.UTC])
+def test_runner(tzinfo):
+    asyncio = pytest.importorskip('asyncio')
+    loop = asyncio.new_event_loop()
+    now = datetime.now(tzinfo)
+    fired = []
+
+    def rdates(*offsets):
+        rrset = rruleset()
+        for offset in offsets:
+            rrset.rdate(now + timedelta(seconds=offset))
+        return rrset
+
+    first = rdates(0.05, 0.15, 10)
+    second = rdates(0.1)
+    late = rdates(0.1, 0.2)
+    runner = rrulerunner(tzinfo, loop=loop)
+    runner.schedule(first, lambda dt: fired.append((dt, 'first')))
+    runner.schedule(second, lambda dt: fired.append((dt, 'second')))
+    runner.schedule(late, lambda dt: fired.append((dt, 'late')),
+                    after=now - timedelta(seconds=1))
+    runner.schedule(rdates(-1, 0.1), lambda dt: 1 / 0)
+    assert len(runner) == 4
+
+    loop.call_later(0.12, runner.cancel, late)
+    loop.run_until_complete(asyncio.sleep(0.3))
+    assert fired == [(now + timedelta(seconds=0.05), 'first'),
+                     (now + timedelta(seconds=0.1), 'second'),
+                     (now + timedelta(seconds=0.1), 'late'),
+                     (now + timedelta(seconds=0.15), 'first')]
+    assert list(runner._callbacks) == [first]
+
+    runner.close()
+    assert len(runner) == 0
+    loop.close()
+
+
+@pytest.mark.parametrize('coalesce', [True, False])
+def test_runner_coalesce(coalesce):
+    asyncio = pytest.importorskip('asyncio')
+    loop = asyncio.new_event_loop()
+    now = datetime.now()
+    fired = []
+
+    rrset = rruleset()
+    rrset.rdate(now + timedelta(seconds=0.05))
+    rrset.rdate(now + timedelta(seconds=0.1))
+    runner = rrulerunner(loop=loop, coalesce=coalesce)
+    runner.schedule(rrset, fired.append)
+
+    # The loop is blocked while both are due
+    loop.call_soon(time.sleep, 0.15)
+    loop.run_until_complete(asyncio.sleep(0.2))
+    if coalesce:
+        assert fired == [now + timedelta(seconds=0.1)]
+    else:
+        assert fired == list(rrset)
+    loop.close()
+
+
+def test_runner_running_loop():
+    asyncio = pytest.importorskip('asyncio')
+    if not hasattr(asyncio, 'get_running_loop'):
+        pytest.skip('Needs asyncio.get_running_loop')
+    loop = asyncio.new_event_loop()
+    now = datetime.now()
+    fired = []
+
+    rrset = rruleset()
+    rrset.rdate(now + timedelta(seconds=0.05))
+    runner = rrulerunner()
+    with pytest.raises(RuntimeError):
+        runner.schedule(rrset, fired.append)
+    assert len(runner) == 0
+
+    loop.call_soon(runner.schedule, rrset, fired.append)
+    loop.run_until_complete(asyncio.sleep(0.1))
+    assert fired == list(rrset)
+    assert runner._loop is loop
+    loop.close()
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from datetime import datetime
+
+import pytest
+
+from dateutil import tz
+from dateutil.rrule import rrule, rruleset, DAILY, WEEKLY, HOURLY
+from dateutil.rrulestore import rrulestore
+
+pytest.importorskip('sqlite3')
+
+
+def test_store(tmp_path):
+    path = str(tmp_path / 'rrule.db')
+    daily = rrule(DAILY, byhour=(9, 18), dtstart=datetime(1997, 9, 2, 9, 0))
+    rrset = rruleset()
+    rrset.rrule(rrule(WEEKLY, count=10, dtstart=datetime(1997, 9, 3, 12, 0)))
+    rrset.exdate(datetime(1997, 9, 10, 12, 0))
+
+    store = rrulestore(path)
+    store.add('daily', daily)
+    store.add('weekly', rrset)
+    after = datetime(1997, 9, 9, 9, 0)
+    before = datetime(1997, 9, 17, 12, 0)
+    for inc in (False, True):
+        assert (store.between('daily', after, before, inc) ==
+                daily.between(after, before, inc))
+    assert store.occurrences(after, before, inc=True) == sorted(
+        [(dt, 'daily') for dt in daily.between(after, before, inc=True)] +
+        [(dt, 'weekly') for dt in rrset.between(after, before, inc=True)])
+    store.close()
+
+    # The stored recurrences are reused, and extended further
+    store = rrulestore(path)
+    store.add('daily', daily)
+    store.add('weekly', rrset)
+    stored = store._db.execute("SELECT COUNT(*) FROM rrule_occurrences")
+    assert stored.fetchone()[0] == 33
+    before = datetime(1997, 10, 17, 12, 0)
+    assert store.occurrences(after, before) == sorted(
+        [(dt, 'daily') for dt in daily.between(after, before)] +
+        [(dt, 'weekly') for dt in rrset.between(after, before)])
+
+    # Changing the rule replaces them
+    store.add('daily', daily.replace(byhour=10))
+    assert (store.between('daily', after, before) ==
+            daily.replace(byhour=10).between(after, before))
+    store.remove('weekly')
+    daily = daily.replace(byhour=10)
+    assert store.occurrences(after, before) == [
+        (dt, 'daily') for dt in daily.between(after, before)]
+    store.close()
+
+
+def test_store_aware():
+    tzinfo = tz.gettz('America/New_York')
+    rr = rrule(HOURLY, interval=5,
+               dtstart=datetime(2017, 11, 1, tzinfo=tzinfo))
+    store = rrulestore()
+    store.add('hourly', rr)
+    after = datetime(2017, 11, 4, tzinfo=tzinfo)
+    before = datetime(2017, 11, 7, tzinfo=tzinfo)
+    result = store.between('hourly', after, before)
+    assert result == rr.between(after, before)
+    assert [dt.utcoffset() for dt in result] == [
+        dt.utcoffset() for dt in rr.between(after, before)]
+
+
+def test_store_until_zone():
+    NYC = tz.gettz('America/New_York')
+    dtstart = datetime(2017, 11, 1, tzinfo=tz.UTC)
+    rules = [rrule(HOURLY, dtstart=dtstart,
+                   until=datetime(2017, 11, 2, tzinfo=tzinfo))
+             for tzinfo in (tz.UTC, NYC)]
+    after = datetime(2017, 11, 1, 12, tzinfo=tz.UTC)
+    before = datetime(2017, 11, 3, tzinfo=tz.UTC)
+    store = rrulestore()
+    for rule in rules:
+        # The second rule only differs by the zone of UNTIL
+        store.add('hourly', rule)
+        assert store.between('hourly', after, before) == rule.between(
+            after, before)
+
+
+def test_store_tzlocal():
+    store = rrulestore()
+    rr = rrule(DAILY, dtstart=datetime(2017, 11, 1, tzinfo=tz.tzlocal()))
+    with pytest.raises(ValueError):
+        store.add('daily', rr)
+
+    rrset = rruleset()
+    rrset.rdate(datetime(2017, 11, 1, tzinfo=tz.tzlocal()))
+    with pytest.raises(ValueError):
+        store.add('dates', rrset)
+    assert len(store) == 0